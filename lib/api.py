@@ -1,10 +1,16 @@
-import urllib
-from typing import Sequence, Union
-from urllib import parse, request
+from typing import Dict, Sequence, Union
+from urllib import parse
 import json
+import urllib.error
+
+from .singleflight import SingleFlight
+from .stats import STAGE_PARSE, endpoint_of
+from .transport import ConnectionPool, Transport
 
 
 class SuggestionResult(object):
+    __slots__ = ('description', 'end', 'start', 'option', 'suffix', 'prefix', 'full_option')
+
     def __init__(self, full_option: str, prefix: Union[str, None], suffix: Union[str, None], option: str, start: int,
                  end: int, description: str):
         self.description = description
@@ -17,11 +23,22 @@ class SuggestionResult(object):
 
 
 class Issue(object):
-    def __init__(self, id: str, summary: str, description: str, url: str):
+    __slots__ = ('url', 'id', 'summary', 'description', 'updated')
+
+    def __init__(self, id: str, summary: str, description: str, url: str, updated: Union[int, None] = None):
         self.url = url
         self.id = id
         self.summary = summary
         self.description = description
+        self.updated = updated
+
+
+class Project(object):
+    __slots__ = ('short_name', 'name')
+
+    def __init__(self, short_name: str, name: str):
+        self.short_name = short_name
+        self.name = name
 
 
 class Api:
@@ -29,23 +46,52 @@ class Api:
     TOKEN_PREFIX: str = 'Bearer '
     YOUTRACK_INTELLISENSE_ISSUE_API: str = '{base_url}/api/search/assist?'
     YOUTRACK_LIST_OF_ISSUES_API: str = '{base_url}/api/issues?'
+    YOUTRACK_ISSUE_API: str = '{base_url}/api/issues/{id}?'
+    YOUTRACK_PROJECTS_API: str = '{base_url}/api/admin/projects?'
+    YOUTRACK_CUSTOM_FIELDS_API: str = '{base_url}/api/admin/customFieldSettings/customFields?'
+    YOUTRACK_USERS_API: str = '{base_url}/api/users?'
+    YOUTRACK_TAGS_API: str = '{base_url}/api/tags?'
+    YOUTRACK_SAVED_QUERIES_API: str = '{base_url}/api/savedQueries?'
+    YOUTRACK_CURRENT_USER_API: str = '{base_url}/api/users/me?fields=id'
     YOUTRACK_ISSUE: str = '{base_url}/issue/{id}'
     YOUTRACK_ISSUES: str = '{base_url}/issues/?'
+    SUGGESTIONS_FIELDS: str = 'suggestions(completionEnd,completionStart,description,option,prefix,suffix)'
+    # descriptions are left out of issue lists, they are fetched for the issues shown with get_descriptions
+    ISSUES_FIELDS: str = 'summary,idReadable,updated'
+    ISSUE_FIELDS: str = 'description,summary,idReadable,updated'
+    DESCRIPTIONS_FIELDS: str = 'idReadable,description'
+    INDEX_FIELDS: str = 'description,summary,idReadable,updated'
+    INDEX_IDS_FIELDS: str = 'idReadable'
+    PROJECTS_FIELDS: str = 'shortName,name'
+    MAX_PROJECTS: int = 5000
+    CUSTOM_FIELDS_FIELDS: str = 'name,fieldType(valueType),instances(bundle(values(name)))'
+    USERS_FIELDS: str = 'login,fullName,banned'
+    TAGS_FIELDS: str = 'name'
+    SAVED_QUERIES_FIELDS: str = 'name,query'
+    PINNED_PROJECTS_FIELDS: str = 'shortName,name,pinned'
+    MAX_SAVED_QUERIES: int = 100
+    MAX_CUSTOM_FIELDS: int = 1000
+    MAX_USERS: int = 5000
+    MAX_TAGS: int = 1000
+    # value types whose values are listed in the bundles of the field
+    BUNDLE_VALUE_TYPES = ('enum', 'state', 'version', 'build', 'ownedField')
+    SUGGESTION_TYPE = SuggestionResult
+    ISSUE_TYPE = Issue
+    PROJECT_TYPE = Project
+    LAZY_DESCRIPTIONS: bool = True
 
-    def __init__(self, api_token: str, youtrack_url: str, dbg, max_results: int):
+    def __init__(self, api_token: str, youtrack_url: str, dbg, max_results: int, transport: Transport = None):
         super().__init__()
         self.dbg = dbg
         self.api_token = api_token
         self.youtrack_url = youtrack_url
         self.max_results = max_results
+        self.transport = transport if transport is not None else ConnectionPool(youtrack_url, dbg=dbg)
+        self.stats = self.transport.stats
+        self.flights = SingleFlight()
 
-    def open_url(self, http_url) -> str:
-        req = request.Request(http_url)
-        req.add_header(self.AUTH_HEADER, self.TOKEN_PREFIX + self.api_token)
-
-        with request.urlopen(req) as resp:
-            content = resp.read()
-            return content
+    def open_url(self, http_url) -> bytes:
+        return self.transport.request('GET', http_url, headers=self.common_headers()).body
 
     def print(self, **kwargs):
         to_print = str.join(",", [key + " = \"" + str(value) + "\"" for key, value in kwargs.items()])
@@ -59,34 +105,79 @@ class Api:
 
     def get_filters_url(self):
         return self.YOUTRACK_INTELLISENSE_ISSUE_API.format(base_url=self.youtrack_url) + parse.urlencode({
-            'fields': 'suggestions(completionEnd,completionStart,description,option,prefix,suffix)'
+            'fields': self.SUGGESTIONS_FIELDS
         })
 
+    def suggestions_cache_key(self, actual_user_input: str):
+        return 'suggestions', actual_user_input, len(actual_user_input), self.SUGGESTIONS_FIELDS, None
+
+    def issues_cache_key(self, actual_user_input: str, skip: int = 0):
+        return 'issues', actual_user_input.strip(), skip, self.ISSUES_FIELDS, self.max_results + 1
+
+    def issue_cache_key(self, id: str):
+        return 'issue', id, None, self.ISSUE_FIELDS, None
+
+    def projects_cache_key(self):
+        return 'projects', None, None, self.PROJECTS_FIELDS, self.MAX_PROJECTS
+
     def get_suggestions(self, actual_user_input: str) -> Sequence[SuggestionResult]:
+        return self.flights.do(('search/assist', actual_user_input), self._get_suggestions, actual_user_input)
+
+    async def get_suggestions_async(self, actual_user_input: str) -> Sequence[SuggestionResult]:
+        return await self.flights.do_async(('search/assist', actual_user_input), self._get_suggestions_async,
+                                           actual_user_input)
+
+    def _get_suggestions(self, actual_user_input: str) -> Sequence[SuggestionResult]:
+        return self.read_response('POST', *self.suggestions_request(actual_user_input),
+                                  parse_content=self.parse_suggestions_response)
+
+    async def _get_suggestions_async(self, actual_user_input: str) -> Sequence[SuggestionResult]:
+        return await self.read_response_async('POST', *self.suggestions_request(actual_user_input),
+                                              parse_content=self.parse_suggestions_response)
+
+    def suggestions_request(self, actual_user_input: str):
         request_url = self.get_filters_url()
         self.print(requesturl=request_url)
         json_data = json.dumps({
             'caret': len(actual_user_input),
             'query': actual_user_input
         })
-        post_data = json_data.encode('utf-8')
-        suggestions_request = urllib.request.Request(request_url, data=post_data)
-        suggestions_request.method = 'POST'
-        self.add_common_headers(suggestions_request)
-        response = self.read_response(suggestions_request)
+        return request_url, json_data.encode('utf-8')
 
-        api_result_suggestions = self.parse_suggestions_response(response)
-        return api_result_suggestions
+    def common_headers(self) -> Dict[str, str]:
+        return {
+            self.AUTH_HEADER: self.TOKEN_PREFIX + self.api_token,
+            'Content-Type': 'application/json'
+        }
 
-    def add_common_headers(self, the_request):
-        the_request.add_header(self.AUTH_HEADER, self.TOKEN_PREFIX + self.api_token)
-        the_request.add_header('Content-Type', 'application/json')
+    def read_response(self, method: str, request_url: str, post_data: bytes = None, parse_content=None,
+                      validate: bool = False):
+        """
+        Returns the JSON of the response, passed to parse_content if given. A response to validate is kept by the
+        transport, once the server answers that it did not modify it since, it is not parsed again.
+        """
+        resp = self.transport.request(method, request_url, body=post_data, headers=self.common_headers(),
+                                      validate=validate)
+        return self.parse_response(request_url, resp, parse_content)
 
-    @staticmethod
-    def read_response(request_to_read):
-        with urllib.request.urlopen(request_to_read) as resp:
-            response = json.loads(resp.read().decode('utf-8'))
-            return response
+    async def read_response_async(self, method: str, request_url: str, post_data: bytes = None, parse_content=None,
+                                  validate: bool = False):
+        resp = await self.transport.request_async(method, request_url, body=post_data, headers=self.common_headers(),
+                                                  validate=validate)
+        return self.parse_response(request_url, resp, parse_content)
+
+    def parse_response(self, request_url: str, resp, parse_content=None):
+        if resp.memo is not None and 'parsed' in resp.memo:
+            return resp.memo['parsed']
+        endpoint = endpoint_of(request_url)
+        with self.stats.timed(endpoint, STAGE_PARSE):
+            parsed = json.loads(resp.body.decode('utf-8'))
+            if parse_content is not None:
+                parsed = parse_content(parsed)
+        self.stats.parsed(endpoint, len(resp.body))
+        if resp.memo is not None:
+            resp.memo['parsed'] = parsed
+        return parsed
 
     @staticmethod
     def parse_suggestions_response(response: dict) -> Sequence[SuggestionResult]:
@@ -119,22 +210,173 @@ class Api:
         for item in response:
             self.print(item=str(item))
             id_readable = item['idReadable']
-            description = item['description']
+            description = item.get('description')
             summary: str = item['summary'] if item['summary'] is not None else "--no summary--"
             issue = Issue(id=id_readable, summary=summary, description=description,
-                          url=self.create_issue_url(id_readable))
+                          url=self.create_issue_url(id_readable), updated=item.get('updated'))
             issues.append(issue)
             self.print(id=id_readable, summary=summary, url=issue.url)
         return issues
 
-    def get_issues_matching_filter(self, actual_user_input: str) -> Sequence[Issue]:
+    def get_issues_matching_filter(self, actual_user_input: str, skip: int = 0) -> Sequence[Issue]:
+        """
+        Returns the page of max_results issues starting after the first skip ones, plus the next issue if there is
+        one to tell whether there are more.
+        """
+        return self.flights.do(('issues', actual_user_input, skip), self._get_issues_matching_filter,
+                               actual_user_input, skip)
+
+    async def get_issues_matching_filter_async(self, actual_user_input: str, skip: int = 0) -> Sequence[Issue]:
+        return await self.flights.do_async(('issues', actual_user_input, skip), self._get_issues_matching_filter_async,
+                                           actual_user_input, skip)
+
+    def _get_issues_matching_filter(self, actual_user_input: str, skip: int) -> Sequence[Issue]:
+        return self.read_response('GET', self.issues_url(actual_user_input, skip),
+                                  parse_content=self.parse_list_of_issues_result, validate=True)
+
+    async def _get_issues_matching_filter_async(self, actual_user_input: str, skip: int) -> Sequence[Issue]:
+        return await self.read_response_async('GET', self.issues_url(actual_user_input, skip),
+                                              parse_content=self.parse_list_of_issues_result, validate=True)
+
+    def issues_url(self, actual_user_input: str, skip: int) -> str:
         request_url: str = self.YOUTRACK_LIST_OF_ISSUES_API.format(base_url=self.youtrack_url)
-        query_part: str = parse.urlencode({'query': actual_user_input, '$top': self.max_results + 1, 'fields': 'description,summary,idReadable'})
+        query_part: str = parse.urlencode({'query': actual_user_input, '$skip': skip, '$top': self.max_results + 1,
+                                           'fields': self.ISSUES_FIELDS})
         request_url = request_url + query_part
-        issues_request = urllib.request.Request(request_url)
-        self.add_common_headers(issues_request)
         self.print(requesturl=request_url)
-        json_response = self.read_response(issues_request)
-        self.dbg("parsing issues result")
-        issues = self.parse_list_of_issues_result(json_response)
-        return issues
+        return request_url
+
+    def find_issue(self, id: str) -> Sequence[Issue]:
+        """
+        Returns the issue with the id, nothing if there is none.
+        """
+        return self.flights.do(('issue', id), self._find_issue, id)
+
+    async def find_issue_async(self, id: str) -> Sequence[Issue]:
+        return await self.flights.do_async(('issue', id), self._find_issue_async, id)
+
+    def _find_issue(self, id: str) -> Sequence[Issue]:
+        try:
+            return self.read_response('GET', self.issue_api_url(id), parse_content=self.parse_issue, validate=True)
+        except urllib.error.HTTPError as exc:
+            if exc.code == 404:
+                return []
+            raise
+
+    async def _find_issue_async(self, id: str) -> Sequence[Issue]:
+        try:
+            return await self.read_response_async('GET', self.issue_api_url(id), parse_content=self.parse_issue,
+                                                  validate=True)
+        except urllib.error.HTTPError as exc:
+            if exc.code == 404:
+                return []
+            raise
+
+    def parse_issue(self, response) -> Sequence[Issue]:
+        return self.parse_list_of_issues_result([response])
+
+    def issue_api_url(self, id: str) -> str:
+        request_url = self.YOUTRACK_ISSUE_API.format(base_url=self.youtrack_url, id=parse.quote(id))
+        request_url = request_url + parse.urlencode({'fields': self.ISSUE_FIELDS})
+        self.print(requesturl=request_url)
+        return request_url
+
+    def get_descriptions(self, ids: Sequence[str], length: int) -> Dict[str, str]:
+        """
+        Returns the first length characters of the descriptions of the issues, all fetched with one request.
+        """
+        request_url: str = self.YOUTRACK_LIST_OF_ISSUES_API.format(base_url=self.youtrack_url)
+        request_url = request_url + parse.urlencode({'query': 'issue id: ' + ', '.join(ids), '$top': len(ids),
+                                                     'fields': self.DESCRIPTIONS_FIELDS})
+        self.print(requesturl=request_url)
+        return {item['idReadable']: (item.get('description') or '')[:length]
+                for item in self.read_response('GET', request_url)}
+
+    def probe(self):
+        """
+        Sends a cheap request, used to find out whether the server is available again.
+        """
+        self.read_response('GET', self.YOUTRACK_CURRENT_USER_API.format(base_url=self.youtrack_url))
+
+    def get_projects(self) -> Sequence[Project]:
+        return self.read_response('GET', self.projects_url(), parse_content=self.parse_projects, validate=True)
+
+    async def get_projects_async(self) -> Sequence[Project]:
+        return await self.read_response_async('GET', self.projects_url(), parse_content=self.parse_projects,
+                                              validate=True)
+
+    def projects_url(self) -> str:
+        request_url = self.YOUTRACK_PROJECTS_API.format(base_url=self.youtrack_url)
+        request_url = request_url + parse.urlencode({'fields': self.PROJECTS_FIELDS, '$top': self.MAX_PROJECTS})
+        self.print(requesturl=request_url)
+        return request_url
+
+    @staticmethod
+    def parse_projects(response) -> Sequence[Project]:
+        return [Project(short_name=item['shortName'], name=item['name']) for item in response if item.get('shortName')]
+
+    def get_custom_fields(self) -> Dict[str, Union[Sequence[str], str, None]]:
+        """
+        Returns the names of the custom fields along with their possible values, "users" for fields holding users
+        and None if the values can not be listed.
+        """
+        request_url = self.YOUTRACK_CUSTOM_FIELDS_API.format(base_url=self.youtrack_url)
+        request_url = request_url + parse.urlencode({'fields': self.CUSTOM_FIELDS_FIELDS, '$top': self.MAX_CUSTOM_FIELDS})
+        self.print(requesturl=request_url)
+        fields = {}
+        for item in self.read_response('GET', request_url):
+            value_type = (item.get('fieldType') or {}).get('valueType', '')
+            if value_type.startswith('user'):
+                fields[item['name']] = 'users'
+            elif value_type in self.BUNDLE_VALUE_TYPES:
+                values = {}
+                for instance in item.get('instances') or []:
+                    for value in (instance.get('bundle') or {}).get('values') or []:
+                        values.setdefault(value['name'], None)
+                fields[item['name']] = list(values)
+            else:
+                fields[item['name']] = None
+        return fields
+
+    def get_users(self) -> Sequence[Sequence[str]]:
+        request_url = self.YOUTRACK_USERS_API.format(base_url=self.youtrack_url)
+        request_url = request_url + parse.urlencode({'fields': self.USERS_FIELDS, '$top': self.MAX_USERS})
+        self.print(requesturl=request_url)
+        return [[item['login'], item.get('fullName') or item['login']]
+                for item in self.read_response('GET', request_url) if item.get('login') and not item.get('banned')]
+
+    def get_tags(self) -> Sequence[str]:
+        request_url = self.YOUTRACK_TAGS_API.format(base_url=self.youtrack_url)
+        request_url = request_url + parse.urlencode({'fields': self.TAGS_FIELDS, '$top': self.MAX_TAGS})
+        self.print(requesturl=request_url)
+        return [item['name'] for item in self.read_response('GET', request_url) if item.get('name')]
+
+    def get_saved_queries(self) -> Sequence[Sequence[str]]:
+        request_url = self.YOUTRACK_SAVED_QUERIES_API.format(base_url=self.youtrack_url)
+        request_url = request_url + parse.urlencode({'fields': self.SAVED_QUERIES_FIELDS, '$top': self.MAX_SAVED_QUERIES})
+        self.print(requesturl=request_url)
+        return [[item['name'], item['query']]
+                for item in self.read_response('GET', request_url) if item.get('name') and item.get('query')]
+
+    def get_pinned_projects(self) -> Sequence[Sequence[str]]:
+        """
+        Returns the short names and names of the projects the user pinned as favourites.
+        """
+        request_url = self.YOUTRACK_PROJECTS_API.format(base_url=self.youtrack_url)
+        request_url = request_url + parse.urlencode({'fields': self.PINNED_PROJECTS_FIELDS, '$top': self.MAX_PROJECTS})
+        self.print(requesturl=request_url)
+        return [[item['shortName'], item['name']]
+                for item in self.read_response('GET', request_url) if item.get('shortName') and item.get('pinned')]
+
+    def get_issues_page(self, query: str, skip: int, top: int) -> Sequence[Issue]:
+        request_url: str = self.YOUTRACK_LIST_OF_ISSUES_API.format(base_url=self.youtrack_url)
+        request_url = request_url + parse.urlencode({'query': query, '$skip': skip, '$top': top, 'fields': self.INDEX_FIELDS})
+        self.print(requesturl=request_url)
+        return self.parse_list_of_issues_result(self.read_response('GET', request_url))
+
+    def get_issue_ids_page(self, query: str, skip: int, top: int) -> Sequence[str]:
+        request_url: str = self.YOUTRACK_LIST_OF_ISSUES_API.format(base_url=self.youtrack_url)
+        request_url = request_url + parse.urlencode({'query': query, '$skip': skip, '$top': top,
+                                                     'fields': self.INDEX_IDS_FIELDS})
+        self.print(requesturl=request_url)
+        return [item['idReadable'] for item in self.read_response('GET', request_url)]
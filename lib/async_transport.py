@@ -0,0 +1,239 @@
+import asyncio
+import email.parser
+import http.client
+import socket
+import threading
+import time
+from collections import deque
+
+from .stats import STAGE_BODY, STAGE_CONNECT, STAGE_TTFB, endpoint_of
+from .transport import Cancelled, ConnectionPool, ContentDecoder, Response, current_cancel_token
+from .worker import wait
+
+
+class EventLoopThread:
+    """
+    One asyncio event loop running in a background thread, the requests and background jobs of all servers
+    share it.
+    """
+
+    def __init__(self, name: str = "youtrack-io"):
+        self.name = name
+        self.loop = None
+        self._thread = None
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, args=(self.loop,), name=self.name, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _run(loop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+        # like asyncio.run does, the requests still in flight are cancelled and let clean up before closing
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.close()
+
+    def stop(self):
+        if self.loop is None:
+            return
+        loop, self.loop = self.loop, None
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout=1)
+
+    def submit(self, coroutine):
+        """
+        Runs the coroutine on the loop in the background, returns its concurrent future.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine, token=None):
+        """
+        Runs the coroutine on the loop and waits for its result. Cancelling the token cancels the coroutine and
+        raises Cancelled right away.
+        """
+        future = self.submit(coroutine)
+        try:
+            return wait(future, lambda: token is not None and token.cancelled)
+        except Cancelled:
+            future.cancel()
+            raise
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncConnectionPool(ConnectionPool):
+    """
+    Keeps alive up to max_size connections to a single YouTrack server like ConnectionPool, but sends the
+    requests with asyncio streams on the event loop of io, so in-flight requests do not occupy a thread each.
+    Https through a proxy is left to ConnectionPool.
+    """
+
+    def __init__(self, base_url: str, dbg, io: EventLoopThread, **kwargs):
+        super().__init__(base_url, dbg, **kwargs)
+        self.io = io
+        self.polls_cancel_token = not self._tunnels()
+        # used on the loop only
+        self._async_idle = deque()
+        self._async_slots = None
+
+    def _tunnels(self) -> bool:
+        return bool(self.proxy) and self.scheme == 'https'
+
+    def _send(self, method, url, body, headers):
+        if self._tunnels():
+            return super()._send(method, url, body, headers)
+        return self.io.run(self._send_async(method, url, body, headers), current_cancel_token())
+
+    async def _send_async(self, method, url, body, headers):
+        if self._tunnels():
+            return await super()._send_async(method, url, body, headers)
+        if self.proxy:
+            headers = dict(headers, **self.proxy_headers)
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.max_size)
+        target = self._request_target(url)
+        endpoint = endpoint_of(url)
+        async with self._async_slots:
+            conn, reused = await self._acquire_async(endpoint)
+            while True:
+                try:
+                    response, will_close = await self._exchange_async(conn, endpoint, method, target, body, headers)
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    conn.close()
+                    if not reused:
+                        raise
+                    # a kept alive connection may have been closed by the server in the meantime
+                    self.dbg("kept alive connection to {} was closed, reconnecting".format(self.host))
+                    conn, reused = await self._connect_async(endpoint), False
+                except BaseException:
+                    conn.close()
+                    raise
+            if will_close:
+                conn.close()
+            else:
+                self._async_idle.append((conn, time.monotonic()))
+            return response
+
+    async def _acquire_async(self, endpoint):
+        now = time.monotonic()
+        while self._async_idle and now - self._async_idle[0][1] > self.idle_timeout:
+            self._async_idle.popleft()[0].close()
+        if self._async_idle:
+            return self._async_idle.pop()[0], True
+        return await self._connect_async(endpoint), False
+
+    async def _connect_async(self, endpoint):
+        host, port = self.proxy if self.proxy else (self.host, self.port)
+        started = self.stats.clock()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port, ssl=self.ssl_context,
+                                        server_hostname=self.host if self.ssl_context else None),
+                self.connect_timeout)
+        except asyncio.TimeoutError:
+            raise socket.timeout("connecting to {} timed out".format(self.host)) from None
+        # includes the tls handshake, asyncio does not tell them apart
+        self.stats.record(endpoint, STAGE_CONNECT, self.stats.clock() - started)
+        return _Connection(reader, writer)
+
+    async def _read(self, awaitable):
+        try:
+            return await asyncio.wait_for(awaitable, self.read_timeout)
+        except asyncio.TimeoutError:
+            raise socket.timeout("reading from {} timed out".format(self.host)) from None
+
+    async def _exchange_async(self, conn, endpoint, method, target, body, headers):
+        clock = self.stats.clock
+        body = body or b''
+        lines = ['{} {} HTTP/1.1'.format(method, target), 'Host: ' + self._host_header()]
+        headers = dict(headers)
+        if body or method in ('POST', 'PUT'):
+            headers['Content-Length'] = str(len(body))
+        lines.extend('{}: {}'.format(name, value) for name, value in headers.items())
+        started = clock()
+        conn.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await conn.writer.drain()
+
+        status_line = await self._read(conn.reader.readline())
+        if not status_line:
+            raise http.client.RemoteDisconnected("remote end closed connection without response")
+        first_byte = clock()
+        self.stats.record(endpoint, STAGE_TTFB, first_byte - started)
+        version, status, reason = self._parse_status_line(status_line)
+        header_lines = []
+        while True:
+            line = await self._read(conn.reader.readline())
+            if line in (b'\r\n', b'\n', b''):
+                break
+            header_lines.append(line.decode('iso-8859-1'))
+        response_headers = email.parser.Parser(_class=http.client.HTTPMessage).parsestr(''.join(header_lines))
+
+        will_close = version == 'HTTP/1.0' or response_headers.get('Connection', '').lower() == 'close'
+        decoder = ContentDecoder(response_headers.get('Content-Encoding'))
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            pass
+        elif response_headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            await self._read_chunked(conn.reader, decoder)
+        elif response_headers.get('Content-Length') is not None:
+            remaining = int(response_headers['Content-Length'])
+            while remaining > 0:
+                piece = await self._read(conn.reader.readexactly(min(remaining, ContentDecoder.READ_SIZE)))
+                decoder.feed(piece)
+                remaining -= len(piece)
+        else:
+            while True:
+                piece = await self._read(conn.reader.read(ContentDecoder.READ_SIZE))
+                if not piece:
+                    break
+                decoder.feed(piece)
+            will_close = True
+        content = decoder.body()
+        self.stats.record(endpoint, STAGE_BODY, clock() - first_byte)
+        self.stats.received(endpoint, decoder.received)
+        return Response(status, reason, response_headers, content, decoder.received), will_close
+
+    def _host_header(self) -> str:
+        default_port = 443 if self.scheme == 'https' else 80
+        return self.host if self.port == default_port else '{}:{}'.format(self.host, self.port)
+
+    @staticmethod
+    def _parse_status_line(line: bytes):
+        parts = line.decode('iso-8859-1').rstrip('\r\n').split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+            raise http.client.BadStatusLine(line)
+        return parts[0], int(parts[1]), parts[2] if len(parts) > 2 else ''
+
+    async def _read_chunked(self, reader, decoder: ContentDecoder):
+        while True:
+            size_line = await self._read(reader.readline())
+            size = int(size_line.split(b';', 1)[0].strip() or b'0', 16)
+            if size == 0:
+                break
+            decoder.feed(await self._read(reader.readexactly(size)))
+            await self._read(reader.readline())
+        # trailers
+        while await self._read(reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+
+    def close(self):
+        super().close()
+        loop = self.io.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._close_idle)
+
+    def _close_idle(self):
+        while self._async_idle:
+            self._async_idle.pop()[0].close()
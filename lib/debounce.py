@@ -0,0 +1,59 @@
+import threading
+import time
+from typing import Optional
+
+
+class AdaptiveDebouncer:
+    """
+    Chooses how long to wait for further typing before asking a server, based on the pauses between the recent
+    keystrokes of the user and the recent round trip times of the server.
+    """
+
+    # longer pauses between keystrokes are not considered typing
+    TYPING_GAP: float = 1.5
+    SMOOTHING: float = 0.25
+
+    def __init__(self, min_wait: float, max_wait: float, clock=time.monotonic):
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.clock = clock
+        self.gap_mean = None
+        self.gap_deviation = 0.0
+        self.last_keystroke = None
+        self.round_trips = {}
+        self._lock = threading.Lock()
+
+    def keystroke(self) -> None:
+        with self._lock:
+            now = self.clock()
+            if self.last_keystroke is not None and now - self.last_keystroke < self.TYPING_GAP:
+                gap = now - self.last_keystroke
+                if self.gap_mean is None:
+                    self.gap_mean = gap
+                else:
+                    self.gap_deviation += self.SMOOTHING * (abs(gap - self.gap_mean) - self.gap_deviation)
+                    self.gap_mean += self.SMOOTHING * (gap - self.gap_mean)
+            self.last_keystroke = now
+
+    def record_round_trip(self, server_key: str, seconds: float) -> None:
+        with self._lock:
+            previous = self.round_trips.get(server_key)
+            self.round_trips[server_key] = seconds if previous is None \
+                else previous + self.SMOOTHING * (seconds - previous)
+
+    def wait_time(self, server_key: Optional[str] = None) -> float:
+        """
+        Waits long enough for most of the user's pauses between keystrokes to be over. Requests to a server
+        answering within half of such a pause are cheap, so they are sent after half the time already.
+        """
+        with self._lock:
+            if self.gap_mean is None:
+                return self.max_wait
+            expected_gap = self.gap_mean + 2 * self.gap_deviation
+            if server_key is None:
+                round_trip = max(self.round_trips.values(), default=None)
+            else:
+                round_trip = self.round_trips.get(server_key)
+            if round_trip is not None and round_trip < expected_gap / 2:
+                expected_gap /= 2
+            return min(self.max_wait, max(self.min_wait, expected_gap))
@@ -0,0 +1,74 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List
+
+
+class FrecencyStore:
+    """
+    Issues opened recently, ranked by how often and how recently they were opened. Every opening adds 1 to the
+    score of an issue, which halves every half_life seconds. Beyond max_entries the lowest ranked issues are dropped.
+    """
+
+    def __init__(self, path: str, max_entries: int, half_life: float, dbg, clock=time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self.half_life = half_life
+        self.dbg = dbg
+        self.clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self._entries = {entry['id']: entry for entry in json.load(f)}
+        except FileNotFoundError:
+            pass
+        except Exception as exc:
+            self.dbg("ignoring unreadable recent issues file {}: {}".format(self.path, exc))
+
+    def _save(self, entries: List[dict]):
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, separators=(',', ':'))
+            os.replace(temp_path, self.path)
+        except OSError as exc:
+            self.dbg("writing recent issues file {} failed: {}".format(self.path, exc))
+
+    def score(self, entry: dict, now: float) -> float:
+        return entry['score'] * 0.5 ** ((now - entry['at']) / self.half_life)
+
+    def record(self, id: str, summary: str, description: str, url: str) -> None:
+        with self._lock:
+            now = self.clock()
+            entry = self._entries.get(id)
+            score = self.score(entry, now) if entry is not None else 0.0
+            entry = self._entries[id] = {'id': id, 'summary': summary, 'description': description, 'url': url,
+                                         'score': score + 1, 'at': now}
+            if len(self._entries) > self.max_entries:
+                # the issue just opened stays, even if others have been opened more often
+                ranked = sorted((e for e in self._entries.values() if e['id'] != id),
+                                key=lambda e: self.score(e, now), reverse=True)
+                self._entries = {e['id']: e for e in ranked[:self.max_entries - 1]}
+                self._entries[id] = entry
+            entries = list(self._entries.values())
+        self._save(entries)
+
+    def top(self, text: str, limit: int) -> List[Dict[str, str]]:
+        """
+        Returns the best ranked issues whose id or summary contain all words of text.
+        """
+        words = text.lower().split()
+        with self._lock:
+            now = self.clock()
+            matches = [entry for entry in self._entries.values()
+                       if all(word in (entry['id'] + ' ' + (entry['summary'] or '')).lower() for word in words)]
+            matches.sort(key=lambda e: self.score(e, now), reverse=True)
+        return [{key: entry[key] for key in ('id', 'summary', 'description', 'url')} for entry in matches[:limit]]
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,169 @@
+import contextlib
+import contextvars
+import email.utils
+import threading
+import time
+from typing import Callable, Optional
+
+
+class ServerUnavailable(ConnectionError):
+    """
+    Raised instead of sending a request while the circuit of the server is open.
+    """
+
+    def __init__(self, retry_in: float):
+        super().__init__("server unavailable, trying again in {:.0f} seconds".format(max(0.0, retry_in)))
+        self.retry_in = retry_in
+
+
+def parse_retry_after(value: Optional[str], now: float = None) -> Optional[float]:
+    """
+    Returns the seconds to wait given by a Retry-After header, which holds either seconds or an http date.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at - (now if now is not None else time.time()))
+
+
+_scope = threading.local()
+# whether the requests sent are fetching something ahead of time rather than what the user waits for
+_background = contextvars.ContextVar('background', default=False)
+
+
+class ServerHealth:
+    """
+    Circuit breaker and token bucket of the requests to one server.
+
+    After failure_threshold consecutive failures the circuit opens for open_interval seconds, doubling up to
+    MAX_OPEN_INTERVAL while the server stays down, or for as long as the Retry-After of the server says.
+    Requests fail with ServerUnavailable right away while it is open. If a probe is set, it is sent in the
+    background once the interval passed and closes the circuit again when it succeeds.
+
+    Requests beyond rate per second, with bursts of up to burst requests, are delayed. Requests sent in the
+    background have a token bucket of their own, so that they never delay the ones the user waits for.
+    """
+
+    FAILURE_THRESHOLD_DEFAULT: int = 3
+    OPEN_INTERVAL_DEFAULT: float = 5.0
+    MAX_OPEN_INTERVAL: float = 300.0
+    RATE_DEFAULT: float = 10.0
+    BURST_DEFAULT: int = 20
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD_DEFAULT,
+                 open_interval: float = OPEN_INTERVAL_DEFAULT, rate: float = 0.0, burst: int = BURST_DEFAULT,
+                 dbg=None, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.open_interval = open_interval
+        self.rate = rate
+        self.burst = burst
+        self.dbg = dbg if dbg is not None else (lambda text: None)
+        self.clock = clock
+        # sends a request to the server, the outcome is reported by the transport
+        self.probe: Optional[Callable[[], object]] = None
+        self._failures = 0
+        self._open_until = None
+        self._current_interval = open_interval
+        # (tokens, refilled at) of the requests the user waits for and of the background ones
+        self._buckets = {False: (float(burst), clock()), True: (float(burst), clock())}
+        self._probe_timer = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def probing(self):
+        _scope.probing = True
+        try:
+            yield
+        finally:
+            _scope.probing = False
+
+    @staticmethod
+    @contextlib.contextmanager
+    def background():
+        """
+        The requests sent within take their tokens from the bucket of the background requests.
+        """
+        previous = _background.get()
+        _background.set(True)
+        try:
+            yield
+        finally:
+            _background.set(previous)
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._open_until is not None and self.clock() < self._open_until
+
+    def acquire(self) -> float:
+        """
+        Takes a token for a request and returns the seconds to wait before sending it, raises ServerUnavailable
+        while the circuit is open.
+        """
+        with self._lock:
+            now = self.clock()
+            if self._open_until is not None and now < self._open_until and not getattr(_scope, 'probing', False):
+                raise ServerUnavailable(self._open_until - now)
+            if self.rate <= 0:
+                return 0.0
+            background = _background.get()
+            tokens, refilled_at = self._buckets[background]
+            tokens = min(float(self.burst), tokens + (now - refilled_at) * self.rate) - 1
+            self._buckets[background] = (tokens, now)
+            return max(0.0, -tokens / self.rate)
+
+    def succeeded(self) -> None:
+        with self._lock:
+            if self._open_until is not None:
+                self.dbg("server is available again")
+            self._failures = 0
+            self._open_until = None
+            self._current_interval = self.open_interval
+
+    def failed(self, retry_after: float = None) -> None:
+        with self._lock:
+            now = self.clock()
+            self._failures += 1
+            if self._failures < self.failure_threshold and retry_after is None:
+                return
+            if self._open_until is not None and now < self._open_until and not getattr(_scope, 'probing', False):
+                # a request sent before the circuit opened
+                return
+            if self._open_until is not None:
+                # still down after the previous interval
+                self._current_interval = min(self._current_interval * 2, self.MAX_OPEN_INTERVAL)
+            interval = max(self._current_interval, retry_after or 0.0)
+            self._open_until = now + interval
+            self.dbg("{} failures in a row, not sending requests for {:.0f} seconds".format(self._failures, interval))
+            self._schedule_probe(interval)
+
+    def _schedule_probe(self, delay: float):
+        if self.probe is None or self._closed:
+            return
+        if self._probe_timer is not None:
+            self._probe_timer.cancel()
+        self._probe_timer = threading.Timer(delay, self._run_probe)
+        self._probe_timer.daemon = True
+        self._probe_timer.start()
+
+    def _run_probe(self):
+        with self._lock:
+            self._probe_timer = None
+        with self.probing():
+            try:
+                self.probe()
+            except Exception as exc:
+                self.dbg("probing the server failed: {}".format(exc))
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            timer, self._probe_timer = self._probe_timer, None
+        if timer is not None:
+            timer.cancel()
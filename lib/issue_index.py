@@ -0,0 +1,206 @@
+import datetime
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Sequence, Set, Tuple
+
+# matches input using more of the YouTrack query language than plain words
+QUERY_SYNTAX = re.compile(r'[:#{}()"]|\bsort\s+by\b', re.IGNORECASE)
+
+
+def is_free_text(query: str) -> bool:
+    return QUERY_SYNTAX.search(query) is None
+
+
+class IssueIndex:
+    """
+    Local full text index of the issues of a server matching query, stored in a sqlite database. The rows of the
+    full text table share the rowid of their issue.
+    Falls back to LIKE queries in case the sqlite library was built without FTS5.
+    """
+
+    META_WATERMARK: str = 'watermark'
+    META_SYNCED: str = 'synced'
+    META_QUERY: str = 'query'
+
+    def __init__(self, path: str, query: str = ""):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS issues '
+                         '(id TEXT PRIMARY KEY, summary TEXT, description TEXT, updated INTEGER)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        try:
+            self._db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS issues_fts USING fts5(id, summary, description)')
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False
+        row = self._db.execute('SELECT value FROM meta WHERE key = ?', (self.META_QUERY,)).fetchone()
+        if row is None or row[0] != query:
+            # issues of another query, the watermark does not tell which ones the new query adds
+            self._db.execute('DELETE FROM issues')
+            if self.fts:
+                self._db.execute('DELETE FROM issues_fts')
+            self._db.execute('DELETE FROM meta')
+            self._db.execute('INSERT INTO meta (key, value) VALUES (?, ?)', (self.META_QUERY, query))
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def get_watermark(self) -> Optional[int]:
+        with self._lock:
+            row = self._db.execute('SELECT value FROM meta WHERE key = ?', (self.META_WATERMARK,)).fetchone()
+        return int(row[0]) if row else None
+
+    def is_ready(self) -> bool:
+        """
+        Whether the first sync has stored all issues, partial results are not used for searching.
+        """
+        with self._lock:
+            return self._db.execute('SELECT 1 FROM meta WHERE key = ?', (self.META_SYNCED,)).fetchone() is not None
+
+    def mark_synced(self) -> None:
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (self.META_SYNCED, '1'))
+
+    def upsert(self, issues: Sequence, watermark: int) -> None:
+        """
+        Stores the issues (id, summary, description, updated) and the watermark the next sync continues from.
+        """
+        with self._lock, self._db:
+            for issue in issues:
+                row = self._db.execute('SELECT rowid FROM issues WHERE id = ?', (issue.id,)).fetchone()
+                if row is None:
+                    rowid = self._db.execute('INSERT INTO issues (id, summary, description, updated) VALUES (?, ?, ?, ?)',
+                                             (issue.id, issue.summary, issue.description, issue.updated)).lastrowid
+                else:
+                    rowid = row[0]
+                    self._db.execute('UPDATE issues SET summary = ?, description = ?, updated = ? WHERE rowid = ?',
+                                     (issue.summary, issue.description, issue.updated, rowid))
+                if self.fts:
+                    if row is not None:
+                        self._db.execute('DELETE FROM issues_fts WHERE rowid = ?', (rowid,))
+                    self._db.execute('INSERT INTO issues_fts (rowid, id, summary, description) VALUES (?, ?, ?, ?)',
+                                     (rowid, issue.id, issue.summary, issue.description))
+            self._db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                             (self.META_WATERMARK, str(watermark)))
+
+    def remove_missing(self, ids: Set[str]) -> int:
+        """
+        Removes the issues whose id is not among ids, returns how many.
+        """
+        with self._lock, self._db:
+            gone = [(rowid,) for rowid, id in self._db.execute('SELECT rowid, id FROM issues') if id not in ids]
+            self._db.executemany('DELETE FROM issues WHERE rowid = ?', gone)
+            if self.fts:
+                self._db.executemany('DELETE FROM issues_fts WHERE rowid = ?', gone)
+        return len(gone)
+
+    def search(self, text: str, limit: int) -> List[Tuple[str, str, str]]:
+        """
+        Returns (id, summary, description) of the issues containing all words of text, best matches first.
+        """
+        words = text.split()
+        with self._lock:
+            if not words:
+                return self._db.execute('SELECT id, summary, description FROM issues ORDER BY updated DESC LIMIT ?',
+                                        (limit,)).fetchall()
+            if self.fts:
+                match = ' '.join('"' + word.replace('"', '""') + '"*' for word in words)
+                return self._db.execute('SELECT i.id, i.summary, i.description FROM issues_fts f '
+                                        'JOIN issues i ON i.rowid = f.rowid WHERE issues_fts MATCH ? '
+                                        'ORDER BY f.rank LIMIT ?', (match, limit)).fetchall()
+            condition = ' AND '.join(['(id LIKE ? OR summary LIKE ? OR description LIKE ?)'] * len(words))
+            params = [p for word in words for p in ['%' + word + '%'] * 3]
+            return self._db.execute('SELECT id, summary, description FROM issues WHERE ' + condition +
+                                    ' ORDER BY updated DESC LIMIT ?', params + [limit]).fetchall()
+
+
+class IssueIndexSync:
+    """
+    Pulls the issues updated since the last watermark into the index, page by page, in a background thread.
+    Issues deleted or no longer matching the query never show up that way, so every RECONCILE_INTERVAL seconds
+    the ids of all issues matching are listed and the other ones are removed from the index.
+    """
+
+    PAGE_SIZE: int = 100
+    IDS_PAGE_SIZE: int = 1000
+    RECONCILE_INTERVAL: float = 86400.0
+    # the query language only knows dates, so the day of the watermark is always fetched again
+    QUERY: str = '{query} updated: {since} .. Today sort by: updated asc'
+    # new issues are listed last, so that the pages do not shift while they are fetched
+    IDS_QUERY: str = '{query} sort by: created asc'
+
+    def __init__(self, index: IssueIndex, api, dbg, interval: float, query: str = "", clock=time.monotonic):
+        self.index = index
+        self.api = api
+        self.dbg = dbg
+        self.interval = interval
+        self.query = query
+        self.clock = clock
+        self._reconciled_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="youtrack-index-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception as exc:
+                self.dbg("index sync failed: " + str(exc))
+            self._stop.wait(self.interval)
+
+    def sync(self):
+        watermark = self.index.get_watermark()
+        if watermark is None:
+            query = (self.query + ' sort by: updated asc').strip()
+        else:
+            since = datetime.datetime.fromtimestamp(watermark / 1000).strftime('%Y-%m-%d')
+            query = self.QUERY.format(query=self.query, since=since).strip()
+        skip = 0
+        while True:
+            if self._stop.is_set():
+                return
+            issues = self.api.get_issues_page(query, skip, self.PAGE_SIZE)
+            if issues:
+                watermark = max([watermark or 0] + [issue.updated or 0 for issue in issues])
+            self.index.upsert(issues, watermark or 0)
+            self.dbg("index sync stored {} issues".format(len(issues)))
+            if len(issues) < self.PAGE_SIZE:
+                break
+            skip += self.PAGE_SIZE
+        if not self.index.is_ready():
+            self.index.mark_synced()
+            # just fetched, nothing to reconcile
+            self._reconciled_at = self.clock()
+        elif self._reconciled_at is None or self.clock() - self._reconciled_at >= self.RECONCILE_INTERVAL:
+            self.reconcile()
+
+    def reconcile(self):
+        """
+        Removes the issues from the index that no longer match the query, e.g. because they were deleted.
+        """
+        query = self.IDS_QUERY.format(query=self.query).strip()
+        ids = set()
+        skip = 0
+        while True:
+            if self._stop.is_set():
+                return
+            page = self.api.get_issue_ids_page(query, skip, self.IDS_PAGE_SIZE)
+            ids.update(page)
+            if len(page) < self.IDS_PAGE_SIZE:
+                break
+            skip += self.IDS_PAGE_SIZE
+        removed = self.index.remove_missing(ids)
+        self._reconciled_at = self.clock()
+        self.dbg("index sync removed {} issues gone from the server".format(removed))
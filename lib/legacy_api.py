@@ -1,12 +1,17 @@
-from typing import Sequence, Callable, Union
-from urllib import parse, request
-from xml.dom import minidom
-from xml.dom.minidom import Element
+from typing import Iterator, Sequence, Callable, Union
+from urllib import parse
+from xml.etree import ElementTree
+import urllib.error
 
-from .util import get_as_xml, get_value, get_child_att_value
+from .singleflight import SingleFlight
+from .stats import STAGE_PARSE, endpoint_of
+from .transport import ConnectionPool, Transport
+from .util import iter_completed_elements
 
 
 class IntellisenseResult(object):
+    __slots__ = ('description', 'end', 'start', 'option', 'suffix', 'prefix', 'full_option')
+
     def __init__(self, full_option: str, prefix: Union[str, None], suffix: Union[str, None], option: str, start: int,
                  end: int, description: str):
         self.description = description
@@ -19,11 +24,22 @@ class IntellisenseResult(object):
 
 
 class Issue(object):
-    def __init__(self, id: str, summary: str, description: str, url: str):
+    __slots__ = ('url', 'id', 'summary', 'description', 'updated')
+
+    def __init__(self, id: str, summary: str, description: str, url: str, updated: Union[int, None] = None):
         self.url = url
         self.id = id
         self.summary = summary
         self.description = description
+        self.updated = updated
+
+
+class Project(object):
+    __slots__ = ('short_name', 'name')
+
+    def __init__(self, short_name: str, name: str):
+        self.short_name = short_name
+        self.name = name
 
 
 class Api():
@@ -31,23 +47,55 @@ class Api():
     TOKEN_PREFIX: str = 'Bearer '
     YOUTRACK_INTELLISENSE_ISSUE_API: str = '{base_url}/rest/issue/intellisense/?'
     YOUTRACK_LIST_OF_ISSUES_API: str = '{base_url}/rest/issue?'
+    YOUTRACK_ISSUE_API: str = '{base_url}/rest/issue/{id}'
+    YOUTRACK_PROJECTS_API: str = '{base_url}/rest/project/all?verbose=false'
+    YOUTRACK_CURRENT_USER_API: str = '{base_url}/rest/user/current'
     YOUTRACK_ISSUE: str = '{base_url}/issue/{id}'
     YOUTRACK_ISSUES: str = '{base_url}/issues/?'
+    SUGGESTION_TYPE = IntellisenseResult
+    ISSUE_TYPE = Issue
+    PROJECT_TYPE = Project
+    # the issue lists include the descriptions
+    LAZY_DESCRIPTIONS: bool = False
 
-    def __init__(self, api_token: str, youtrack_url: str, dbg, max_results):
+    def __init__(self, api_token: str, youtrack_url: str, dbg, max_results, transport: Transport = None):
         super().__init__()
         self.dbg = dbg
         self.api_token = api_token
         self.youtrack_url = youtrack_url
         self.max_results = max_results
+        self.transport = transport if transport is not None else ConnectionPool(youtrack_url, dbg=dbg)
+        self.stats = self.transport.stats
+        self.flights = SingleFlight()
 
-    def open_url(self, http_url) -> str:
-        req = request.Request(http_url)
-        req.add_header(self.AUTH_HEADER, self.TOKEN_PREFIX + self.api_token)
+    def open_url(self, http_url) -> bytes:
+        headers = {self.AUTH_HEADER: self.TOKEN_PREFIX + self.api_token}
+        return self.transport.request('GET', http_url, headers=headers).body
 
-        with request.urlopen(req) as resp:
-            content = resp.read()
-            return content
+    def read_parsed(self, http_url, parse_content):
+        """
+        Returns parse_content applied to the response, a response the server did not modify since it was parsed
+        last is not parsed again.
+        """
+        headers = {self.AUTH_HEADER: self.TOKEN_PREFIX + self.api_token}
+        resp = self.transport.request('GET', http_url, headers=headers, validate=True)
+        return self.parse_response(http_url, resp, parse_content)
+
+    async def read_parsed_async(self, http_url, parse_content):
+        headers = {self.AUTH_HEADER: self.TOKEN_PREFIX + self.api_token}
+        resp = await self.transport.request_async('GET', http_url, headers=headers, validate=True)
+        return self.parse_response(http_url, resp, parse_content)
+
+    def parse_response(self, http_url, resp, parse_content):
+        if resp.memo is not None and 'parsed' in resp.memo:
+            return resp.memo['parsed']
+        endpoint = endpoint_of(http_url)
+        with self.stats.timed(endpoint, STAGE_PARSE):
+            parsed = parse_content(resp.body)
+        self.stats.parsed(endpoint, len(resp.body))
+        if resp.memo is not None:
+            resp.memo['parsed'] = parsed
+        return parsed
 
     def print(self, **kwargs):
         to_print = str.join(",", [key + " = \"" + str(value) + "\"" for key, value in kwargs.items()])
@@ -59,39 +107,58 @@ class Api():
     def create_issue_url(self, id):
         return self.YOUTRACK_ISSUE.format(base_url=self.youtrack_url, id=id)
 
+    def suggestions_cache_key(self, actual_user_input: str):
+        return 'suggestions', actual_user_input, None, None, None
+
+    def issues_cache_key(self, actual_user_input: str, skip: int = 0):
+        return 'issues', actual_user_input.strip(), skip, None, self.max_results + 1
+
+    def issue_cache_key(self, id: str):
+        return 'issue', id, None, None, None
+
+    def projects_cache_key(self):
+        return 'projects', None, None, None, None
+
+    def get_suggestions(self, actual_user_input: str) -> Sequence[IntellisenseResult]:
+        return self.flights.do(('intellisense', actual_user_input), self.get_intellisense_suggestions,
+                               actual_user_input)
+
+    async def get_suggestions_async(self, actual_user_input: str) -> Sequence[IntellisenseResult]:
+        return await self.flights.do_async(('intellisense', actual_user_input), self.read_parsed_async,
+                                           self.intellisense_url(actual_user_input),
+                                           self.parse_intellisense_suggestions)
+
     def get_intellisense_suggestions(self, actual_user_input: str) -> Sequence[IntellisenseResult]:
         """
         There is no non-legacy yet (YouTrack 2019.2) but already announced that it will be discontinued
         once everything has been published under the new api.
         """
+        return self.read_parsed(self.intellisense_url(actual_user_input), self.parse_intellisense_suggestions)
+
+    def intellisense_url(self, actual_user_input: str) -> str:
         request_url = self.YOUTRACK_INTELLISENSE_ISSUE_API.format(base_url=self.youtrack_url)
         filter_part = parse.urlencode({'filter': actual_user_input})
         request_url = request_url + filter_part
         self.print(requesturl=request_url)
-        content: bytes = self.open_url(request_url)
-        api_result_suggestions = self.parse_intellisense_suggestions(content)
-        return api_result_suggestions
+        return request_url
 
     @staticmethod
     def parse_intellisense_suggestions(response: bytes) -> Sequence[IntellisenseResult]:
-        dom = get_as_xml(response)
-        if (dom.documentElement.nodeName != 'IntelliSense'): return []
-        items = [itemOrRecentItem
-                 for suggestOrRecent in dom.documentElement.childNodes
-                 for itemOrRecentItem in suggestOrRecent.childNodes
-                 if isinstance(itemOrRecentItem, Element) and itemOrRecentItem.nodeName in ['item', 'recentItem']]
-        result = []
-
-        for item in items:
-            prefix: str = get_value(item, 'prefix')
-            suffix: str = get_value(item, 'suffix')
-            option: str = get_value(item, 'option')
-            description: str = get_value(item, 'description')
-            start: int = int(get_child_att_value(item, 'completion', 'start'))
-            end: int = int(get_child_att_value(item, 'completion', 'end'))
+        return list(Api.iter_intellisense_suggestions(response))
+
+    @staticmethod
+    def iter_intellisense_suggestions(response: bytes) -> Iterator[IntellisenseResult]:
+        for item in iter_completed_elements(response, 'IntelliSense', ('item', 'recentItem'), depth=2):
+            prefix: str = item.findtext('prefix')
+            suffix: str = item.findtext('suffix')
+            option: str = item.findtext('option')
+            description: str = item.findtext('description')
+            completion = item.find('completion')
+            start: int = int(completion.get('start'))
+            end: int = int(completion.get('end'))
             if option is None: continue
             res = str.join('', (item for item in [prefix, option, suffix] if item is not None))
-            intelliRes = IntellisenseResult(
+            yield IntellisenseResult(
                 full_option=res,
                 prefix=prefix,
                 suffix=suffix,
@@ -99,41 +166,101 @@ class Api():
                 start=start,
                 end=end,
                 description=description)
-            result.append(intelliRes)
-        return result
 
     def parse_list_of_issues_result(self, response: bytes) -> Sequence[Issue]:
-        dom = get_as_xml(response)
-        if dom.documentElement.nodeName != 'issueCompacts': return []
-        items = [issue for issue in dom.documentElement.childNodes
-                 if isinstance(issue, minidom.Element) and issue.nodeName == 'issue']
-        issues: Sequence[Issue] = []
-        for item in items:
-            self.print(item=str(item))
-            id = item.getAttribute('id')
+        return list(self.iter_list_of_issues_result(response))
+
+    def iter_list_of_issues_result(self, response: bytes) -> Iterator[Issue]:
+        for item in iter_completed_elements(response, 'issueCompacts', ('issue',), depth=1):
+            id = item.get('id')
             description = self.extract_field_value('description', "", item)
             summary: str = self.extract_field_value('summary', "--no summary--", item)
             issue = Issue(id=id, summary=summary, description=description, url=self.create_issue_url(id))
-            issues.append(issue)
             self.print(id=id, summary=summary, url=issue.url)
-        return issues
+            yield issue
+
+    def parse_issue(self, response: bytes) -> Issue:
+        item = ElementTree.fromstring(response)
+        id = item.get('id')
+        description = self.extract_field_value('description', "", item)
+        summary: str = self.extract_field_value('summary', "--no summary--", item)
+        return Issue(id=id, summary=summary, description=description, url=self.create_issue_url(id))
 
     @staticmethod
     def extract_field_value(field_name: str, fallback: str, item) -> str:
-        return next((get_value(fieldNode, "value")
-                     for fieldNode in item.childNodes
-                     if isinstance(fieldNode,
-                                   minidom.Element) and fieldNode.nodeName == 'field' and fieldNode.getAttribute(
-            'name') == field_name),
+        return next((field.findtext('value') for field in item.iterfind('field') if field.get('name') == field_name),
                     fallback)
 
-    def get_issues_matching_filter(self, actual_user_input: str) -> Sequence[Issue]:
+    def get_issues_matching_filter(self, actual_user_input: str, skip: int = 0) -> Sequence[Issue]:
+        """
+        Returns the page of max_results issues starting after the first skip ones, plus the next issue if there is
+        one to tell whether there are more.
+        """
+        return self.flights.do(('issue', actual_user_input, skip), self._get_issues_matching_filter,
+                               actual_user_input, skip)
+
+    async def get_issues_matching_filter_async(self, actual_user_input: str, skip: int = 0) -> Sequence[Issue]:
+        return await self.flights.do_async(('issue', actual_user_input, skip), self.read_parsed_async,
+                                           self.issues_url(actual_user_input, skip), self.parse_list_of_issues_result)
+
+    def _get_issues_matching_filter(self, actual_user_input: str, skip: int) -> Sequence[Issue]:
+        return self.read_parsed(self.issues_url(actual_user_input, skip), self.parse_list_of_issues_result)
+
+    def issues_url(self, actual_user_input: str, skip: int) -> str:
         request_url: str = self.YOUTRACK_LIST_OF_ISSUES_API.format(base_url=self.youtrack_url)
-        filter_part: str = parse.urlencode({'filter': actual_user_input})
+        filter_part: str = parse.urlencode({'filter': actual_user_input, 'after': skip, 'max': self.max_results + 1})
         request_url = request_url + filter_part
         self.print(requesturl=request_url)
-        content: str = self.open_url(request_url)
-        self.dbg("parsing issues result")
-        issues = self.parse_list_of_issues_result(content)
-        return issues
+        return request_url
+
+    def find_issue(self, id: str) -> Sequence[Issue]:
+        """
+        Returns the issue with the id, nothing if there is none.
+        """
+        return self.flights.do(('issue/id', id), self._find_issue, id)
+
+    async def find_issue_async(self, id: str) -> Sequence[Issue]:
+        return await self.flights.do_async(('issue/id', id), self._find_issue_async, id)
+
+    def _find_issue(self, id: str) -> Sequence[Issue]:
+        try:
+            return [self.read_parsed(self.issue_api_url(id), self.parse_issue)]
+        except urllib.error.HTTPError as exc:
+            if exc.code == 404:
+                return []
+            raise
+
+    async def _find_issue_async(self, id: str) -> Sequence[Issue]:
+        try:
+            return [await self.read_parsed_async(self.issue_api_url(id), self.parse_issue)]
+        except urllib.error.HTTPError as exc:
+            if exc.code == 404:
+                return []
+            raise
+
+    def issue_api_url(self, id: str) -> str:
+        request_url = self.YOUTRACK_ISSUE_API.format(base_url=self.youtrack_url, id=parse.quote(id))
+        self.print(requesturl=request_url)
+        return request_url
+
+    def probe(self):
+        """
+        Sends a cheap request, used to find out whether the server is available again.
+        """
+        self.open_url(self.YOUTRACK_CURRENT_USER_API.format(base_url=self.youtrack_url))
+
+    def get_projects(self) -> Sequence[Project]:
+        return self.read_parsed(self.projects_url(), self.parse_projects)
+
+    async def get_projects_async(self) -> Sequence[Project]:
+        return await self.read_parsed_async(self.projects_url(), self.parse_projects)
+
+    def projects_url(self) -> str:
+        request_url = self.YOUTRACK_PROJECTS_API.format(base_url=self.youtrack_url)
+        self.print(requesturl=request_url)
+        return request_url
 
+    @staticmethod
+    def parse_projects(content: bytes) -> Sequence[Project]:
+        return [Project(short_name=item.get('shortName'), name=item.get('name'))
+                for item in iter_completed_elements(content, 'projects', ('project',), depth=1) if item.get('shortName')]
@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class PersistentCache:
+    """
+    Api results kept across restarts in a zlib compressed json file, evicting the oldest entries beyond max_entries.
+    The file is replaced atomically, so a crash leaves either the previous or the new version behind.
+    Values have to be json serializable, keys tuples of json serializable values.
+    """
+
+    FORMAT_VERSION: int = 1
+    # puts are collected for this many seconds before the file is written
+    FLUSH_DELAY: float = 5.0
+
+    def __init__(self, path: str, max_entries: int, dbg, clock=time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self.dbg = dbg
+        self.clock = clock
+        self.loaded = threading.Event()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flush_timer = None
+
+    def load_async(self):
+        threading.Thread(target=self.load, name="youtrack-cache-load", daemon=True).start()
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                content = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+            if content.get('version') != self.FORMAT_VERSION:
+                self.dbg("ignoring cache file {} of version {}".format(self.path, content.get('version')))
+                return
+            entries = sorted(content['entries'], key=lambda entry: entry[1])
+            loaded = OrderedDict((tuple(key), (value, stored_at)) for key, stored_at, value in entries)
+            with self._lock:
+                # puts made while loading are newer
+                loaded.update(self._entries)
+                for key in self._entries:
+                    loaded.move_to_end(key)
+                while len(loaded) > self.max_entries:
+                    loaded.popitem(last=False)
+                self._entries = loaded
+            self.dbg("loaded {} cached results from {}".format(len(entries), self.path))
+        except FileNotFoundError:
+            pass
+        except Exception as exc:
+            self.dbg("ignoring unreadable cache file {}: {}".format(self.path, exc))
+        finally:
+            self.loaded.set()
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """
+        Returns the value along with its age in seconds, None as long as the file has not been loaded.
+        """
+        if not self.loaded.is_set():
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        return value, max(0.0, self.clock() - stored_at)
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, self.clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.FLUSH_DELAY, self._flush_when_loaded)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def _flush_when_loaded(self):
+        # a cache file written before loading finished would lose the entries not loaded yet
+        self.loaded.wait()
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush_timer = None
+            if not self._dirty:
+                return
+            entries = [[list(key), stored_at, value] for key, (value, stored_at) in self._entries.items()]
+            self._dirty = False
+        content = zlib.compress(json.dumps({'version': self.FORMAT_VERSION, 'entries': entries},
+                                           separators=(',', ':')).encode('utf-8'))
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except OSError as exc:
+            self.dbg("writing cache file {} failed: {}".format(self.path, exc))
+
+    def close(self):
+        with self._lock:
+            timer = self._flush_timer
+        if timer is not None:
+            timer.cancel()
+        if self.loaded.is_set():
+            self.flush()
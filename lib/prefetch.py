@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Hashable, Sequence, Tuple
+
+from .transport import CancelToken, Cancelled
+
+
+class Prefetcher:
+    """
+    Fetches results the user is likely to ask for next one after the other in the background, after waiting for
+    the delay they were scheduled with. Scheduling new ones cancels the ones still pending, they belong to an
+    input that has changed since.
+    Nothing is fetched while more than budget bytes were received by prefetches within the last WINDOW seconds.
+    """
+
+    WINDOW: float = 60.0
+
+    def __init__(self, submit: Callable, budget: int, dbg, clock=time.monotonic):
+        # runs a coroutine in the background and returns its concurrent future, e.g. EventLoopThread.submit
+        self.submit = submit
+        self.budget = budget
+        self.dbg = dbg
+        self.clock = clock
+        self._spent = deque()
+        self._token = None
+        self._future = None
+        self._lock = threading.Lock()
+
+    def schedule(self, jobs: Sequence[Tuple[Hashable, Callable[[], Awaitable]]], delay: float = 0.0) -> None:
+        """
+        jobs are pairs of a key identifying the results and the coroutine function fetching them, in order of
+        priority.
+        """
+        token = CancelToken()
+        future = self.submit(self._run(token, list(jobs), delay)) if jobs else None
+        with self._lock:
+            previous, self._token = self._token, token
+            previous_future, self._future = self._future, future
+        if previous is not None:
+            previous.cancel()
+        if previous_future is not None:
+            previous_future.cancel()
+
+    def cancel(self) -> None:
+        self.schedule([])
+
+    def spent(self) -> int:
+        with self._lock:
+            horizon = self.clock() - self.WINDOW
+            while self._spent and self._spent[0][0] < horizon:
+                self._spent.popleft()
+            return sum(size for _, size in self._spent)
+
+    async def _run(self, token: CancelToken, jobs, delay: float):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        with token.scope():
+            for key, fetch in jobs:
+                if token.cancelled:
+                    return
+                if self.spent() >= self.budget:
+                    self.dbg("prefetch budget used up, skipping {}".format(key))
+                    return
+                received = token.received
+                try:
+                    await fetch()
+                except Cancelled:
+                    return
+                except Exception as exc:
+                    self.dbg("prefetching {} failed: {}".format(key, exc))
+                finally:
+                    with self._lock:
+                        self._spent.append((self.clock(), token.received - received))
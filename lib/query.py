@@ -0,0 +1,170 @@
+import re
+import threading
+from typing import Dict, Optional, Sequence, Tuple
+
+# PROJ-1234, project short names start with a letter
+ISSUE_ID = re.compile(r'^\s*([A-Za-z][\w]*-\d+)\s*$')
+PROJECT_PREFIX = re.compile(r'^\s*([A-Za-z][\w]*)(-?)\s*$')
+
+
+def parse_issue_id(text: str) -> Optional[str]:
+    match = ISSUE_ID.match(text)
+    return match.group(1).upper() if match else None
+
+
+def parse_project_prefix(text: str):
+    """
+    Returns the beginning of a project short name typed as start of an issue id and whether the dash was typed,
+    None for other input.
+    """
+    match = PROJECT_PREFIX.match(text)
+    return (match.group(1), match.group(2) == '-') if match else None
+
+
+# values after the colon of a field so far, the value at the caret is not part of it
+_VALUES_SO_FAR = re.compile(r':\s*(?:(?:\{[^{}]*\}|[^\s,:{}()#"]+)\s*,\s*)*$')
+
+# attributes every issue has, mapped to the vocabulary of their values if it is known
+BUILTIN_FIELDS: Dict[str, Optional[str]] = {
+    'project': 'projects',
+    'tag': 'tags',
+    'reporter': 'users',
+    'commenter': 'users',
+    'updated by': 'users',
+    'created': None,
+    'updated': None,
+    'resolved date': None,
+    'summary': None,
+    'description': None,
+    'comments': None,
+    'has': None,
+    'sort by': None,
+}
+SHORTCUTS: Sequence[Tuple[str, str]] = (('Unresolved', 'unresolved issues'), ('Resolved', 'resolved issues'))
+
+
+class QueryCompleter:
+    """
+    Completes field names and values of the YouTrack query language from a vocabulary fetched beforehand, so that
+    most keystrokes of the filter mode need no request.
+
+    The vocabulary has the keys
+        projects: [[short name, name], ...]
+        fields: {name: [value, ...] or "users" or None if its values are unknown}
+        users: [[login, full name], ...]
+        tags: [name, ...]
+
+    complete returns None for input it can not handle, the server has to make the suggestions then.
+    """
+
+    WORD_BREAKS: str = ' \t:{}()#,"'
+    MAX_NAME_LENGTH: int = 40
+
+    def __init__(self, result_type, max_results: int):
+        self.result_type = result_type
+        self.max_results = max_results
+        self.vocabulary = None
+        self._fields = {}
+        self._lock = threading.Lock()
+
+    def is_ready(self) -> bool:
+        return self.vocabulary is not None
+
+    def update(self, vocabulary: dict) -> None:
+        users = [(login, full_name) for login, full_name in vocabulary.get('users', [])] + [('me', 'current user')]
+        lists = {
+            'projects': [(short_name, name) for short_name, name in vocabulary.get('projects', [])],
+            'tags': [(name, 'tag') for name in vocabulary.get('tags', [])],
+            'users': users,
+        }
+        # lower case name -> (name, candidates or None)
+        fields = {name: (name, lists[values] if values else None) for name, values in BUILTIN_FIELDS.items()}
+        for name, values in vocabulary.get('fields', {}).items():
+            if values == 'users':
+                candidates = users
+            elif values:
+                candidates = [(value, name) for value in values]
+            else:
+                candidates = None
+            fields[name.lower()] = (name, candidates)
+        hash_values = [(name, 'tag') for name in vocabulary.get('tags', [])] + list(SHORTCUTS)
+        for name, candidates in fields.values():
+            if candidates is not None and candidates is not users and name.lower() != 'project':
+                hash_values.extend(candidates)
+        with self._lock:
+            self._fields = fields
+            self._hash_values = hash_values
+            self.vocabulary = vocabulary
+
+    def complete(self, query: str) -> Optional[list]:
+        if not self.is_ready() or query.count('"') % 2:
+            return None
+        with self._lock:
+            fields = self._fields
+            hash_values = self._hash_values
+        end = len(query)
+        braced = query.rfind('{') > query.rfind('}')
+        if braced:
+            start = query.rfind('{')
+            word = query[start + 1:]
+        else:
+            start = end
+            while start > 0 and query[start - 1] not in self.WORD_BREAKS:
+                start -= 1
+            word = query[start:]
+        before = query[:start]
+        if before.endswith('#'):
+            return self._results(hash_values, word, start - 1, end, prefix='#')
+
+        values_so_far = _VALUES_SO_FAR.search(before)
+        if values_so_far is not None:
+            field = self._field_ending(fields, before[:values_so_far.start()].rstrip())
+            if field is None or field[1] is None:
+                return None
+            return self._results(field[1], word, start, end)
+        if braced or not word:
+            return None
+        names = [(name, 'field') for name, _ in fields.values()]
+        # the words typed so far of a name made up of several, e.g. "fix v"
+        for phrase_start in range(max(0, start - self.MAX_NAME_LENGTH), start):
+            if query[phrase_start - 1:phrase_start] in ('', ' ') and query[phrase_start] != ' ':
+                phrase = query[phrase_start:].lower()
+                if any(name.lower().startswith(phrase) for name, _ in names):
+                    start, word = phrase_start, query[phrase_start:]
+                    break
+        # a free word may as well be text to search for, so only names starting with it are sure completions
+        return self._results(names, word, start, end, suffix=': ', braces=False, containing=False)
+
+    def _field_ending(self, fields, text: str):
+        if text.endswith('}') and '{' in text:
+            return fields.get(text[text.rfind('{') + 1:-1].lower())
+        lowered = text.lower()
+        for name in sorted(fields, key=len, reverse=True):
+            if lowered.endswith(name) and (len(name) == len(text) or text[-len(name) - 1] in self.WORD_BREAKS):
+                return fields[name]
+        return None
+
+    def _results(self, candidates, word: str, start: int, end: int, prefix: str = None, suffix: str = ' ',
+                 braces: bool = True, containing: bool = True) -> Optional[list]:
+        typed = word.lower()
+        starting = sorted((c for c in candidates if c[0].lower().startswith(typed)), key=lambda c: (len(c[0]), c[0]))
+        if containing:
+            starting += [c for c in candidates if typed in c[0].lower() and not c[0].lower().startswith(typed)]
+        results = []
+        seen = set()
+        for text, description in starting:
+            if text in seen:
+                continue
+            seen.add(text)
+            option = '{' + text + '}' if braces and any(c in self.WORD_BREAKS for c in text) else text
+            results.append(self.result_type(
+                full_option=(prefix or '') + option + suffix,
+                prefix=prefix,
+                suffix=suffix,
+                option=option,
+                start=start,
+                end=end,
+                description=description))
+            if len(results) >= self.max_results:
+                break
+        return results if results else None
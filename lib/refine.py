@@ -0,0 +1,51 @@
+import time
+from typing import Optional, Sequence
+
+
+class SuggestionRefiner:
+    """
+    Narrows down the suggestions last received from the server while the user keeps typing the word they complete,
+    so that only the first keystroke of a word needs a round trip.
+    """
+
+    # typing one of these ends the completed word, the server has to make new suggestions then
+    WORD_BREAKS: str = ' \t:{}()#,"'
+
+    def __init__(self, max_age: float, clock=time.monotonic):
+        self.max_age = max_age
+        self.clock = clock
+        self._last = None
+
+    def remember(self, actual_user_input: str, results: Sequence) -> None:
+        self._last = (actual_user_input, results, self.clock())
+
+    def refine(self, actual_user_input: str) -> Optional[list]:
+        last = self._last
+        if last is None or self.max_age <= 0:
+            return None
+        base_input, base_results, received_at = last
+        if self.clock() - received_at > self.max_age:
+            return None
+        if len(actual_user_input) <= len(base_input) or not actual_user_input.startswith(base_input):
+            return None
+        if any(c in self.WORD_BREAKS for c in actual_user_input[len(base_input):]):
+            return None
+
+        end = len(actual_user_input)
+        refined = []
+        for result in base_results:
+            # only suggestions completing the word at the caret can be narrowed down
+            if result.end != len(base_input):
+                continue
+            word = actual_user_input[result.start:].lower()
+            if word not in result.full_option.lower():
+                continue
+            refined.append(type(result)(
+                full_option=result.full_option,
+                prefix=result.prefix,
+                suffix=result.suffix,
+                option=result.option,
+                start=result.start,
+                end=end,
+                description=result.description))
+        return refined if refined else None
@@ -0,0 +1,83 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import Hashable
+
+from .transport import Cancelled, current_cancel_token
+from .worker import wait
+
+
+class _Call(object):
+    def __init__(self):
+        self.future = concurrent.futures.Future()
+
+
+class SingleFlight:
+    """
+    Lets concurrent callers asking for the same key share one outstanding call and its result. Threads calling
+    do and coroutines awaiting do_async share the calls as well.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: Hashable):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            return call, True
+
+    def do(self, key: Hashable, fn, *args):
+        while True:
+            call, leader = self._join(key)
+            if leader:
+                try:
+                    result = fn(*args)
+                except BaseException as exc:
+                    self._finish(key, call, error=exc)
+                    raise
+                self._finish(key, call, result=result)
+                return result
+            token = current_cancel_token()
+            try:
+                return wait(call.future, lambda: token is not None and token.cancelled)
+            except Cancelled:
+                if token is not None and token.cancelled:
+                    raise
+            # the caller leading the call is no longer interested, the others still are
+
+    async def do_async(self, key: Hashable, fn, *args):
+        """
+        Like do, fn returns a coroutine.
+        """
+        while True:
+            call, leader = self._join(key)
+            if leader:
+                try:
+                    result = await fn(*args)
+                except asyncio.CancelledError:
+                    self._finish(key, call, error=Cancelled())
+                    raise
+                except BaseException as exc:
+                    self._finish(key, call, error=exc)
+                    raise
+                self._finish(key, call, result=result)
+                return result
+            try:
+                # cancelling the caller must not cancel the call the others wait for
+                return await asyncio.shield(asyncio.wrap_future(call.future))
+            except Cancelled:
+                pass
+            # the caller leading the call is no longer interested, the others still are
+
+    def _finish(self, key, call, result=None, error=None):
+        with self._lock:
+            del self._calls[key]
+        if error is not None:
+            call.future.set_exception(error)
+        else:
+            call.future.set_result(result)
@@ -0,0 +1,159 @@
+import contextlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict
+from urllib import parse
+
+STAGE_DEBOUNCE: str = 'debounce'
+STAGE_CONNECT: str = 'connect'
+STAGE_TLS: str = 'tls'
+STAGE_TTFB: str = 'ttfb'
+STAGE_BODY: str = 'body'
+STAGE_PARSE: str = 'parse'
+STAGE_ITEMS: str = 'items'
+STAGE_TOTAL: str = 'total'
+
+# endpoint of the stages not belonging to a single request
+ENDPOINT_SUGGEST: str = 'on_suggest'
+
+# readable ids like JT-17 and database ids like 2-17
+_ISSUE_ID_SEGMENT = re.compile(r'(?<=/)\w+-\d+(?=/|$)')
+
+
+def endpoint_of(url: str) -> str:
+    """
+    Returns the path of the url, with the issue ids in it replaced by {id} so that the requests of all issues share
+    one endpoint.
+    """
+    return _ISSUE_ID_SEGMENT.sub('{id}', parse.urlsplit(url).path) or '/'
+
+
+class Histogram:
+    """
+    Durations of the most recent samples, the percentiles are computed from those.
+    """
+
+    def __init__(self, window: int):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.count += 1
+
+    @staticmethod
+    def percentile(ordered, percent: float) -> float:
+        # nearest rank
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(percent / 100 * len(ordered)) - 1))]
+
+    def summary(self) -> Dict[str, float]:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {'count': self.count}
+        return {
+            'count': self.count,
+            'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+            'p50_ms': round(self.percentile(ordered, 50) * 1000, 2),
+            'p95_ms': round(self.percentile(ordered, 95) * 1000, 2),
+            'p99_ms': round(self.percentile(ordered, 99) * 1000, 2),
+            'max_ms': round(ordered[-1] * 1000, 2),
+        }
+
+
+class Stats:
+    """
+    Rolling histograms of the time spent in each stage of the requests to one server, per endpoint,
+    along with the amount of responses and bytes received and of the decoded bytes parsed.
+    """
+
+    WINDOW: int = 500
+
+    def __init__(self, window: int = WINDOW, clock=time.perf_counter):
+        self.window = window
+        self.clock = clock
+        self._histograms = {}
+        self._received = {}
+        self._parsed = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, stage: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self._histograms.get((endpoint, stage))
+            if histogram is None:
+                histogram = self._histograms[(endpoint, stage)] = Histogram(self.window)
+            histogram.record(seconds)
+
+    def received(self, endpoint: str, size: int) -> None:
+        with self._lock:
+            responses, received_bytes = self._received.get(endpoint, (0, 0))
+            self._received[endpoint] = (responses + 1, received_bytes + size)
+
+    def parsed(self, endpoint: str, size: int) -> None:
+        with self._lock:
+            self._parsed[endpoint] = self._parsed.get(endpoint, 0) + size
+
+    @contextlib.contextmanager
+    def timed(self, endpoint: str, stage: str):
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.record(endpoint, stage, self.clock() - started)
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            result = {}
+            for (endpoint, stage), histogram in sorted(self._histograms.items()):
+                result.setdefault(endpoint, {'stages': {}})['stages'][stage] = histogram.summary()
+            for endpoint, (responses, received_bytes) in self._received.items():
+                result.setdefault(endpoint, {'stages': {}}).update(responses=responses, bytes=received_bytes)
+            for endpoint, parsed_bytes in self._parsed.items():
+                result.setdefault(endpoint, {'stages': {}})['parsed_bytes'] = parsed_bytes
+            return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._received.clear()
+            self._parsed.clear()
+
+
+class StatsDump:
+    """
+    Writes the stats returned by snapshot as json to path every interval seconds in a background thread.
+    """
+
+    def __init__(self, path: str, snapshot: Callable[[], dict], interval: float, dbg):
+        self.path = path
+        self.snapshot = snapshot
+        self.interval = interval
+        self.dbg = dbg
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="youtrack-stats-dump", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except Exception as exc:
+                self.dbg("writing stats failed: " + str(exc))
+
+    def write(self):
+        stats = {'written_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'servers': self.snapshot()}
+        # readers never see a partially written file
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, indent=2)
+        os.replace(temp_path, self.path)
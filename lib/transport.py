@@ -0,0 +1,515 @@
+import abc
+import asyncio
+import base64
+import contextlib
+import contextvars
+import functools
+import http.client
+import io
+import socket
+import ssl
+import threading
+import time
+import urllib.error
+import zlib
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+from urllib import parse, request
+
+from .health import ServerHealth, parse_retry_after
+from .stats import STAGE_BODY, STAGE_CONNECT, STAGE_TLS, STAGE_TTFB, Stats, endpoint_of
+
+
+class Cancelled(Exception):
+    pass
+
+
+# context variable rather than thread local, so that coroutines on the event loop have a token of their own
+_current_token = contextvars.ContextVar('cancel_token', default=None)
+
+
+def current_cancel_token():
+    return _current_token.get()
+
+
+class CancelToken:
+    """
+    Aborts the requests sent within its scope, e.g. once Keypirinha no longer needs their result.
+    should_cancel is polled in addition to cancel being called, e.g. should_terminate of the plugin.
+    """
+
+    def __init__(self, should_cancel=None):
+        self.should_cancel = should_cancel
+        self._cancelled = False
+        # bytes of the response bodies received within its scope
+        self.received = 0
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled or (self.should_cancel is not None and self.should_cancel())
+
+    @contextlib.contextmanager
+    def scope(self):
+        previous = current_cancel_token()
+        _current_token.set(self)
+        try:
+            yield self
+        finally:
+            _current_token.set(previous)
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+            connections = list(self._connections)
+        for conn in connections:
+            # unblocks the thread waiting for the response, it closes the connection afterwards
+            try:
+                if conn.sock is not None:
+                    conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def register(self, conn):
+        with self._lock:
+            if self.cancelled:
+                raise Cancelled()
+            self._connections.add(conn)
+
+    def unregister(self, conn):
+        with self._lock:
+            self._connections.discard(conn)
+
+
+class Response(object):
+    def __init__(self, status: int, reason: str, headers, body: bytes, received: int = None):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        # bytes received for the body, less than its size if it was compressed
+        self.received = received if received is not None else len(body)
+        # whether the server answered 304 and body is the one stored with the validators
+        self.not_modified = False
+        # kept along with the validators of the body, e.g. its parsed content, None if it has no validators
+        self.memo = None
+
+
+class _Validated(object):
+    def __init__(self, etag: Optional[str], last_modified: Optional[str], body: bytes):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body = body
+        self.memo = {}
+
+
+class ValidatorStore:
+    """
+    The ETag and Last-Modified of the most recent GET responses along with their bodies, so that requesting
+    them again can be answered with 304 Not Modified instead of the body. Beyond max_entries or max_bytes of
+    bodies the ones requested least recently are dropped.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> Optional[_Validated]:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+
+    def put(self, url: str, response: Response) -> None:
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if self.max_entries <= 0 or len(response.body) > self.max_bytes or (etag is None and last_modified is None):
+            return
+        entry = _Validated(etag, last_modified, response.body)
+        response.memo = entry.memo
+        with self._lock:
+            previous = self._entries.pop(url, None)
+            if previous is not None:
+                self._bytes -= len(previous.body)
+            self._entries[url] = entry
+            self._bytes += len(entry.body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, dropped = self._entries.popitem(last=False)
+                self._bytes -= len(dropped.body)
+
+
+class ContentDecoder:
+    """
+    Decompresses a gzip encoded body piece by piece while it is received, other bodies are passed through.
+    """
+
+    READ_SIZE: int = 65536
+
+    def __init__(self, content_encoding: Optional[str]):
+        encoding = (content_encoding or '').strip().lower()
+        if encoding in ('gzip', 'x-gzip'):
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding in ('', 'identity'):
+            self._decompressor = None
+        else:
+            raise http.client.HTTPException('Unsupported Content-Encoding "{}"'.format(content_encoding))
+        self.received = 0
+        self._pieces = []
+
+    def feed(self, data: bytes) -> None:
+        self.received += len(data)
+        self._pieces.append(self._decompressor.decompress(data) if self._decompressor is not None else data)
+
+    def body(self) -> bytes:
+        if self._decompressor is not None:
+            self._pieces.append(self._decompressor.flush())
+        return b''.join(self._pieces)
+
+
+class Transport(abc.ABC):
+    """
+    Common interface of the http transports used by the rest and the legacy api.
+    Implementations only need to provide _send, status handling and the health of the server are shared.
+    request_async sends from a thread of the default executor of the event loop unless _send_async is provided
+    as well.
+    """
+
+    # statuses telling that the server is down or overloaded rather than that the request is wrong
+    UNAVAILABLE_STATUSES = (429, 500, 502, 503, 504)
+    REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+    MAX_REDIRECTS: int = 5
+    VALIDATED_RESPONSES: int = 100
+    VALIDATED_BYTES: int = 4 * 1024 * 1024
+
+    def __init__(self, stats: Stats = None, health: ServerHealth = None):
+        self.stats = stats if stats is not None else Stats()
+        self.health = health if health is not None else ServerHealth()
+        self.validators = ValidatorStore(self.VALIDATED_RESPONSES, self.VALIDATED_BYTES)
+        # whether waiting for a response polls the CancelToken of the caller, so that the request can be sent
+        # right from a thread that has to stay responsive instead of from a worker thread
+        self.polls_cancel_token = False
+
+    def request(self, method: str, url: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None, validate: bool = False) -> Response:
+        """
+        Sends the request, following redirects to the same server. Redirects elsewhere, e.g. from http to https,
+        raise an HTTPError naming their target, the base_url has to be changed to it. The response of a GET
+        request to validate is kept along with its validators, so that the server can answer 304 Not Modified
+        when it is requested again.
+        """
+        for _ in range(self.MAX_REDIRECTS + 1):
+            response = self._request(method, url, body, headers, validate)
+            if response.status not in self.REDIRECT_STATUSES:
+                return response
+            method, url, body = self._redirect(method, url, body, response)
+        raise urllib.error.HTTPError(url, response.status, "Too many redirects", response.headers,
+                                     io.BytesIO(response.body))
+
+    async def request_async(self, method: str, url: str, body: Optional[bytes] = None,
+                            headers: Optional[Dict[str, str]] = None, validate: bool = False) -> Response:
+        """
+        Like request, to be awaited on the event loop.
+        """
+        for _ in range(self.MAX_REDIRECTS + 1):
+            response = await self._request_async(method, url, body, headers, validate)
+            if response.status not in self.REDIRECT_STATUSES:
+                return response
+            method, url, body = self._redirect(method, url, body, response)
+        raise urllib.error.HTTPError(url, response.status, "Too many redirects", response.headers,
+                                     io.BytesIO(response.body))
+
+    def _redirect(self, method: str, url: str, body: Optional[bytes], response: Response):
+        location = parse.urljoin(url, response.headers.get('Location') or '')
+        if not self._is_own_url(location):
+            raise urllib.error.HTTPError(url, response.status, "Redirected to {}, check base_url".format(location),
+                                         response.headers, io.BytesIO(response.body))
+        if response.status == 303 or (response.status in (301, 302) and method == 'POST'):
+            return 'GET', location, None
+        return method, location, body
+
+    def _request(self, method: str, url: str, body: Optional[bytes], headers: Optional[Dict[str, str]],
+                 validate: bool) -> Response:
+        token = current_cancel_token()
+        self._wait(self.health.acquire(), token)
+        headers, validated = self._prepare(method, url, headers, validate)
+        try:
+            response = self._send(method, url, body, headers)
+        except OSError:
+            self.health.failed()
+            raise
+        return self._complete(method, url, response, validated, token, validate)
+
+    async def _request_async(self, method: str, url: str, body: Optional[bytes],
+                             headers: Optional[Dict[str, str]], validate: bool) -> Response:
+        token = current_cancel_token()
+        wait = self.health.acquire()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        headers, validated = self._prepare(method, url, headers, validate)
+        try:
+            response = await self._send_async(method, url, body, headers)
+        except OSError:
+            self.health.failed()
+            raise
+        return self._complete(method, url, response, validated, token, validate)
+
+    def _prepare(self, method: str, url: str, headers: Optional[Dict[str, str]], validate: bool):
+        headers = dict(headers or {})
+        headers.setdefault('Accept-Encoding', 'gzip')
+        validated = self.validators.get(url) if validate and method == 'GET' else None
+        if validated is not None:
+            if validated.etag is not None:
+                headers['If-None-Match'] = validated.etag
+            if validated.last_modified is not None:
+                headers['If-Modified-Since'] = validated.last_modified
+        return headers, validated
+
+    def _complete(self, method: str, url: str, response: Response, validated: Optional[_Validated], token,
+                  validate: bool):
+        if token is not None:
+            token.received += response.received
+        if response.status in self.UNAVAILABLE_STATUSES:
+            self.health.failed(parse_retry_after(response.headers.get('Retry-After')))
+        else:
+            self.health.succeeded()
+        if response.status >= 400:
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers,
+                                         io.BytesIO(response.body))
+        if response.status == 304 and validated is not None:
+            response.status, response.body = 200, validated.body
+            response.not_modified = True
+            response.memo = validated.memo
+        elif validate and method == 'GET' and response.status == 200:
+            self.validators.put(url, response)
+        return response
+
+    @abc.abstractmethod
+    def _send(self, method: str, url: str, body: Optional[bytes], headers: Dict[str, str]) -> Response:
+        """
+        Sends the request once and returns the response as received, redirects and statuses included.
+        """
+
+    async def _send_async(self, method: str, url: str, body: Optional[bytes], headers: Dict[str, str]) -> Response:
+        # the CancelToken of the caller is passed along with the context
+        send = functools.partial(contextvars.copy_context().run, self._send, method, url, body, headers)
+        return await asyncio.get_event_loop().run_in_executor(None, send)
+
+    def _is_own_url(self, url: str) -> bool:
+        return False
+
+    @staticmethod
+    def _wait(seconds: float, token):
+        deadline = time.monotonic() + seconds
+        while seconds > 0:
+            time.sleep(min(seconds, 0.05))
+            if token is not None and token.cancelled:
+                raise Cancelled()
+            seconds = deadline - time.monotonic()
+
+    def close(self):
+        pass
+
+
+class _PooledHTTPConnection(http.client.HTTPConnection):
+    """
+    Waits connect_timeout for the connection but read_timeout for responses.
+    """
+
+    def __init__(self, host, port, pool):
+        super().__init__(host, port, timeout=pool.connect_timeout)
+        self.pool = pool
+
+    def connect(self):
+        super().connect()
+        self.sock.settimeout(self.pool.read_timeout)
+
+
+class _PooledHTTPSConnection(http.client.HTTPSConnection):
+    """
+    Offers the tls session of the previous connection to the server so that the handshake can be abbreviated.
+    """
+
+    def __init__(self, host, port, pool):
+        super().__init__(host, port, timeout=pool.connect_timeout, context=pool.ssl_context)
+        self.pool = pool
+        self.handshake_time = 0.0
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        server_hostname = self._tunnel_host if self._tunnel_host else self.host
+        started = self.pool.stats.clock()
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=server_hostname,
+                                              session=self.pool.tls_session)
+        self.handshake_time = self.pool.stats.clock() - started
+        self.sock.settimeout(self.pool.read_timeout)
+
+
+class ConnectionPool(Transport):
+    """
+    Keeps alive up to max_size connections to a single YouTrack server.
+    """
+
+    DEFAULT_MAX_SIZE: int = 4
+    DEFAULT_IDLE_TIMEOUT: float = 60.0
+    DEFAULT_CONNECT_TIMEOUT: float = 5.0
+    DEFAULT_READ_TIMEOUT: float = 15.0
+
+    # a kept alive connection may have been closed by the server in the meantime
+    RECONNECT_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError,
+                        ConnectionAbortedError)
+
+    def __init__(self, base_url: str, dbg, max_size: int = DEFAULT_MAX_SIZE,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT, stats: Stats = None, health: ServerHealth = None):
+        super().__init__(stats, health)
+        if not base_url:
+            raise ValueError("base_url is missing")
+        parts = parse.urlsplit(base_url)
+        self.scheme = parts.scheme.lower()
+        if self.scheme not in ('http', 'https'):
+            raise ValueError('Unsupported scheme "{}" in base_url {}'.format(parts.scheme, base_url))
+        self.dbg = dbg
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.scheme == 'https' else 80)
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.ssl_context = ssl.create_default_context() if self.scheme == 'https' else None
+        self.tls_session = None
+        self.proxy, self.proxy_headers = self._find_proxy()
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _find_proxy(self):
+        """
+        Returns the host and port of the proxy to use, if any, along with the headers authenticating with it.
+        """
+        proxy_url = request.getproxies().get(self.scheme)
+        if not proxy_url or request.proxy_bypass(self.host):
+            return None, {}
+        if '://' not in proxy_url:
+            proxy_url = 'http://' + proxy_url
+        proxy = parse.urlsplit(proxy_url)
+        headers = {}
+        if proxy.username is not None:
+            credentials = parse.unquote(proxy.username) + ':' + parse.unquote(proxy.password or '')
+            headers['Proxy-Authorization'] = 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+        return (proxy.hostname, proxy.port or 8080), headers
+
+    def _is_own_url(self, url: str) -> bool:
+        parts = parse.urlsplit(url)
+        return parts.scheme.lower() == self.scheme and parts.hostname == self.host \
+            and (parts.port or (443 if self.scheme == 'https' else 80)) == self.port
+
+    def _request_target(self, url: str) -> str:
+        parts = parse.urlsplit(url)
+        if parts.hostname != self.host or (parts.port or self.port) != self.port:
+            raise ValueError("{} does not belong to {}://{}:{}".format(url, self.scheme, self.host, self.port))
+        if self.proxy and self.scheme == 'http':
+            return url
+        return parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+
+    def _connect(self):
+        host, port = self.proxy if self.proxy else (self.host, self.port)
+        if self.scheme == 'http':
+            return _PooledHTTPConnection(host, port, pool=self)
+        conn = _PooledHTTPSConnection(host, port, pool=self)
+        if self.proxy:
+            conn.set_tunnel(self.host, self.port, headers=self.proxy_headers)
+        return conn
+
+    def _acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            while self._idle and now - self._idle[0][1] > self.idle_timeout:
+                self._idle.popleft()[0].close()
+            if self._idle:
+                return self._idle.pop()[0], True
+        return self._connect(), False
+
+    def _release(self, conn, will_close: bool):
+        if will_close or conn.sock is None:
+            conn.close()
+            return
+        session = getattr(conn.sock, 'session', None)
+        if session is not None and session.has_ticket:
+            self.tls_session = session
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+
+    def _exchange(self, conn, endpoint, method, target, body, headers):
+        clock = self.stats.clock
+        if conn.sock is None:
+            started = clock()
+            conn.connect()
+            # name resolution is part of connecting, the tls handshake is recorded on its own
+            handshake_time = getattr(conn, 'handshake_time', None)
+            self.stats.record(endpoint, STAGE_CONNECT, clock() - started - (handshake_time or 0.0))
+            if handshake_time is not None:
+                self.stats.record(endpoint, STAGE_TLS, handshake_time)
+        started = clock()
+        conn.request(method, target, body=body, headers=headers)
+        resp = conn.getresponse()
+        first_byte = clock()
+        self.stats.record(endpoint, STAGE_TTFB, first_byte - started)
+        decoder = ContentDecoder(resp.getheader('Content-Encoding'))
+        while True:
+            piece = resp.read(ContentDecoder.READ_SIZE)
+            if not piece:
+                break
+            decoder.feed(piece)
+        content = decoder.body()
+        self.stats.record(endpoint, STAGE_BODY, clock() - first_byte)
+        self.stats.received(endpoint, decoder.received)
+        return Response(resp.status, resp.reason, resp.headers, content, decoder.received), resp.will_close
+
+    def _send(self, method, url, body, headers):
+        target = self._request_target(url)
+        if self.proxy and self.scheme == 'http':
+            headers = dict(headers, **self.proxy_headers)
+        endpoint = endpoint_of(url)
+        token = current_cancel_token()
+        while not self._slots.acquire(timeout=0.05):
+            if token is not None and token.cancelled:
+                raise Cancelled()
+        try:
+            conn, reused = self._acquire()
+            while True:
+                sending = conn
+                try:
+                    if token is not None:
+                        token.register(sending)
+                    response, will_close = self._exchange(conn, endpoint, method, target, body, headers)
+                    break
+                except self.RECONNECT_ERRORS:
+                    conn.close()
+                    if token is not None and token.cancelled:
+                        raise Cancelled()
+                    if not reused:
+                        raise
+                    self.dbg("kept alive connection to {} was closed, reconnecting".format(self.host))
+                    conn, reused = self._connect(), False
+                except BaseException as exc:
+                    conn.close()
+                    if token is not None and token.cancelled and not isinstance(exc, Cancelled):
+                        raise Cancelled() from exc
+                    raise
+                finally:
+                    if token is not None:
+                        token.unregister(sending)
+            self._release(conn, will_close)
+            return response
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                self._idle.pop()[0].close()
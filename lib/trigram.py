@@ -0,0 +1,95 @@
+import threading
+from collections import OrderedDict
+from typing import FrozenSet, List, Sequence
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    """
+    Returns the trigrams of the lowercase words of text, padded so that the beginning of a word counts most.
+    """
+    grams = set()
+    for word in text.lower().split():
+        padded = '  ' + word + ' '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+class TrigramIndex:
+    """
+    In-memory index of the trigrams of the ids and summaries of the issues seen, for ranking issues by how much of
+    the typed text they contain and for finding them despite typos. Beyond max_entries the issues seen least
+    recently are dropped.
+    """
+
+    MIN_SIMILARITY: float = 0.5
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # issue id -> (issue, trigrams), the least recently seen first
+        self._entries = OrderedDict()
+        self._postings = {}
+        self._lock = threading.Lock()
+
+    def add(self, issues: Sequence) -> None:
+        with self._lock:
+            for issue in issues:
+                entry = self._entries.get(issue.id)
+                if entry is not None and entry[0].summary == issue.summary:
+                    self._entries[issue.id] = (issue, entry[1])
+                    self._entries.move_to_end(issue.id)
+                    continue
+                if entry is not None:
+                    self._remove(issue.id)
+                grams = trigrams(issue.id + ' ' + (issue.summary or ''))
+                self._entries[issue.id] = (issue, grams)
+                for gram in grams:
+                    self._postings.setdefault(gram, set()).add(issue.id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, id: str):
+        _, grams = self._entries.pop(id)
+        for gram in grams:
+            ids = self._postings[gram]
+            ids.discard(id)
+            if not ids:
+                del self._postings[gram]
+
+    def rank(self, text: str, issues: Sequence) -> List:
+        """
+        Sorts the issues by the share of the trigrams of text found in their id and summary, issues sharing the
+        same share keep their order.
+        """
+        query = trigrams(text)
+        if not query:
+            return list(issues)
+        with self._lock:
+            entries = [self._entries.get(issue.id) for issue in issues]
+        similarities = []
+        for issue, entry in zip(issues, entries):
+            grams = entry[1] if entry is not None and entry[0].summary == issue.summary \
+                else trigrams(issue.id + ' ' + (issue.summary or ''))
+            similarities.append(len(query & grams))
+        order = sorted(range(len(issues)), key=lambda index: -similarities[index])
+        return [issues[index] for index in order]
+
+    def search(self, text: str, limit: int) -> List:
+        """
+        Returns the issues containing at least MIN_SIMILARITY of the trigrams of text, the most similar first and
+        the shorter ones first among equally similar ones.
+        """
+        query = trigrams(text)
+        if not query:
+            return []
+        with self._lock:
+            counts = {}
+            for gram in query:
+                for id in self._postings.get(gram, ()):
+                    counts[id] = counts.get(id, 0) + 1
+            matches = [(count / len(query), len(self._entries[id][1]), self._entries[id][0])
+                       for id, count in counts.items() if count / len(query) >= self.MIN_SIMILARITY]
+        matches.sort(key=lambda match: (-match[0], match[1]))
+        return [issue for _, _, issue in matches[:limit]]
+
+    def __len__(self):
+        return len(self._entries)
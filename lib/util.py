@@ -1,16 +1,24 @@
-from xml.dom import minidom
+import io
+from typing import Iterator, Sequence
+from xml.etree import ElementTree
 
 
-def get_as_xml(response: bytes):
-    response = response.decode(encoding="utf-8", errors="strict")
-    dom = minidom.parseString(response)
-    return dom
-
-def get_value(node, node_name):
-    return next((child.childNodes[0].nodeValue for child in node.childNodes if child.nodeName == node_name), None)
-
-def get_child_att_value(node, node_name, att_name):
-    return next((child.getAttribute(att_name) for child in node.childNodes if child.nodeName == node_name), None)
+def iter_completed_elements(response: bytes, root_name: str, names: Sequence[str], depth: int) -> Iterator[ElementTree.Element]:
+    """
+    Yields the elements with one of the names at the given depth below the root as soon as they have been parsed
+    and drops them afterwards, so that only one of them is kept in memory at a time.
+    """
+    path = []
+    for event, element in ElementTree.iterparse(io.BytesIO(response), events=('start', 'end')):
+        if event == 'start':
+            if not path and element.tag != root_name:
+                return
+            path.append(element)
+            continue
+        path.pop()
+        if len(path) == depth and element.tag in names:
+            yield element
+            path[-1].remove(element)
 
 class AttrDict(dict):
     def __init__(self, *args, **kwargs):
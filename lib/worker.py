@@ -0,0 +1,86 @@
+import concurrent.futures
+import threading
+
+from .transport import CancelToken, Cancelled, current_cancel_token
+
+POLL_INTERVAL: float = 0.02
+
+
+def submit(executor, fn, *args):
+    """
+    Runs fn on the executor within the scope of a new CancelToken, returns the future and the token.
+    """
+    token = CancelToken()
+
+    def run():
+        with token.scope():
+            return fn(*args)
+
+    return executor.submit(run), token
+
+
+def wait(future, cancelled):
+    """
+    Returns the result of the concurrent future, polling cancelled while waiting for it. Cancelled is raised as
+    soon as cancelled returns True, the future is left to the caller then.
+    """
+    # the call may fail with a TimeoutError itself, so the future is not waited for with future.result(timeout)
+    while not concurrent.futures.wait([future], timeout=POLL_INTERVAL).done:
+        if cancelled():
+            raise Cancelled()
+    try:
+        return future.result()
+    except concurrent.futures.CancelledError:
+        raise Cancelled() from None
+
+
+def run_cancellable(executor, should_terminate, fn, *args, inline: bool = False):
+    """
+    Runs fn on a worker thread and waits for its result while polling should_terminate. When it fires the
+    requests of fn are aborted and Cancelled is raised right away.
+    With inline fn runs on the calling thread instead, its requests have to poll the CancelToken themselves.
+    Calls made within the scope of a CancelToken already run inline, that token aborts them.
+    """
+    if current_cancel_token() is not None:
+        return fn(*args)
+    if inline:
+        with CancelToken(should_terminate).scope():
+            return fn(*args)
+    future, token = submit(executor, fn, *args)
+    try:
+        return wait(future, should_terminate)
+    except Cancelled:
+        token.cancel()
+        future.cancel()
+        raise
+
+
+class PeriodicTask:
+    """
+    Runs fn right away and then every interval seconds in a background thread, failed runs are retried after
+    retry_interval seconds.
+    """
+
+    def __init__(self, name: str, fn, interval: float, dbg, retry_interval: float = 60.0):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.retry_interval = min(retry_interval, interval)
+        self.dbg = dbg
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name=self.name, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.fn()
+                wait = self.interval
+            except Exception as exc:
+                self.dbg("{} failed: {}".format(self.name, exc))
+                wait = self.retry_interval
+            self._stop.wait(wait)
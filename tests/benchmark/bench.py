@@ -0,0 +1,157 @@
+"""
+Replays keystroke sequences through YouTrack.on_suggest against a local stand-in YouTrack server and reports
+how long it takes from a keystroke to its suggestions, how many requests a session sends, how many bytes it
+receives and how many decoded bytes the plugin has to parse.
+
+    python tests/benchmark/bench.py --latency 0.1 --sessions 5
+    python tests/benchmark/bench.py --legacy --json bench_output.txt
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'tests', 'fakes'))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import keypirinha  # noqa: E402 the fake from tests/fakes
+from fake_youtrack import FakeYouTrack  # noqa: E402
+from youtrack_package import load_plugin_class, load_plugin_module  # noqa: E402
+
+load_plugin_module()
+from youtrack.lib.stats import Histogram  # noqa: E402 importable once the plugin package is loaded
+
+BACKSPACE = '\b'
+
+# (mode, keystrokes) typed one after the other, \b deletes the last character
+SCENARIOS = [
+    ('filter', 'state: open'),
+    ('filter', 'stat' + BACKSPACE * 3 + 'tatus: fixed'),
+    ('filter', 'prio' + BACKSPACE * 4 + 'prio'),
+    ('issues', 'crash startup'),
+    ('issues', 'slow' + BACKSPACE * 4 + 'search'),
+    ('issues', 'proxy'),
+    ('issues', 'JT-17'),
+]
+
+
+def typed_inputs(keystrokes: str):
+    text = ''
+    for key in keystrokes:
+        text = text[:-1] if key == BACKSPACE else text + key
+        yield text
+
+
+def percentile(values, percent):
+    # the same percentile the performance stats entry shows
+    if not values:
+        return float('nan')
+    return Histogram.percentile(sorted(values), percent)
+
+
+def create_settings(base_url: str, args) -> str:
+    lines = ['[server/bench]', 'base_url = ' + base_url, 'api_token = perm:bench',
+             'legacy_api = ' + str(args.legacy)]
+    lines.extend(option.replace('=', ' = ', 1) for option in args.server_option)
+    return '\n'.join(lines) + '\n'
+
+
+def run_session(plugin_class, youtrack: FakeYouTrack, args):
+    if not args.keep_cache:
+        keypirinha._cache_root = tempfile.mkdtemp(prefix='kp-cache-')
+    plugin_class.settings_text = create_settings(youtrack.base_url, args)
+    plugin = plugin_class()
+    plugin.on_start()
+    plugin.on_catalog()
+    items = {
+        'filter': next(item for item in plugin.catalog if item.category() == plugin_class.ITEMCAT_FILTER),
+        'issues': next(item for item in plugin.catalog if item.category() == plugin_class.ITEMCAT_ISSUES),
+    }
+
+    latencies = []
+    keystrokes = 0
+    for mode, sequence in SCENARIOS:
+        runs = []
+        for text in typed_inputs(sequence):
+            runs.append(plugin.suggest(text, [items[mode]]))
+            keystrokes += 1
+            time.sleep(args.typing_interval)
+        # the user pauses after the sequence, so its last keystroke gets answered
+        for run in runs:
+            run.join(args.timeout)
+        for run in runs:
+            if run.error is not None:
+                print('on_suggest failed for {!r}: {!r}'.format(run.user_input, run.error), file=sys.stderr)
+            delivered = [at for at, _ in run.suggestions
+                         if run.terminated_at is None or at <= run.terminated_at]
+            if delivered:
+                latencies.append(delivered[0] - run.started_at)
+        plugin._current_run = None
+
+    stats = plugin.stats_snapshot()
+    plugin.shutdown()
+    return keystrokes, latencies, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=3, help='sessions to replay, each with a fresh plugin')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds the server waits before answering')
+    parser.add_argument('--issues', type=int, default=200, help='issues known to the server')
+    parser.add_argument('--description-size', type=int, default=2000, help='characters per issue description')
+    parser.add_argument('--typing-interval', type=float, default=0.12, help='seconds between keystrokes')
+    parser.add_argument('--timeout', type=float, default=30, help='seconds to wait for a suggestion')
+    parser.add_argument('--keep-cache', action='store_true',
+                        help='keep the package cache dir between sessions, like restarting Keypirinha does')
+    parser.add_argument('--legacy', action='store_true', help='use the legacy api')
+    parser.add_argument('--server-option', action='append', default=[], metavar='KEY=VALUE',
+                        help='additional option of the [server/bench] section, may be repeated')
+    parser.add_argument('--json', metavar='FILE', help='also write the report as json to FILE')
+    args = parser.parse_args()
+
+    plugin_class = load_plugin_class()
+    youtrack = FakeYouTrack(latency=args.latency, issue_count=args.issues,
+                            description_size=args.description_size).start()
+    keystrokes = 0
+    latencies = []
+    parsed_bytes = 0
+    stages = {}
+    try:
+        for _ in range(args.sessions):
+            session_keystrokes, session_latencies, stages = run_session(plugin_class, youtrack, args)
+            keystrokes += session_keystrokes
+            latencies.extend(session_latencies)
+            parsed_bytes += sum(endpoint.get('parsed_bytes', 0)
+                                for server in stages.values() for endpoint in server.values())
+    finally:
+        youtrack.stop()
+
+    report = {
+        'sessions': args.sessions,
+        'keystrokes': keystrokes,
+        'answered_keystrokes': len(latencies),
+        'latency_ms': {name: round(percentile(latencies, percent) * 1000, 2)
+                       for name, percent in (('p50', 50), ('p95', 95), ('p99', 99))},
+        'requests_per_session': youtrack.requests / args.sessions,
+        # compressed, and nothing for 304 responses
+        'bytes_received_per_session': youtrack.bytes_sent / args.sessions,
+        'bytes_parsed_per_session': parsed_bytes / args.sessions,
+        'stages_of_last_session': stages,
+        'options': vars(args),
+    }
+    print('keystrokes: {keystrokes} ({answered_keystrokes} answered before the next one)'.format(**report))
+    print('keystroke to suggestions: p50 {p50} ms, p95 {p95} ms, p99 {p99} ms'.format(**report['latency_ms']))
+    print('requests per session: {:.1f}'.format(report['requests_per_session']))
+    print('bytes received per session: {:.0f}'.format(report['bytes_received_per_session']))
+    print('bytes parsed per session: {:.0f}'.format(report['bytes_parsed_per_session']))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
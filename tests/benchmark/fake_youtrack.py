@@ -0,0 +1,220 @@
+"""
+Local stand-in for a YouTrack server answering from recorded fixtures, with configurable latency and payload size.
+"""
+import gzip
+import http.server
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from urllib.parse import parse_qs, urlsplit
+from xml.sax.saxutils import escape, quoteattr
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+TESTS_DIR = os.path.dirname(os.path.dirname(__file__))
+WORD_BREAKS = ' \t:{}()#,"'
+CUSTOM_FIELDS = [
+    {'name': 'State', 'fieldType': {'valueType': 'state'},
+     'instances': [{'bundle': {'values': [{'name': 'Open'}, {'name': 'In Progress'}, {'name': 'Fixed'}]}}]},
+    {'name': 'Priority', 'fieldType': {'valueType': 'enum'},
+     'instances': [{'bundle': {'values': [{'name': 'Critical'}, {'name': 'Major'}, {'name': 'Normal'}]}}]},
+    {'name': 'Assignee', 'fieldType': {'valueType': 'user[1]'}, 'instances': []},
+]
+
+
+def load_fixture(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class FakeYouTrack:
+
+    def __init__(self, latency: float = 0.0, issue_count: int = None, description_size: int = None):
+        self.latency = latency
+        self.suggestions = json.loads(load_fixture(os.path.join(FIXTURES_DIR, 'search_assist.json')))['suggestions']
+        self.intellisense = load_fixture(os.path.join(TESTS_DIR, 'intellisense_result.xml'))
+        self.issues = self._scale_issues(json.loads(load_fixture(os.path.join(FIXTURES_DIR, 'issues.json'))),
+                                         issue_count, description_size)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self.server = None
+
+    @staticmethod
+    def _scale_issues(recorded, issue_count, description_size):
+        issue_count = issue_count if issue_count is not None else len(recorded)
+        issues = []
+        for i in range(issue_count):
+            issue = dict(recorded[i % len(recorded)])
+            issue['idReadable'] = 'JT-{}'.format(i + 1)
+            issue['updated'] = recorded[0]['updated'] + i * 60000
+            if description_size is not None:
+                description = issue['description']
+                issue['description'] = (description * (description_size // len(description) + 1))[:description_size]
+            issues.append(issue)
+        return issues
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:{}'.format(self.server.server_port)
+
+    def start(self):
+        fake = self
+
+        class Handler(YouTrackHandler):
+            youtrack = fake
+
+        self.server = _Server(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = 0
+            self.bytes_sent = 0
+
+    def count(self, body: bytes):
+        with self.lock:
+            self.requests += 1
+            self.bytes_sent += len(body)
+
+    def suggest(self, query: str, caret: int):
+        start = caret
+        while start > 0 and query[start - 1] not in WORD_BREAKS:
+            start -= 1
+        word = query[start:caret].lower()
+        suggestions = []
+        for suggestion in self.suggestions:
+            if word in suggestion['option'].lower():
+                suggestion = dict(suggestion, completionStart=start, completionEnd=caret)
+                suggestions.append(suggestion)
+        return {'$type': 'SearchSuggestions', 'suggestions': suggestions}
+
+    def find_issues(self, query: str):
+        if query.startswith('issue id:'):
+            ids = [id.strip() for id in query[len('issue id:'):].split(',')]
+            return [issue for issue in self.issues if issue['idReadable'] in ids]
+        words = [word.lower() for word in query.split() if not any(c in word for c in ':#{}')]
+        return [issue for issue in self.issues
+                if all(word in (issue['idReadable'] + ' ' + issue['summary'] + ' ' + issue['description']).lower()
+                       for word in words)]
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # the plugin drops connections of requests it no longer needs
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class YouTrackHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    youtrack: FakeYouTrack = None
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, body: bytes, content_type: str, status: int = 200):
+        time.sleep(self.youtrack.latency)
+        etag = '"{:08x}"'.format(zlib.crc32(body))
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            # counted before answering, the client may look at the stats as soon as it has the answer
+            self.youtrack.count(b'')
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if status == 200:
+            self.send_header('ETag', etag)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=6)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.youtrack.count(body)
+        self.wfile.write(body)
+
+    def send_json(self, obj, status: int = 200):
+        self.send_body(json.dumps(obj).encode('utf-8'), 'application/json', status)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if url.path == '/api/search/assist':
+            request = json.loads(body.decode('utf-8'))
+            self.send_json(self.youtrack.suggest(request['query'], request['caret']))
+        else:
+            self.send_json({'error': 'Not Found'}, 404)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == '/api/issues':
+            self.send_json(self.list_issues(params))
+        elif url.path.startswith('/api/issues/'):
+            self.send_issue(url.path[len('/api/issues/'):], params, legacy=False)
+        elif url.path == '/api/admin/projects':
+            self.send_json([{'shortName': 'JT', 'name': 'Jet Test', 'pinned': True, '$type': 'Project'}])
+        elif url.path == '/api/savedQueries':
+            self.send_json([{'name': 'Crashes', 'query': 'crash', '$type': 'SavedQuery'}])
+        elif url.path == '/api/admin/customFieldSettings/customFields':
+            self.send_json(CUSTOM_FIELDS)
+        elif url.path == '/api/users':
+            self.send_json([{'login': 'jdoe', 'fullName': 'John Doe', 'banned': False, '$type': 'User'}])
+        elif url.path == '/api/tags':
+            self.send_json([{'name': 'Star', '$type': 'Tag'}])
+        elif url.path == '/rest/project/all':
+            self.send_body(b'<projects><project name="Jet Test" shortName="JT"/></projects>', 'application/xml')
+        elif url.path.startswith('/rest/issue/') and url.path != '/rest/issue/intellisense/':
+            self.send_issue(url.path[len('/rest/issue/'):], params, legacy=True)
+        elif url.path == '/rest/issue/intellisense/':
+            self.send_body(self.youtrack.intellisense, 'application/xml')
+        elif url.path == '/rest/issue':
+            self.send_body(self.list_legacy_issues(params), 'application/xml')
+        else:
+            self.send_json({'error': 'Not Found'}, 404)
+
+    def send_issue(self, id, params, legacy):
+        issue = next((issue for issue in self.youtrack.issues if issue['idReadable'] == id), None)
+        if issue is None:
+            self.send_json({'error': 'Not Found'}, 404)
+        elif legacy:
+            self.send_body(self.legacy_issues_xml([issue], root=None), 'application/xml')
+        else:
+            fields = [field for field in params.get('fields', 'idReadable').split(',') if '(' not in field]
+            self.send_json(dict({field: issue.get(field) for field in fields}, **{'$type': 'Issue'}))
+
+    def list_issues(self, params):
+        issues = self.youtrack.find_issues(params.get('query', ''))
+        skip = int(params.get('$skip', 0))
+        top = int(params.get('$top', 42))
+        fields = [field for field in params.get('fields', 'idReadable').split(',') if '(' not in field]
+        return [dict({field: issue.get(field) for field in fields}, **{'$type': 'Issue'})
+                for issue in issues[skip:skip + top]]
+
+    def list_legacy_issues(self, params):
+        issues = self.youtrack.find_issues(params.get('filter', ''))
+        after = int(params.get('after', 0))
+        return self.legacy_issues_xml(issues[after:after + int(params.get('max', 10))], root='issueCompacts')
+
+    @staticmethod
+    def legacy_issues_xml(issues, root):
+        xml = ['<{}>'.format(root)] if root else []
+        for issue in issues:
+            xml.append('<issue id={}>'.format(quoteattr(issue['idReadable'])))
+            for field in ('summary', 'description'):
+                xml.append('<field name="{}"><value>{}</value></field>'.format(field, escape(issue[field])))
+            xml.append('</issue>')
+        if root:
+            xml.append('</{}>'.format(root))
+        return ''.join(xml).encode('utf-8')
@@ -0,0 +1,25 @@
+from lib.cache import ResponseCache
+
+from fakes.clock import FakeClock
+
+
+class TestResponseCache:
+
+    def test_expires_after_ttl(self):
+        clock = FakeClock()
+        fixture = ResponseCache(10, clock=clock)
+        fixture.put('key', [1], ttl=5)
+        clock.now = 4.9
+        assert fixture.get('key') == [1]
+        clock.now = 5
+        assert fixture.get('key') is None
+
+    def test_evicts_least_recently_used(self):
+        fixture = ResponseCache(2)
+        fixture.put('a', 1, ttl=60)
+        fixture.put('b', 2, ttl=60)
+        fixture.get('a')
+        fixture.put('c', 3, ttl=60)
+        assert fixture.get('a') == 1
+        assert fixture.get('b') is None
+        assert fixture.get('c') == 3
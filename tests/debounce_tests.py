@@ -0,0 +1,34 @@
+from lib.debounce import AdaptiveDebouncer
+
+from fakes.clock import FakeClock
+
+
+class TestAdaptiveDebouncer:
+
+    def setup_method(self):
+        self.clock = FakeClock()
+        self.fixture = AdaptiveDebouncer(min_wait=0.05, max_wait=1, clock=self.clock)
+
+    def type_keys(self, gap, count=10):
+        for _ in range(count):
+            self.fixture.keystroke()
+            self.clock.now += gap
+
+    def test_waits_longest_without_typing_history(self):
+        assert self.fixture.wait_time('server') == 1
+
+    def test_waits_for_the_pause_between_keystrokes(self):
+        self.type_keys(0.2)
+        assert abs(self.fixture.wait_time('server') - 0.2) < 0.01
+
+    def test_asks_fast_servers_earlier(self):
+        self.type_keys(0.2)
+        self.fixture.record_round_trip('fast', 0.02)
+        self.fixture.record_round_trip('slow', 0.5)
+        assert abs(self.fixture.wait_time('fast') - 0.1) < 0.01
+        assert abs(self.fixture.wait_time('slow') - 0.2) < 0.01
+
+    def test_ignores_pauses_in_typing(self):
+        self.type_keys(0.2)
+        self.type_keys(5, count=2)
+        assert abs(self.fixture.wait_time('server') - 0.2) < 0.01
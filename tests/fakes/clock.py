@@ -0,0 +1,10 @@
+class FakeClock:
+    """
+    Stand-in for time.monotonic and time.time, the tests move it forward by setting now.
+    """
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
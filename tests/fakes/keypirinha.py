@@ -0,0 +1,329 @@
+"""
+Stand-in for the keypirinha module of Keypirinha's embedded python, enough to drive the plugin outside of
+Keypirinha. Suggestions are simulated like Keypirinha does: every call of on_suggest runs in its own thread
+and gets terminated as soon as the next one starts.
+"""
+import configparser
+import enum
+import os
+import tempfile
+import threading
+import time
+
+_cache_root = tempfile.mkdtemp(prefix="kp-cache-")
+_user_config_dir = tempfile.mkdtemp(prefix="kp-config-")
+_app_settings_text = "[gui]\nmax_results = 100\n"
+
+
+class ItemCategory(enum.IntEnum):
+    KEYWORD = 1
+    FILE = 2
+    URL = 5
+    USER_BASE = 1000
+
+
+class ItemArgsHint(enum.IntEnum):
+    FORBIDDEN = 0
+    ACCEPTED = 1
+    REQUIRED = 2
+
+
+class ItemHitHint(enum.IntEnum):
+    IGNORE = 0
+    NOARGS = 1
+    KEEPALL = 2
+
+
+class Match(enum.IntEnum):
+    ANY = 0
+    FUZZY = 1
+    DEFAULT = 2
+
+
+class Sort(enum.IntEnum):
+    NONE = 0
+    SCORE_DESC = 1
+    LABEL_ASC = 2
+
+
+class Events(enum.IntFlag):
+    NONE = 0
+    APPCONFIG = 1
+    PACKCONFIG = 2
+    NETOPTIONS = 4
+    ACTIVATED = 8
+    APPACTIVATED = 16
+
+
+class Settings:
+    def __init__(self, text: str = ""):
+        self._parser = configparser.ConfigParser(interpolation=None)
+        self._parser.read_string(text)
+
+    def sections(self):
+        return self._parser.sections()
+
+    def keys(self, section=None):
+        section = section or "main"
+        return list(self._parser[section].keys()) if self._parser.has_section(section) else []
+
+    def get(self, key, section=None, fallback=None, unquote=False):
+        section = section or "main"
+        if not self._parser.has_section(section):
+            return fallback
+        return self._parser.get(section, key, fallback=fallback)
+
+    def get_stripped(self, key, section=None, fallback=None):
+        value = self.get(key, section)
+        return fallback if value is None else value.strip()
+
+    def get_bool(self, key, section=None, fallback=None):
+        value = self.get(key, section)
+        if value is None:
+            return fallback
+        return value.strip().lower() in ("1", "y", "yes", "t", "true", "on")
+
+    def _get_number(self, convert, key, section, fallback, min, max):
+        try:
+            value = convert(self.get(key, section))
+        except (TypeError, ValueError):
+            return fallback
+        if (min is not None and value < min) or (max is not None and value > max):
+            return fallback
+        return value
+
+    def get_int(self, key, section=None, fallback=None, min=None, max=None):
+        return self._get_number(int, key, section, fallback, min, max)
+
+    def get_float(self, key, section=None, fallback=None, min=None, max=None):
+        return self._get_number(float, key, section, fallback, min, max)
+
+
+def settings():
+    return Settings(_app_settings_text)
+
+
+def package_cache_dir(package_full_name=None):
+    return os.path.join(_cache_root, package_full_name or "")
+
+
+def user_config_dir():
+    return _user_config_dir
+
+
+class IconHandle:
+    def __init__(self, sources):
+        self.sources = sources
+
+    def free(self):
+        pass
+
+
+class CatalogAction:
+    def __init__(self, name, label, short_desc="", data_bag=None):
+        self._name = name
+        self._label = label
+        self._short_desc = short_desc
+        self._data_bag = data_bag
+
+    def name(self):
+        return self._name
+
+    def label(self):
+        return self._label
+
+
+class CatalogItem:
+    def __init__(self, category=0, label="", short_desc="", target="", args_hint=ItemArgsHint.FORBIDDEN,
+                 hit_hint=ItemHitHint.IGNORE, loop_on_suggest=False, icon_handle=None, data_bag=None):
+        self._category = category
+        self._label = label
+        self._short_desc = short_desc
+        self._target = target
+        self._args_hint = args_hint
+        self._hit_hint = hit_hint
+        self._loop_on_suggest = loop_on_suggest
+        self._icon_handle = icon_handle
+        self._data_bag = data_bag
+        self._args = ""
+
+    def category(self):
+        return self._category
+
+    def label(self):
+        return self._label
+
+    def short_desc(self):
+        return self._short_desc
+
+    def target(self):
+        return self._target
+
+    def args_hint(self):
+        return self._args_hint
+
+    def hit_hint(self):
+        return self._hit_hint
+
+    def loop_on_suggest(self):
+        return self._loop_on_suggest
+
+    def icon(self):
+        return self._icon_handle
+
+    def data_bag(self):
+        return self._data_bag
+
+    def raw_args(self):
+        return self._args
+
+    def displayed_args(self):
+        return self._args
+
+    def set_args(self, args, label=None):
+        self._args = args
+
+    def set_short_desc(self, short_desc):
+        self._short_desc = short_desc
+
+    def set_data_bag(self, data_bag):
+        self._data_bag = data_bag
+
+    def clone(self):
+        clone = CatalogItem(self._category, self._label, self._short_desc, self._target, self._args_hint,
+                            self._hit_hint, self._loop_on_suggest, self._icon_handle, self._data_bag)
+        clone._args = self._args
+        return clone
+
+    def __repr__(self):
+        return "CatalogItem({!r}, {!r})".format(self._label, self._short_desc)
+
+
+class SuggestRun:
+    """
+    One on_suggest call running in its own thread, like Keypirinha runs them.
+    """
+
+    def __init__(self, plugin, user_input, items_chain):
+        self.plugin = plugin
+        self.user_input = user_input
+        self.items_chain = items_chain
+        self.terminated = threading.Event()
+        self.terminated_at = None
+        self.started_at = None
+        self.finished_at = None
+        # (time, items) of every set_suggestions call
+        self.suggestions = []
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        self.plugin._runs[threading.get_ident()] = self
+        self.started_at = time.perf_counter()
+        try:
+            self.plugin.on_suggest(self.user_input, self.items_chain)
+        except Exception as exc:
+            self.error = exc
+        finally:
+            self.finished_at = time.perf_counter()
+            del self.plugin._runs[threading.get_ident()]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def terminate(self):
+        if self.terminated_at is None:
+            self.terminated_at = time.perf_counter()
+        self.terminated.set()
+
+    def join(self, timeout=None):
+        self.thread.join(timeout)
+
+
+class Plugin:
+    """
+    Records catalog, suggestions and log output instead of showing them.
+    """
+
+    settings_text = ""
+
+    def __init__(self):
+        self._runs = {}
+        self._current_run = None
+        self.catalog = []
+        self.actions = {}
+        self.logs = []
+        self.verbose = False
+
+    def _log(self, level, *args):
+        self.logs.append((level, " ".join(str(arg) for arg in args)))
+        if self.verbose:
+            print(level, *args)
+
+    def dbg(self, *args):
+        if getattr(self, "_debug", False):
+            self._log("dbg", *args)
+
+    def info(self, *args):
+        self._log("info", *args)
+
+    def warn(self, *args):
+        self._log("warn", *args)
+
+    def err(self, *args):
+        self._log("err", *args)
+
+    def package_full_name(self):
+        return "YouTrack"
+
+    def load_settings(self):
+        return Settings(self.settings_text)
+
+    def load_icon(self, sources, force_reload=False):
+        return IconHandle(sources)
+
+    def set_default_icon(self, icon_handle):
+        pass
+
+    def create_action(self, name, label, short_desc="", data_bag=None):
+        return CatalogAction(name, label, short_desc, data_bag)
+
+    def set_actions(self, category, actions):
+        self.actions[category] = actions
+
+    def create_item(self, **kwargs):
+        return CatalogItem(**kwargs)
+
+    def create_error_item(self, label, short_desc, target=None):
+        return CatalogItem(category=0, label=label, short_desc=short_desc, target=target)
+
+    def set_catalog(self, catalog_items):
+        self.catalog = list(catalog_items)
+
+    def merge_catalog(self, catalog_items):
+        self.catalog.extend(catalog_items)
+
+    def set_suggestions(self, suggestions, match_method=Match.DEFAULT, sort_method=Sort.SCORE_DESC):
+        run = self._runs.get(threading.get_ident())
+        if run is not None:
+            run.suggestions.append((time.perf_counter(), list(suggestions)))
+
+    def should_terminate(self, wait=None):
+        run = self._runs.get(threading.get_ident())
+        if run is None:
+            if wait:
+                time.sleep(wait)
+            return False
+        if wait:
+            return run.terminated.wait(wait)
+        return run.terminated.is_set()
+
+    def suggest(self, user_input, items_chain):
+        """
+        Starts on_suggest for the input in a new thread and terminates the previous one, like typing does.
+        """
+        if self._current_run is not None:
+            self._current_run.terminate()
+        self._current_run = SuggestRun(self, user_input, items_chain).start()
+        return self._current_run
@@ -0,0 +1,22 @@
+"""
+Stand-in for the keypirinha_util module of Keypirinha's embedded python.
+"""
+import json
+
+clipboard = []
+
+
+def kwargs_encode(**kwargs):
+    return json.dumps(kwargs, sort_keys=True)
+
+
+def kwargs_decode(encoded_kwargs):
+    return json.loads(encoded_kwargs)
+
+
+def set_clipboard(text):
+    clipboard.append(text)
+
+
+def get_clipboard():
+    return clipboard[-1] if clipboard else ""
@@ -0,0 +1,24 @@
+"""
+Imports the plugin as the package "youtrack" like Keypirinha does, with the stand-ins of this directory as
+keypirinha modules.
+"""
+import importlib
+import importlib.util
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def load_plugin_module():
+    if 'youtrack' not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            'youtrack', os.path.join(ROOT_DIR, '__init__.py'), submodule_search_locations=[ROOT_DIR])
+        package = importlib.util.module_from_spec(spec)
+        sys.modules['youtrack'] = package
+        spec.loader.exec_module(package)
+    return importlib.import_module('youtrack.youtrack')
+
+
+def load_plugin_class():
+    return load_plugin_module().YouTrack
@@ -0,0 +1,56 @@
+import os
+import tempfile
+
+from lib.frecency import FrecencyStore
+
+from fakes.clock import FakeClock
+
+DAY = 86400
+
+
+class TestFrecencyStore:
+
+    def setup_method(self):
+        self.clock = FakeClock(1000.0)
+        self.path = os.path.join(tempfile.mkdtemp(), 'recent.json')
+        self.fixture = self.create()
+
+    def create(self, max_entries=10):
+        return FrecencyStore(self.path, max_entries, half_life=7 * DAY, dbg=lambda x: None, clock=self.clock)
+
+    def open(self, id, summary="summary", times=1):
+        for _ in range(times):
+            self.fixture.record(id, summary, "description", "https://youtrack/issue/" + id)
+
+    def ids(self, text=""):
+        return [entry['id'] for entry in self.fixture.top(text, 10)]
+
+    def test_ranks_frequently_opened_first(self):
+        self.open('A-1')
+        self.open('A-2', times=3)
+        assert self.ids() == ['A-2', 'A-1']
+
+    def test_old_openings_decay(self):
+        self.open('A-1', times=3)
+        self.clock.now += 28 * DAY
+        self.open('A-2')
+        assert self.ids() == ['A-2', 'A-1']
+
+    def test_matches_words_of_id_and_summary(self):
+        self.open('A-1', summary="Crash on startup")
+        self.open('B-2', summary="Slow search")
+        assert self.ids('crash') == ['A-1']
+        assert self.ids('b-') == ['B-2']
+        assert self.ids('slow crash') == []
+
+    def test_drops_lowest_ranked_beyond_max_entries(self):
+        self.fixture = self.create(max_entries=2)
+        self.open('A-1', times=2)
+        self.open('A-2', times=3)
+        self.open('A-3')
+        assert self.ids() == ['A-2', 'A-3']
+
+    def test_keeps_issues_across_instances(self):
+        self.open('A-1', summary="Crash on startup")
+        assert self.create().top('', 10) == [{'id': 'A-1', 'summary': "Crash on startup",
+                                              'description': "description", 'url': "https://youtrack/issue/A-1"}]
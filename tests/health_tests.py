@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from lib.health import ServerHealth, ServerUnavailable, parse_retry_after
+
+from fakes.clock import FakeClock
+
+
+class TestServerHealth:
+
+    def setup_method(self):
+        self.clock = FakeClock(1000.0)
+        self.fixture = ServerHealth(failure_threshold=3, open_interval=5.0, clock=self.clock)
+
+    def test_opens_after_consecutive_failures(self):
+        self.fixture.failed()
+        self.fixture.failed()
+        self.fixture.succeeded()
+        self.fixture.failed()
+        self.fixture.failed()
+        assert self.fixture.acquire() == 0.0
+        self.fixture.failed()
+        with pytest.raises(ServerUnavailable):
+            self.fixture.acquire()
+        self.clock.now += 5
+        assert self.fixture.acquire() == 0.0
+
+    def test_interval_doubles_while_down(self):
+        for _ in range(3):
+            self.fixture.failed()
+        self.clock.now += 5
+        self.fixture.failed()
+        self.clock.now += 9
+        assert self.fixture.is_open()
+        self.clock.now += 1
+        assert not self.fixture.is_open()
+
+    def test_retry_after_opens_right_away(self):
+        self.fixture.failed(retry_after=30)
+        self.clock.now += 29
+        assert self.fixture.is_open()
+        self.fixture.succeeded()
+        assert not self.fixture.is_open()
+
+    def test_probe_closes_circuit(self):
+        fixture = ServerHealth(failure_threshold=1, open_interval=0.05)
+        fixture.probe = fixture.succeeded
+        fixture.failed()
+        assert fixture.is_open()
+        time.sleep(0.3)
+        assert not fixture.is_open()
+        fixture.close()
+
+    def test_rate_limit(self):
+        fixture = ServerHealth(rate=10, burst=2, clock=self.clock)
+        assert fixture.acquire() == 0.0
+        assert fixture.acquire() == 0.0
+        assert fixture.acquire() == pytest.approx(0.1)
+        self.clock.now += 1
+        assert fixture.acquire() == 0.0
+
+    def test_background_requests_have_own_rate_limit(self):
+        fixture = ServerHealth(rate=10, burst=2, clock=self.clock)
+        with fixture.background():
+            for _ in range(3):
+                fixture.acquire()
+            assert fixture.acquire() == pytest.approx(0.2)
+        assert fixture.acquire() == 0.0
+        assert fixture.acquire() == 0.0
+
+    def test_parse_retry_after(self):
+        assert parse_retry_after('120') == 120.0
+        assert parse_retry_after('Wed, 21 Oct 2015 07:28:30 GMT', now=1445412480.0) == 30.0
+        assert parse_retry_after('soon') is None
+        assert parse_retry_after(None) is None
@@ -0,0 +1,87 @@
+import os
+
+from lib.api import Issue
+from lib.issue_index import IssueIndex, IssueIndexSync, is_free_text
+
+from fakes.clock import FakeClock
+
+
+def issue(id, summary, updated):
+    return Issue(id=id, summary=summary, description="", url="", updated=updated)
+
+
+class FakeApi:
+    def __init__(self, issues, index=None):
+        self.issues = issues
+        self.index = index
+        self.queries = []
+        # whether the index was ready when each page was asked for
+        self.ready = []
+
+    def get_issues_page(self, query, skip, top):
+        self.queries.append((query, skip, top))
+        if self.index is not None:
+            self.ready.append(self.index.is_ready())
+        return self.issues[skip:skip + top]
+
+    def get_issue_ids_page(self, query, skip, top):
+        self.queries.append((query, skip, top))
+        return [issue.id for issue in self.issues[skip:skip + top]]
+
+
+class TestIssueIndex:
+
+    def test_search_matches_word_prefixes(self, tmp_path):
+        fixture = IssueIndex(os.path.join(str(tmp_path), "index.sqlite"))
+        fixture.upsert([issue("ABC-1", "Crash on startup", 1), issue("ABC-2", "Slow search", 2)], watermark=2)
+        assert [row[0] for row in fixture.search("crash start", 10)] == ["ABC-1"]
+        assert [row[0] for row in fixture.search("", 10)] == ["ABC-2", "ABC-1"]
+        assert fixture.get_watermark() == 2
+
+    def test_replaces_updated_issues(self, tmp_path):
+        fixture = IssueIndex(os.path.join(str(tmp_path), "index.sqlite"))
+        fixture.upsert([issue("ABC-1", "Crash on startup", 1), issue("ABC-2", "Slow search", 2)], watermark=2)
+        fixture.upsert([issue("ABC-1", "Slow startup", 3)], watermark=3)
+        assert [row[:2] for row in fixture.search("startup", 10)] == [("ABC-1", "Slow startup")]
+        assert fixture.search("crash", 10) == []
+
+    def test_forgets_issues_of_another_query(self, tmp_path):
+        path = os.path.join(str(tmp_path), "index.sqlite")
+        fixture = IssueIndex(path, "project: ABC")
+        fixture.upsert([issue("ABC-1", "Crash on startup", 1)], watermark=1)
+        fixture.mark_synced()
+        fixture.close()
+        assert IssueIndex(path, "project: ABC").get_watermark() == 1
+        fixture = IssueIndex(path, "project: XYZ")
+        assert (fixture.get_watermark(), fixture.is_ready(), fixture.search("", 10)) == (None, False, [])
+
+    def test_sync_pages_and_advances_watermark(self, tmp_path):
+        fixture = IssueIndex(os.path.join(str(tmp_path), "index.sqlite"))
+        api = FakeApi([issue("ABC-" + str(i), "issue", i * 1000) for i in range(150)], fixture)
+        IssueIndexSync(fixture, api, lambda x: None, interval=60).sync()
+        assert [(skip, top) for _, skip, top in api.queries] == [(0, 100), (100, 100)]
+        assert api.ready == [False, False]
+        assert fixture.get_watermark() == 149000
+        assert fixture.is_ready()
+        IssueIndexSync(fixture, FakeApi([]), lambda x: None, interval=60, query="project: ABC").sync()
+
+    def test_sync_removes_issues_gone_from_server(self, tmp_path):
+        fixture = IssueIndex(os.path.join(str(tmp_path), "index.sqlite"))
+        api = FakeApi([issue("ABC-1", "Crash on startup", 1000), issue("ABC-2", "Slow search", 2000)])
+        clock = FakeClock()
+        sync = IssueIndexSync(fixture, api, lambda x: None, interval=60, clock=clock)
+        sync.sync()
+        api.issues = api.issues[1:]
+        clock.now = sync.RECONCILE_INTERVAL - 1
+        sync.sync()
+        assert [row[0] for row in fixture.search("", 10)] == ["ABC-2", "ABC-1"]
+        clock.now = sync.RECONCILE_INTERVAL
+        sync.sync()
+        assert [row[0] for row in fixture.search("", 10)] == ["ABC-2"]
+        assert fixture.search("crash", 10) == []
+        assert api.queries[-1] == ("sort by: created asc", 0, sync.IDS_PAGE_SIZE)
+
+    def test_is_free_text(self):
+        assert is_free_text("crash on startup")
+        assert not is_free_text("project: ABC crash")
+        assert not is_free_text("#Unresolved")
@@ -1,7 +0,0 @@
-def name(): ''
-def label(): ''
-def version_tuple(): ''
-
-class Plugin(object):
-    def __new__(cls):
-        pass
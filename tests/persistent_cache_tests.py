@@ -0,0 +1,54 @@
+import json
+import os
+import tempfile
+import zlib
+
+from lib.persistent_cache import PersistentCache
+
+from fakes.clock import FakeClock
+
+
+class TestPersistentCache:
+
+    def setup_method(self):
+        self.clock = FakeClock(1000.0)
+        self.path = os.path.join(tempfile.mkdtemp(), 'cache.bin')
+
+    def create(self, max_entries=10):
+        cache = PersistentCache(self.path, max_entries, dbg=lambda x: None, clock=self.clock)
+        cache.load()
+        return cache
+
+    def test_keeps_entries_across_instances(self):
+        cache = self.create()
+        cache.put(('issues', 'abc', None), [{'id': 'A-1'}])
+        cache.close()
+        self.clock.now += 60
+        assert self.create().get(('issues', 'abc', None)) == ([{'id': 'A-1'}], 60)
+
+    def test_evicts_oldest(self):
+        cache = self.create(max_entries=2)
+        for key in ('a', 'b', 'c'):
+            cache.put((key,), key)
+            self.clock.now += 1
+        cache.close()
+        cache = self.create(max_entries=2)
+        assert cache.get(('a',)) is None
+        assert cache.get(('c',))[0] == 'c'
+
+    def test_nothing_before_loaded(self):
+        cache = PersistentCache(self.path, 10, dbg=lambda x: None, clock=self.clock)
+        cache.put(('a',), 'a')
+        assert cache.get(('a',)) is None
+
+    def test_ignores_other_versions(self):
+        with open(self.path, 'wb') as f:
+            f.write(zlib.compress(json.dumps({'version': -1, 'entries': [[['a'], 0, 'a']]}).encode('utf-8')))
+        assert self.create().get(('a',)) is None
+
+    def test_ignores_damaged_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'garbage')
+        cache = self.create()
+        assert cache.loaded.is_set()
+        assert cache.get(('a',)) is None
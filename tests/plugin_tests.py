@@ -0,0 +1,302 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'fakes'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'benchmark'))
+
+import keypirinha  # noqa: E402 the fake from tests/fakes
+import keypirinha_util as kpu  # noqa: E402
+from fake_youtrack import FakeYouTrack  # noqa: E402
+from lib.api import Issue  # noqa: E402
+from lib.legacy_api import Issue as LegacyIssue  # noqa: E402
+from youtrack_package import load_plugin_module  # noqa: E402
+
+SERVER = """
+[server/{name}]
+base_url = http://127.0.0.1:1/{name}
+api_token = perm:test
+filter_icon = {icon}
+"""
+
+
+class TestRecentIssues:
+
+    def setup_method(self):
+        self.fixture = load_plugin_module().YouTrack()
+        self.fixture.settings_text = SERVER.format(name='recent', icon='youtrack')
+        self.fixture.on_start()
+        self.fixture.on_catalog()
+        self.server = self.fixture.servers['recent']
+        self.issues_item = next(item for item in self.fixture.catalog
+                                if item.category() == self.fixture.ITEMCAT_ISSUES)
+
+    def teardown_method(self):
+        self.fixture.shutdown()
+
+    def test_suggests_opened_issues_without_request(self):
+        issue = Issue(id='JT-1', summary="Crash on startup", description="Stack trace", url="https://youtrack/JT-1")
+        self.fixture.on_execute(self.server.create_issue_item(issue),
+                                next(a for a in self.fixture.actions[self.fixture.ITEMCAT_ISSUES]
+                                     if a.name() == self.fixture.ACTION_COPY_URL))
+        suggestions = self.server.get_recent_suggestions('crash', [self.issues_item])
+        assert [item.target() for item in suggestions] == [' crash', 'JT-1']
+        assert self.server.get_recent_suggestions('slow', [self.issues_item]) == []
+
+    def test_renders_legacy_issues(self):
+        issue = LegacyIssue(id='JT-2', summary="Slow", description=None, url="https://youtrack/JT-2")
+        assert self.server.create_issue_item(issue).short_desc() == 'JT-2'
+
+    def test_reuses_items_of_unchanged_issues(self):
+        issue = Issue(id='JT-3', summary="Slow", description=None, url="https://youtrack/JT-3", updated=1)
+        item = self.server.create_issue_item(issue)
+        assert self.server.create_issue_item(Issue(**{name: getattr(issue, name) for name in issue.__slots__})) is item
+        assert self.server.create_issue_item(issue, desc_prefix=self.server.RECENT_ISSUES_PREFIX) is not item
+        issue.updated = 2
+        assert self.server.create_issue_item(issue) is not item
+
+
+class FakeServerTest:
+    """
+    Runs the plugin against a fake server with ten issues, configured by the settings of the subclass.
+    """
+
+    NAME = None
+    SETTINGS = ""
+
+    def setup_method(self):
+        self.youtrack = FakeYouTrack(issue_count=10).start()
+        self.fixture = load_plugin_module().YouTrack()
+        self.fixture.settings_text = "[server/{}]\nbase_url = {}\napi_token = perm:test\nlocal_completion = False\n" \
+                                     "{}".format(self.NAME, self.youtrack.base_url, self.SETTINGS)
+        self.fixture.on_start()
+        self.fixture.on_catalog()
+        self.server = self.fixture.servers[self.NAME]
+        self.issues_item = next(item for item in self.fixture.catalog
+                                if item.category() == self.fixture.ITEMCAT_ISSUES)
+
+    def teardown_method(self):
+        self.fixture.shutdown()
+        self.youtrack.stop()
+
+
+class TestLoadMore(FakeServerTest):
+    NAME = 'paged'
+    SETTINGS = "max_results = 5\n"
+
+    def test_pages_through_issues(self):
+        suggestions = self.server.on_suggest('', [self.issues_item])
+        assert [item.target() for item in suggestions[1:5]] == ['JT-1', 'JT-2', 'JT-3', 'JT-4']
+        load_more = suggestions[5]
+        assert load_more.label() == "Load more…"
+
+        suggestions = self.server.on_suggest('', [self.issues_item, load_more])
+        assert [item.target() for item in suggestions[1:5]] == ['JT-5', 'JT-6', 'JT-7', 'JT-8']
+        suggestions = self.server.on_suggest('', [self.issues_item, suggestions[5]])
+        assert [item.target() for item in suggestions[1:-1]] == ['JT-9', 'JT-10']
+
+    def test_ends_with_full_page(self):
+        self.youtrack.issues = self.youtrack.issues[:8]
+        suggestions = self.server.on_suggest('', [self.issues_item])
+        suggestions = self.server.on_suggest('', [self.issues_item, suggestions[5]])
+        assert [item.target() for item in suggestions[1:5]] == ['JT-5', 'JT-6', 'JT-7', 'JT-8']
+        assert "Load more…" not in [item.label() for item in suggestions]
+
+    def test_shows_every_issue_besides_recent_ones(self):
+        self.server.record_opened_issue('JT-9', "Recent", None, "https://youtrack/JT-9")
+        shown = []
+        items = [self.issues_item]
+        while True:
+            suggestions = self.server.on_suggest('', items)
+            issues = [item.target() for item in suggestions if item.target().startswith('JT-')]
+            assert len(issues) <= 4
+            shown += issues
+            if suggestions[len(issues) + 1].label() != "Load more…":
+                break
+            items = [self.issues_item, suggestions[len(issues) + 1]]
+        assert sorted(set(shown)) == sorted('JT-{}'.format(i) for i in range(1, 11))
+
+    def test_fetches_descriptions_of_shown_issues(self):
+        suggestions = self.server.on_suggest('', [self.issues_item])
+        assert suggestions[1].short_desc() == 'JT-1'
+        hydrated = self.server.hydrate_descriptions(suggestions)
+        description = self.youtrack.issues[0]['description'][:self.server.DESCRIPTION_LENGTH]
+        assert hydrated[1].short_desc() == 'JT-1 ▶ ' + description
+        assert hydrated[0] is suggestions[0]
+        # known from now on
+        assert self.server.on_suggest('', [self.issues_item])[1].short_desc() == 'JT-1 ▶ ' + description
+
+    def test_answers_locally_only_without_request(self):
+        assert not self.server.can_answer_locally('JT-99', [self.issues_item])
+        assert self.server.fetch_issue('JT-99') == []
+        # searched for as text next
+        assert not self.server.can_answer_locally('JT-99', [self.issues_item])
+        self.server.on_suggest('JT-99', [self.issues_item])
+        assert self.server.can_answer_locally('JT-99', [self.issues_item])
+
+    def test_fetches_descriptions_of_issues_from_all_servers(self):
+        issues = self.server.fetch_issues('', 0)
+        suggestions = self.fixture._merge_ranked([self.server], {self.server: issues})
+        prefix = self.server.name + ' ▶ '
+        assert suggestions[0].short_desc() == prefix + 'JT-1'
+        hydrated = self.server.hydrate_descriptions(suggestions)
+        description = self.youtrack.issues[0]['description'][:self.server.DESCRIPTION_LENGTH]
+        assert hydrated[0].short_desc() == prefix + 'JT-1 ▶ ' + description
+
+
+class TestSimilarIssues(FakeServerTest):
+    NAME = 'typos'
+    SETTINGS = "catalog_sync_interval = 0\n"
+
+    def issue_targets(self, suggestions):
+        return [item.target() for item in suggestions if item.category() == self.fixture.ITEMCAT_ISSUES][1:]
+
+    def test_suggests_seen_issues_when_none_found(self):
+        # JT-10 mentions a crash in its description only
+        assert self.issue_targets(self.server.on_suggest('crash', [self.issues_item])) == ['JT-1', 'JT-10']
+        suggestions = self.server.on_suggest('crahs', [self.issues_item])
+        assert self.issue_targets(suggestions) == ['JT-1']
+        assert suggestions[0].short_desc().endswith("(no issues found, similar ones shown)")
+        assert suggestions[1].short_desc().startswith(self.server.SIMILAR_ISSUES_PREFIX)
+
+
+class TestCatalog(FakeServerTest):
+    NAME = 'saved'
+    SETTINGS = "catalog_sync_interval = 0\n"
+
+    def test_lists_saved_searches_and_pinned_projects(self):
+        # synced by the test instead of in the background
+        self.server.sync_catalog()
+        labels = {item.label(): item for item in self.fixture.catalog}
+        assert 'YouTrack ▶ Crashes' in labels and 'YouTrack ▶ Jet Test' in labels
+        saved = labels['YouTrack ▶ Crashes']
+        assert kpu.kwargs_decode(saved.data_bag())['url'].endswith('?q=crash')
+
+        # known as after a metadata sync, otherwise they are fetched in the background
+        self.server.store(self.server.api.projects_cache_key(),
+                          self.fixture.io.run(self.server.fetch_projects(None)), self.server.PROJECTS_TTL)
+        self.youtrack.reset_stats()
+        suggestions = self.server.on_suggest('', [saved])
+        assert self.youtrack.requests == 0
+        assert [item.target() for item in suggestions if item.category() == self.fixture.ITEMCAT_ISSUES][0] == 'crash '
+
+
+class TestSearchAllServers:
+
+    def setup_method(self):
+        self.fast = FakeYouTrack(issue_count=10).start()
+        self.slow = FakeYouTrack(latency=2.0, issue_count=10).start()
+        self.fixture = load_plugin_module().YouTrack()
+        self.fixture.settings_text = "[main]\nidle_time = 0.25\nmin_idle_time = 0\nsearch_all_timeout = 0.5\n" + "".join(
+            "[server/{}]\nname = {}\nbase_url = {}\napi_token = perm:test\nlocal_completion = False\n"
+            "catalog_sync_interval = 0\n".format(key, key, base_url)
+            for key, base_url in (('fast', self.fast.base_url), ('slow', self.slow.base_url),
+                                  ('down', 'http://127.0.0.1:1')))
+        self.fixture.on_start()
+        self.fixture.on_catalog()
+        self.all_item = next(item for item in self.fixture.catalog
+                             if item.category() == self.fixture.ITEMCAT_ALL_SERVERS)
+
+    def teardown_method(self):
+        self.fixture.shutdown()
+        self.fast.stop()
+        self.slow.stop()
+
+    def search(self, user_input):
+        run = self.fixture.suggest(user_input, [self.all_item])
+        run.join()
+        assert run.error is None
+        return run.suggestions[-1][1]
+
+    def test_leaves_out_slow_and_failing_servers(self):
+        suggestions = self.search('crash')
+        issues = [item for item in suggestions if item.category() == self.fixture.ITEMCAT_ISSUES]
+        assert [item.target() for item in issues] == ['JT-1', 'JT-10']
+        assert all(item.short_desc().startswith('fast ▶ ') for item in issues)
+        errors = {item.label(): item.short_desc() for item in suggestions if item.category() == 0}
+        assert errors['slow'] == "No answer within 0.5 seconds"
+        assert errors['down'].startswith("Error: ")
+
+    def test_interleaves_servers_by_rank(self):
+        fast, slow = self.fixture.servers['fast'], self.fixture.servers['slow']
+
+        def issues(server, count):
+            return [Issue(id='JT-{}'.format(i), summary="Issue", description="", url=server.api.create_issue_url(i))
+                    for i in range(1, count + 1)]
+
+        suggestions = self.fixture._merge_ranked([fast, slow], {fast: issues(fast, 2), slow: issues(slow, 4)})
+        assert [item.short_desc().split(' ▶ ')[:2] for item in suggestions] == [
+            ['fast', 'JT-1'], ['slow', 'JT-1'], ['slow', 'JT-2'], ['fast', 'JT-2'], ['slow', 'JT-3'], ['slow', 'JT-4']]
+
+
+class TestReloadConfig:
+
+    def setup_method(self):
+        self.module = load_plugin_module()
+        self.fixture = self.module.YouTrack()
+        self.configure(SERVER.format(name='a', icon='test') + SERVER.format(name='b', icon='youtrack'))
+        self.fixture.on_start()
+
+    def teardown_method(self):
+        self.fixture.shutdown()
+
+    def configure(self, settings_text):
+        self.fixture.settings_text = settings_text
+
+    def reload(self):
+        self.fixture.on_events(keypirinha.Events.PACKCONFIG)
+
+    def test_keeps_unchanged_servers(self):
+        a, b = self.fixture.servers['a'], self.fixture.servers['b']
+        self.configure(SERVER.format(name='a', icon='test') + SERVER.format(name='b', icon='youtrack') +
+                       'max_results = 5\n')
+        self.reload()
+        assert self.fixture.servers['a'] is a
+        assert self.fixture.servers['b'] is not b
+        assert self.fixture.servers['b'].max_results == 5
+
+    def test_drops_removed_servers(self):
+        self.configure(SERVER.format(name='a', icon='test'))
+        self.reload()
+        assert list(self.fixture.servers) == ['a']
+
+    def test_resizes_worker_threads(self):
+        executor = self.fixture.executor
+        self.reload()
+        assert self.fixture.executor is executor
+        self.configure("[main]\nmax_workers = 2\n" + SERVER.format(name='a', icon='test'))
+        self.reload()
+        assert self.fixture.executor is not executor
+        assert self.fixture.executor.submit(lambda: 1).result() == 1
+
+    def test_waits_for_catalog_rebuilt_by_sync(self):
+        self.configure(SERVER.format(name='a', icon='test'))
+        # as if a sync thread rebuilds the catalog meanwhile
+        with self.fixture._catalog_lock:
+            reload = threading.Thread(target=self.reload)
+            reload.start()
+            reload.join(0.2)
+            assert reload.is_alive()
+            assert list(self.fixture.servers) == ['a', 'b']
+        reload.join()
+        assert list(self.fixture.servers) == ['a']
+
+    def test_copies_only_changed_icons(self, monkeypatch):
+        icon_dir = os.path.join(keypirinha.user_config_dir(), 'youtrack')
+        os.makedirs(icon_dir, exist_ok=True)
+        icon_path = os.path.join(icon_dir, 'icon_test.png')
+        with open(icon_path, 'wb') as f:
+            f.write(b'png')
+        copies = []
+        copy2 = self.module.shutil.copy2
+        monkeypatch.setattr(self.module.shutil, 'copy2', lambda *args: copies.append(args) or copy2(*args))
+
+        self.reload()
+        self.reload()
+        assert len(copies) == 1
+        assert self.fixture._icons['test'].sources[1].startswith('cache://')
+
+        with open(icon_path, 'wb') as f:
+            f.write(b'changed png')
+        self.reload()
+        assert len(copies) == 2
@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+from lib.prefetch import Prefetcher
+from lib.transport import current_cancel_token
+
+from fakes.clock import FakeClock
+
+
+class TestPrefetcher:
+
+    def setup_method(self):
+        self.clock = FakeClock(1000.0)
+        self.submitted = []
+        self.fetched = []
+        self.fixture = Prefetcher(lambda coroutine: self.submitted.append(coroutine), budget=100, dbg=lambda x: None, clock=self.clock)
+
+    def run_submitted(self):
+        submitted, self.submitted = self.submitted, []
+        for coroutine in submitted:
+            asyncio.run(coroutine)
+
+    def job(self, key, size=40):
+        async def fetch():
+            current_cancel_token().received += size
+            self.fetched.append(key)
+        return key, fetch
+
+    def test_fetches_in_order(self):
+        self.fixture.schedule([self.job('a'), self.job('b')])
+        self.run_submitted()
+        assert self.fetched == ['a', 'b']
+        assert self.fixture.spent() == 80
+
+    def test_cancels_stale_jobs(self):
+        self.fixture.schedule([self.job('a')])
+        self.fixture.schedule([self.job('b')])
+        self.run_submitted()
+        assert self.fetched == ['b']
+
+    def test_waits_for_delay(self):
+        self.fixture.schedule([self.job('a')], delay=0.05)
+        started = time.monotonic()
+        self.run_submitted()
+        assert time.monotonic() - started >= 0.05
+        assert self.fetched == ['a']
+
+    def test_stops_when_budget_is_used_up(self):
+        self.fixture.schedule([self.job('a', 60), self.job('b', 60), self.job('c', 60)])
+        self.run_submitted()
+        assert self.fetched == ['a', 'b']
+        self.clock.now += Prefetcher.WINDOW + 1
+        self.fixture.schedule([self.job('c')])
+        self.run_submitted()
+        assert self.fetched == ['a', 'b', 'c']
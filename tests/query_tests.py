@@ -0,0 +1,61 @@
+from lib.api import SuggestionResult
+from lib.query import QueryCompleter, parse_issue_id, parse_project_prefix
+
+
+class TestIssueId:
+
+    def test_full_issue_id(self):
+        assert parse_issue_id(' jt-1234 ') == 'JT-1234'
+        assert parse_issue_id('PROJ_2-7') == 'PROJ_2-7'
+
+    def test_no_issue_id(self):
+        assert parse_issue_id('JT-') is None
+        assert parse_issue_id('1-2') is None
+        assert parse_issue_id('JT-12 crash') is None
+
+    def test_project_prefix(self):
+        assert parse_project_prefix('jt') == ('jt', False)
+        assert parse_project_prefix('JT-') == ('JT', True)
+        assert parse_project_prefix('JT-1') is None
+        assert parse_project_prefix('state: open') is None
+
+
+class TestQueryCompleter:
+
+    def setup_method(self):
+        self.completer = QueryCompleter(SuggestionResult, 10)
+        self.completer.update({
+            'projects': [['JT', 'Jet Test']],
+            'fields': {'State': ['Open', 'In Progress', 'Fixed'], 'Assignee': 'users', 'Fix versions': None},
+            'users': [['jdoe', 'John Doe']],
+            'tags': ['Star'],
+        })
+
+    def complete(self, query):
+        results = self.completer.complete(query)
+        return None if results is None else [(r.full_option, r.start, r.end) for r in results]
+
+    def test_not_ready(self):
+        assert QueryCompleter(SuggestionResult, 10).complete('state: ') is None
+
+    def test_field_names(self):
+        assert self.complete('state: open sta') == [('State: ', 12, 15)]
+        assert self.complete('fix v') == [('Fix versions: ', 0, 5)]
+
+    def test_field_values(self):
+        assert self.complete('State: o') == [('Open ', 7, 8), ('{In Progress} ', 7, 8)]
+        assert self.complete('state: Open, {in') == [('{In Progress} ', 13, 16)]
+        assert self.complete('project: j') == [('JT ', 9, 10)]
+        assert self.complete('assignee: jd') == [('jdoe ', 10, 12)]
+
+    def test_hash_values(self):
+        assert self.complete('#st') == [('#Star ', 0, 3)]
+        assert self.complete('#unr') == [('#Unresolved ', 0, 4)]
+
+    def test_falls_back_to_server(self):
+        assert self.complete('crash') is None
+        assert self.complete('e') is None
+        assert self.complete('open ver') is None
+        assert self.complete('fix versions: 1') is None
+        assert self.complete('state: Open ') is None
+        assert self.complete('summary: "open st') is None
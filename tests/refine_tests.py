@@ -0,0 +1,29 @@
+from lib.api import SuggestionResult
+from lib.refine import SuggestionRefiner
+
+
+def suggestion(option, start, end, suffix=": "):
+    return SuggestionResult(full_option=option + suffix, prefix=None, suffix=suffix, option=option, start=start,
+                            end=end, description=option)
+
+
+class TestSuggestionRefiner:
+
+    def setup_method(self):
+        self.fixture = SuggestionRefiner(max_age=60)
+        self.fixture.remember("stat", [suggestion("State", 0, 4), suggestion("Status", 0, 4),
+                                       suggestion("Stage", 0, 2)])
+
+    def test_narrows_down_and_reanchors(self):
+        res = self.fixture.refine("statu")
+        assert [r.option for r in res] == ["Status"]
+        assert (res[0].start, res[0].end) == (0, 5)
+
+    def test_needs_server_when_word_ends(self):
+        assert self.fixture.refine("stat ") is None
+
+    def test_needs_server_when_nothing_matches(self):
+        assert self.fixture.refine("statx") is None
+
+    def test_needs_server_for_shorter_input(self):
+        assert self.fixture.refine("sta") is None
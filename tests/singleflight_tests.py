@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import time
+
+from lib.singleflight import SingleFlight
+from lib.transport import CancelToken, Cancelled
+
+
+class TestSingleFlight:
+
+    def test_concurrent_callers_share_one_call(self):
+        fixture = SingleFlight()
+        calls = []
+
+        def slow(value):
+            calls.append(value)
+            time.sleep(0.2)
+            return [value]
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(fixture.do('key', slow, 'x'))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert calls == ['x']
+        assert results == [['x']] * 3
+        assert results[0] is results[1]
+
+    def test_follower_retries_when_leader_was_cancelled(self):
+        fixture = SingleFlight()
+        leader_token = CancelToken()
+        calls = []
+
+        def call():
+            calls.append(1)
+            time.sleep(0.2)
+            if len(calls) == 1:
+                raise Cancelled()
+            return 'result'
+
+        def lead():
+            with leader_token.scope():
+                try:
+                    fixture.do('key', call)
+                except Cancelled:
+                    pass
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        time.sleep(0.05)
+        assert fixture.do('key', call) == 'result'
+        leader.join()
+        assert len(calls) == 2
+
+    def test_coroutines_share_calls_with_threads(self):
+        fixture = SingleFlight()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'result'
+
+        async def follow():
+            await asyncio.sleep(0.05)
+
+            async def call():
+                calls.append(2)
+                return 'other'
+            return await fixture.do_async('key', call)
+
+        leader = threading.Thread(target=fixture.do, args=('key', slow))
+        leader.start()
+        assert asyncio.run(follow()) == 'result'
+        leader.join()
+        assert calls == [1]
@@ -0,0 +1,63 @@
+import json
+import os
+import tempfile
+
+from lib.stats import Histogram, Stats, StatsDump, endpoint_of
+
+from fakes.clock import FakeClock
+
+
+class TestHistogram:
+
+    def test_percentiles_of_recent_samples(self):
+        fixture = Histogram(window=100)
+        for millis in range(1, 201):
+            fixture.record(millis / 1000)
+        summary = fixture.summary()
+        assert summary['count'] == 200
+        assert summary['p50_ms'] == 150
+        assert summary['p99_ms'] == 199
+        assert summary['max_ms'] == 200
+
+
+class TestStats:
+
+    def setup_method(self):
+        self.clock = FakeClock()
+        self.fixture = Stats(clock=self.clock)
+
+    def test_times_stages_per_endpoint(self):
+        with self.fixture.timed('/api/issues', 'parse'):
+            self.clock.now += 0.25
+        self.fixture.record('/api/search/assist', 'ttfb', 0.1)
+        snapshot = self.fixture.snapshot()
+        assert snapshot['/api/issues']['stages']['parse']['p50_ms'] == 250
+        assert snapshot['/api/search/assist']['stages']['ttfb']['count'] == 1
+
+    def test_counts_received_bytes(self):
+        self.fixture.received('/api/issues', 100)
+        self.fixture.received('/api/issues', 50)
+        assert self.fixture.snapshot()['/api/issues'] == {'stages': {}, 'responses': 2, 'bytes': 150}
+
+    def test_counts_parsed_bytes(self):
+        self.fixture.received('/api/issues', 100)
+        self.fixture.parsed('/api/issues', 400)
+        self.fixture.parsed('/api/issues', 400)
+        assert self.fixture.snapshot()['/api/issues']['parsed_bytes'] == 800
+
+    def test_endpoint_is_url_path(self):
+        assert endpoint_of('https://youtrack.example.com/api/issues?query=abc') == '/api/issues'
+
+    def test_issues_share_endpoint(self):
+        assert endpoint_of('https://youtrack.example.com/api/issues/JT-17?fields=id') == \
+            endpoint_of('https://youtrack.example.com/api/issues/2-4?fields=id') == '/api/issues/{id}'
+        assert endpoint_of('https://youtrack.example.com/rest/issue/JT-17') == '/rest/issue/{id}'
+        assert endpoint_of('https://youtrack.example.com/rest/issue/intellisense/') == '/rest/issue/intellisense/'
+
+    def test_dump_writes_json(self):
+        self.fixture.record('/api/issues', 'ttfb', 0.1)
+        path = os.path.join(tempfile.mkdtemp(), 'stats.json')
+        StatsDump(path, lambda: {'server': self.fixture.snapshot()}, interval=60, dbg=print).write()
+        with open(path, encoding='utf-8') as f:
+            dumped = json.load(f)
+        assert dumped['servers']['server']['/api/issues']['stages']['ttfb']['count'] == 1
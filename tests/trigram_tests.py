@@ -0,0 +1,40 @@
+from lib.api import Issue
+from lib.trigram import TrigramIndex, trigrams
+
+
+def issue(id, summary):
+    return Issue(id=id, summary=summary, description=None, url="https://youtrack/issue/" + id)
+
+
+class TestTrigramIndex:
+
+    def setup_method(self):
+        self.fixture = TrigramIndex(max_entries=3)
+        self.fixture.add([issue('JT-1', "Crash on startup"), issue('JT-2', "Slow search"),
+                          issue('JT-3', "Proxy settings ignored")])
+
+    def ids(self, issues):
+        return [issue.id for issue in issues]
+
+    def test_pads_words(self):
+        assert trigrams("Ab") == {'  a', ' ab', 'ab '}
+
+    def test_finds_issues_despite_typos(self):
+        assert self.ids(self.fixture.search("crahs", 10)) == ['JT-1']
+        assert self.ids(self.fixture.search("serch", 10)) == ['JT-2']
+        assert self.fixture.search("export", 10) == []
+
+    def test_ranks_by_shared_trigrams(self):
+        issues = [issue('JT-4', "Login fails"), issue('JT-5', "Search is slow"), issue('JT-6', "Slow login")]
+        assert self.ids(self.fixture.rank("slow search", issues)) == ['JT-5', 'JT-6', 'JT-4']
+
+    def test_drops_least_recently_seen(self):
+        self.fixture.add([issue('JT-1', "Crash on startup"), issue('JT-4', "Export broken")])
+        assert len(self.fixture) == 3
+        assert self.fixture.search("slow", 10) == []
+        assert self.ids(self.fixture.search("crash", 10)) == ['JT-1']
+
+    def test_updates_changed_summaries(self):
+        self.fixture.add([issue('JT-2', "Export broken")])
+        assert self.fixture.search("search", 10) == []
+        assert self.ids(self.fixture.search("export", 10)) == ['JT-2']
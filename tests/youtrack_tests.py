@@ -2,29 +2,49 @@ import os
 import unittest
 from typing import Sequence
 
-from lib.api import Api, SuggestionResult
+from lib.legacy_api import Api, IntellisenseResult
 
 TESTDATA_FILENAME = os.path.join(os.path.dirname(__file__), 'intellisense_result.xml')
+ISSUES_TESTDATA_FILENAME = os.path.join(os.path.dirname(__file__), 'list_of_issues_result.xml')
 
 class TestApi:
 
     def setup_class(self):
         self.testdata = open(TESTDATA_FILENAME).read()
+        self.issues_testdata = open(ISSUES_TESTDATA_FILENAME).read()
 
     def test_read_issues(self):
         dummyDbg = lambda x: None
-        fixture = Api("no token", "https://foo.com", dummyDbg)
+        fixture = Api("no token", "https://foo.com", dummyDbg, 10)
         #fixture.get_intellisense_suggestions("test")
 
-        res: Sequence[SuggestionResult] = fixture.parse_suggestions_response(self.testdata.encode("UTF-8"))
+        res: Sequence[IntellisenseResult] = fixture.parse_intellisense_suggestions(self.testdata.encode("UTF-8"))
         assert len(res) == 4
-        assert self.equals(res[0], SuggestionResult(start=0, end=2, description="by updated", option="updated", full_option="updated:", prefix=None, suffix=":"))
+        assert self.equals(res[0], IntellisenseResult(start=0, end=2, description="by updated", option="updated", full_option="updated:", prefix=None, suffix=":"))
+        assert self.equals(res[3], IntellisenseResult(start=0, end=2, description="&nbsp;", option="updated: Yesterday", full_option="updated: Yesterday", prefix=None, suffix=None))
 
-    def equals(self, one:SuggestionResult, two:SuggestionResult):
+    def test_read_list_of_issues(self):
+        dummyDbg = lambda x: None
+        fixture = Api("no token", "https://foo.com", dummyDbg, 10)
+
+        res = fixture.parse_list_of_issues_result(self.issues_testdata.encode("UTF-8"))
+        assert [(issue.id, issue.summary, issue.description) for issue in res] == [
+            ("JT-1", "Suggestions are slow", "Every keystroke waits for the server."),
+            ("JT-2", "Issue without description", ""),
+            ("JT-3", "--no summary--", "Issue without summary")]
+        assert res[0].url == "https://foo.com/issue/JT-1"
+
+    def test_read_issue(self):
+        fixture = Api("no token", "https://foo.com", lambda x: None, 10)
+
+        issue = fixture.parse_issue(b'<issue id="JT-7"><field name="summary"><value>Crash</value></field></issue>')
+        assert (issue.id, issue.summary, issue.description, issue.url) == ("JT-7", "Crash", "", "https://foo.com/issue/JT-7")
+
+    def equals(self, one:IntellisenseResult, two:IntellisenseResult):
         return one.description == two.description \
                and one.suffix == two.suffix \
                and one.end ==two.end \
                and one.full_option == two.full_option \
                and one.option==two.option \
                and one.prefix==two.prefix \
-               and one.start==two.start
\ No newline at end of file
+               and one.start==two.start
@@ -1,5 +1,9 @@
+import concurrent.futures
+import json
 import os
 import shutil
+import threading
+import time
 import traceback
 import urllib
 import webbrowser
@@ -9,6 +13,11 @@ import keypirinha
 import keypirinha as kp
 import keypirinha_util as kpu
 
+from .lib import worker
+from .lib.async_transport import EventLoopThread
+from .lib.debounce import AdaptiveDebouncer
+from .lib.stats import ENDPOINT_SUGGEST, STAGE_DEBOUNCE, STAGE_TOTAL, StatsDump
+from .lib.transport import Cancelled
 from .youtrack_server import YouTrackServer, ICON_KEY_DEFAULT
 
 
@@ -23,10 +32,18 @@ class YouTrack(kp.Plugin):
 
     CONFIG_SECTION_MAIN = "main"
     DEFAULT_IDLE_TIME = 0.25
+    DEFAULT_MIN_IDLE_TIME = 0.05
+    DEFAULT_MAX_WORKERS = 8
+    DEFAULT_FANOUT_TIMEOUT = 5.0
+    DEFAULT_SEARCH_ALL_LABEL = "YouTrack: search all servers"
+    DEFAULT_STATS_LABEL = "YouTrack: performance stats"
+    STATS_FILE_NAME = "performance_stats.json"
 
     ITEMCAT_FILTER = kp.ItemCategory.USER_BASE + 1
     ITEMCAT_ISSUES = kp.ItemCategory.USER_BASE + 2
     ITEMCAT_SWITCH = kp.ItemCategory.USER_BASE + 3
+    ITEMCAT_ALL_SERVERS = kp.ItemCategory.USER_BASE + 4
+    ITEMCAT_STATS = kp.ItemCategory.USER_BASE + 5
     RES_ICON_PATH = 'res://{package}/icons/icon_{name}.png'
     RES_ICON_CONFIG_PATH = 'youtrack/icon_{name}.png'
     CACHE_ICON_CONFIG_PATH = 'cache://youtrack/icon_{name}.png'
@@ -36,15 +53,54 @@ class YouTrack(kp.Plugin):
         super().__init__()
         self._debug = True
         self._icons = {}
+        self.servers = {}
+        self.executor = None
+        self._executor_workers = None
+        # sends the requests of all servers using the async transport
+        self.io = EventLoopThread()
+        self.debouncer = None
+        self.stats_dump = None
+        # names of the icons loaded from their copy in the cache dir
+        self._copied_icons = set()
+        self._catalog_lock = threading.Lock()
 
     def __del__(self):
         self.dbg('__del__')
+        self.shutdown()
+
+    def shutdown(self):
+        """
+        Stops the servers, the worker threads and the event loop. Keypirinha has no callback for unloading a
+        plugin, __del__ calls it.
+        """
+        for server in self.servers.values():
+            server.close()
+        self.servers = {}
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        self.io.stop()
 
     def on_start(self):
         self.dbg('on_start')
         self._init_actions()
+        self.io.start()
         self._read_config()
         self._load_icons()
+        self._init_executor()
+
+    def _init_executor(self):
+        """
+        Creates the worker threads anew if max_workers changed, the ones still busy finish their work first.
+        """
+        if self.executor is not None and self._executor_workers == self.max_workers:
+            return
+        previous = self.executor
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="youtrack")
+        self._executor_workers = self.max_workers
+        if previous is not None:
+            previous.shutdown(wait=False)
 
     def _read_config(self):
         kp_settings = keypirinha.settings()
@@ -54,10 +110,33 @@ class YouTrack(kp.Plugin):
         self.idle_time = settings.get_float(
             "idle_time", self.CONFIG_SECTION_MAIN,
             fallback=self.DEFAULT_IDLE_TIME, min=0.25, max=3)
-
-
+        min_idle_time = settings.get_float(
+            "min_idle_time", self.CONFIG_SECTION_MAIN,
+            fallback=self.DEFAULT_MIN_IDLE_TIME, min=0, max=self.idle_time)
+        # the typing and round trip history is kept unless the limits changed
+        if self.debouncer is None or (self.debouncer.min_wait, self.debouncer.max_wait) != (min_idle_time, self.idle_time):
+            self.debouncer = AdaptiveDebouncer(min_idle_time, self.idle_time)
+        self.max_workers = settings.get_int(
+            "max_workers", self.CONFIG_SECTION_MAIN, fallback=self.DEFAULT_MAX_WORKERS, min=1, max=32)
+        self.fanout_timeout = settings.get_float(
+            "search_all_timeout", self.CONFIG_SECTION_MAIN, fallback=self.DEFAULT_FANOUT_TIMEOUT, min=0.5, max=60)
+        self.search_all_label = settings.get(
+            "search_all_label", self.CONFIG_SECTION_MAIN, fallback=self.DEFAULT_SEARCH_ALL_LABEL)
+        self.stats_label = settings.get(
+            "performance_stats_label", self.CONFIG_SECTION_MAIN, fallback=self.DEFAULT_STATS_LABEL)
+        stats_dump_interval = settings.get_float(
+            "performance_stats_dump_interval", self.CONFIG_SECTION_MAIN, fallback=0, min=0)
+
+        if self.stats_dump is not None:
+            self.stats_dump.stop()
+            self.stats_dump = None
+        if stats_dump_interval > 0:
+            self.stats_dump = StatsDump(os.path.join(self.get_cache_dir(), self.STATS_FILE_NAME),
+                                        self.stats_snapshot, stats_dump_interval, self.dbg)
+            self.stats_dump.start()
+
+        previous_servers = self.servers
         self.servers = {}
-
         for section in settings.sections():
             if section.lower().startswith("server/"):
                 server_label = section[len("server/"):].strip()
@@ -83,15 +162,30 @@ class YouTrack(kp.Plugin):
                 max_results = app_max_results
             if max_search_results + 2 > app_max_results:
                 max_search_results = app_max_results - 2
+            # unchanged servers keep their connections, caches and index
+            config_signature = self._section_signature(settings, section, max_results, max_search_results)
+            previous_server = previous_servers.pop(server_name, None)
+            if previous_server is not None:
+                if previous_server.config_signature == config_signature:
+                    self.servers[server_name] = previous_server
+                    continue
+                previous_server.close()
             try:
                 server_ = YouTrackServer(self, server_name, max_results, max_search_results)
                 server_.init_from_config(settings, section)
+                server_.config_signature = config_signature
                 self.servers[server_name] = server_
             except ValueError as exc:
                 self.warn(str(exc))
                 self.warn("Server [{}] skipped due to error".format(section))
                 continue
 
+        for server in previous_servers.values():
+            server.close()
+
+    @staticmethod
+    def _section_signature(settings, section, *args):
+        return args + tuple(sorted((key, settings.get(key, section)) for key in settings.keys(section)))
 
     def _init_actions(self):
         self.dbg('_init_actions')
@@ -145,9 +239,45 @@ class YouTrack(kp.Plugin):
                 args_hint=kp.ItemArgsHint.REQUIRED,
                 hit_hint=kp.ItemHitHint.NOARGS,
                 icon_handle=self._icons[server.issues_icon]))
+            catalog.extend(server.create_catalog_items())
+        if len(self.servers) > 1:
+            catalog.append(self.create_item(
+                category=self.ITEMCAT_ALL_SERVERS,
+                label=self.search_all_label,
+                short_desc="Search issues on all configured YouTrack servers at once",
+                target=kpu.kwargs_encode(server="*"),
+                args_hint=kp.ItemArgsHint.REQUIRED,
+                hit_hint=kp.ItemHitHint.NOARGS,
+                icon_handle=self._icons[ICON_KEY_DEFAULT]))
+        if self.stats_label and self.servers:
+            catalog.append(self.create_item(
+                category=self.ITEMCAT_STATS,
+                label=self.stats_label,
+                short_desc="Time spent in each stage of the requests to the YouTrack servers",
+                target="performance_stats",
+                args_hint=kp.ItemArgsHint.ACCEPTED,
+                hit_hint=kp.ItemHitHint.NOARGS,
+                icon_handle=self._icons[ICON_KEY_DEFAULT]))
         self.set_catalog(catalog)
 
+    def refresh_catalog(self):
+        """
+        Rebuilds the catalog after a server synced its saved searches and projects, called from its sync thread.
+        Before on_start is done, the catalog is built by on_catalog afterwards anyway.
+        """
+        if self.executor is None:
+            return
+        with self._catalog_lock:
+            self.on_catalog()
+
     def on_suggest(self, user_input: str, items_chain: List):
+        self.debouncer.keystroke()
+        if items_chain and items_chain[0].category() == self.ITEMCAT_ALL_SERVERS:
+            self._suggest_all_servers(user_input)
+            return
+        if items_chain and items_chain[0].category() == self.ITEMCAT_STATS:
+            self._suggest_stats()
+            return
         if not items_chain or items_chain[0].category() not in [self.ITEMCAT_FILTER, self.ITEMCAT_ISSUES, self.ITEMCAT_SWITCH]:
             return
         current_item = items_chain[0]
@@ -165,9 +295,17 @@ class YouTrack(kp.Plugin):
         # default item
         suggestions[0].set_args(user_input)
 
+        # recently opened issues are shown while waiting for the server
+        recent_suggestions = server.get_recent_suggestions(user_input, items_chain)
+        if recent_suggestions:
+            self.set_suggestions(recent_suggestions, kp.Match.ANY, kp.Sort.NONE)
+
         # avoid doing unnecessary network requests in case user is still typing
-        if self.should_terminate(self.idle_time):
+        started = server.stats.clock()
+        if not server.can_answer_locally(user_input, items_chain) \
+                and self.should_terminate(self.debouncer.wait_time(server.key)):
             return
+        server.stats.record(ENDPOINT_SUGGEST, STAGE_DEBOUNCE, server.stats.clock() - started)
 
         server_suggestions = []
 
@@ -176,6 +314,9 @@ class YouTrack(kp.Plugin):
             self.dbg("len=" + str(len(server_suggestions)))
             if self.should_terminate():
                 return
+        except Cancelled:
+            self.dbg("request for {} cancelled".format(user_input))
+            return
         except urllib.error.HTTPError as exc:
             server_suggestions.append(self.create_error_item(
                 label=user_input, short_desc=str(exc)))
@@ -185,20 +326,162 @@ class YouTrack(kp.Plugin):
             traceback.print_exc()
 
         if not server_suggestions:  # change default item
-            server_suggestions[0].set_short_desc("No suggestions found (default action: open browser)")
+            suggestions[0].set_short_desc("No suggestions found (default action: open browser)")
+            server_suggestions = suggestions
 
         self.set_suggestions(server_suggestions, kp.Match.ANY, kp.Sort.NONE)
+        server.stats.record(ENDPOINT_SUGGEST, STAGE_TOTAL, server.stats.clock() - started)
+
+        # issue lists come without descriptions, they are shown once fetched for the issues listed
+        try:
+            hydrated = server.hydrate_descriptions(server_suggestions)
+        except Cancelled:
+            return
+        except Exception as exc:
+            self.dbg("fetching descriptions failed: " + str(exc))
+            return
+        if hydrated is not None and not self.should_terminate():
+            self.set_suggestions(hydrated, kp.Match.ANY, kp.Sort.NONE)
+
+
+    def _suggest_all_servers(self, user_input: str):
+        # avoid doing unnecessary network requests in case user is still typing
+        if self.should_terminate(self.debouncer.wait_time()):
+            return
 
+        servers = list(self.servers.values())
+        futures = {}
+        tokens = []
+        for server in servers:
+            future, token = worker.submit(self.executor, server.fetch_issues, server.filter_prefix + user_input)
+            futures[future] = server
+            tokens.append(token)
+        results = {}
+        errors = []
+        pending = set(futures)
+        deadline = time.monotonic() + self.fanout_timeout
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = concurrent.futures.wait(
+                pending, timeout=min(remaining, 0.05), return_when=concurrent.futures.FIRST_COMPLETED)
+            if self.should_terminate():
+                for token in tokens:
+                    token.cancel()
+                for future in pending:
+                    future.cancel()
+                return
+            for future in done:
+                server = futures[future]
+                try:
+                    results[server] = future.result()
+                except Exception as exc:
+                    errors.append(self.create_error_item(label=server.name, short_desc="Error: " + str(exc)))
+            if done:
+                self.set_suggestions(self._merge_ranked(servers, results) + errors, kp.Match.ANY, kp.Sort.NONE)
+
+        for token in tokens:
+            token.cancel()
+        for future in pending:
+            future.cancel()
+            server = futures[future]
+            self.dbg("search all servers: {} did not answer in time".format(server.name))
+            errors.append(self.create_error_item(
+                label=server.name, short_desc="No answer within {} seconds".format(self.fanout_timeout)))
+        suggestions = self._merge_ranked(servers, results) + errors
+        if not suggestions:
+            suggestions.append(self.create_error_item(label=user_input, short_desc="No issues found on any server"))
+        self.set_suggestions(suggestions, kp.Match.ANY, kp.Sort.NONE)
+
+        # issue lists come without descriptions, each server fetches the ones of its issues listed
+        for server in results:
+            try:
+                hydrated = server.hydrate_descriptions(suggestions)
+            except Cancelled:
+                return
+            except Exception as exc:
+                self.dbg("fetching descriptions from {} failed: {}".format(server.name, exc))
+                continue
+            if self.should_terminate():
+                return
+            if hydrated is not None:
+                suggestions = hydrated
+                self.set_suggestions(suggestions, kp.Match.ANY, kp.Sort.NONE)
+
+    @staticmethod
+    def _merge_ranked(servers, results):
+        """
+        Interleaves the issues of the servers by their relative rank in the result of their server.
+        """
+        ranked = []
+        for server_order, server in enumerate(servers):
+            issues = results.get(server, [])[:server.max_search_results]
+            for rank, issue in enumerate(issues):
+                ranked.append((rank / len(issues), server_order, server, issue))
+        ranked.sort(key=lambda entry: entry[:2])
+        seen = set()
+        suggestions = []
+        for _, _, server, issue in ranked:
+            if issue.url in seen:
+                continue
+            seen.add(issue.url)
+            suggestions.append(server.create_issue_item(issue, desc_prefix=server.name + " ▶ "))
+        return suggestions
+
+    def stats_snapshot(self):
+        return {server.key: server.stats.snapshot() for server in self.servers.values()}
+
+    def _suggest_stats(self):
+        suggestions = []
+        for server in self.servers.values():
+            for endpoint, endpoint_stats in server.stats.snapshot().items():
+                if 'responses' in endpoint_stats:
+                    suggestions.append(self._create_stats_item(
+                        label="{} ▶ {}".format(server.name, endpoint),
+                        short_desc="{responses} responses, {kb:.1f} KB received, {per_response:.1f} KB per response"
+                        .format(responses=endpoint_stats['responses'], kb=endpoint_stats['bytes'] / 1024,
+                                per_response=endpoint_stats['bytes'] / 1024 / endpoint_stats['responses'])))
+                for stage, summary in endpoint_stats['stages'].items():
+                    suggestions.append(self._create_stats_item(
+                        label="{} ▶ {} ▶ {}".format(server.name, endpoint, stage),
+                        short_desc="p50 {p50_ms} ms | p95 {p95_ms} ms | p99 {p99_ms} ms | max {max_ms} ms | {count}x"
+                        .format(**summary)))
+        if not suggestions:
+            suggestions.append(self._create_stats_item(
+                label=self.stats_label, short_desc="Nothing measured yet, search for some issues first"))
+        self.set_suggestions(suggestions, kp.Match.FUZZY, kp.Sort.NONE)
+
+    def _create_stats_item(self, label, short_desc):
+        return self.create_item(
+            category=self.ITEMCAT_STATS,
+            label=label,
+            short_desc=short_desc,
+            target=label,
+            args_hint=kp.ItemArgsHint.FORBIDDEN,
+            hit_hint=kp.ItemHitHint.IGNORE,
+            icon_handle=self._icons[ICON_KEY_DEFAULT])
 
     def on_execute(self, item, action):
         self.dbg('on_execute')
 
+        if item and item.category() == self.ITEMCAT_STATS:
+            kpu.set_clipboard(json.dumps(self.stats_snapshot(), indent=2))
+            return
+
         if not item or not item.data_bag():
             return
         data_bag = kpu.kwargs_decode(item.data_bag())
         if not data_bag:
             return
 
+        if item.category() == self.ITEMCAT_ISSUES and 'id' in data_bag \
+                and (not action or action.name() in (self.ACTION_BROWSE, self.ACTION_COPY_URL)):
+            server = self.servers.get(data_bag['server'])
+            if server is not None:
+                server.record_opened_issue(data_bag['id'], data_bag['summary'], data_bag['description'],
+                                           data_bag['url'])
+
         # ACTION_KEY_DEFAULT
         if not action or action.name() == self.ACTION_BROWSE:
             webbrowser.open(data_bag['url'])
@@ -211,38 +494,72 @@ class YouTrack(kp.Plugin):
         self.dbg('on_events')
         if flags & kp.Events.PACKCONFIG or flags & kp.Events.APPCONFIG:
             self.info("Configuration changed, rebuilding catalog...")
-            self._read_config()
-            self._load_icons()
-            self.on_catalog()
+            # the sync threads of the servers rebuild the catalog as well
+            with self._catalog_lock:
+                self._read_config()
+                self._load_icons()
+                self._init_executor()
+                self.on_catalog()
 
     def _load_icons(self):
-        for key, icon in self._icons.items():
-            icon.free()
-        self._icons.clear()
-        self._icons[ICON_KEY_DEFAULT] = self._load_resource_icon(ICON_KEY_DEFAULT)
+        names = {ICON_KEY_DEFAULT}
         for server in self.servers.values():
-            self.add_if_missing(server.issues_icon)
-            self.add_if_missing(server.filter_icon)
+            names.add(server.issues_icon)
+            names.add(server.filter_icon)
+        for name in [name for name in self._icons if name not in names]:
+            self._icons.pop(name).free()
+            self._copied_icons.discard(name)
+        for name in names:
+            self.add_if_missing(name)
 
     def add_if_missing(self, icon):
-        if not icon in self._icons:
-            self.dbg(str.format("loading icon {0}", icon))
-            self._icons[icon] = self._load_resource_icon(name=icon)
-
-    def _load_resource_icon(self, name):
-        full_name = self.package_full_name()
-        package_path = self.RES_ICON_PATH.format(package=full_name, name=name)
-        config_icon_path = os.path.join(keypirinha.user_config_dir(), self.RES_ICON_CONFIG_PATH.format(name=name))
-        cache_dir = keypirinha.package_cache_dir(full_name)
+        copied, changed = self._copy_config_icon(icon)
+        if icon in self._icons and not changed:
+            return
+        self.dbg(str.format("loading icon {0}", icon))
+        if icon in self._icons:
+            self._icons.pop(icon).free()
+        self._icons[icon] = self._load_resource_icon(name=icon, copied=copied)
+        if copied:
+            self._copied_icons.add(icon)
+        else:
+            self._copied_icons.discard(icon)
+
+    def get_cache_dir(self):
+        cache_dir = keypirinha.package_cache_dir(self.package_full_name())
         # create package dir in cache dir
-        try: os.makedirs(cache_dir)
-        except: pass
-
-        # copy to cache so that cache:// works
+        os.makedirs(cache_dir, exist_ok=True)
+        return cache_dir
+
+    def _copy_config_icon(self, name):
+        """
+        Copies the user icon to the cache dir so that cache:// works, unless it did not change since the last copy.
+        Returns whether the copy is available and whether the icon changed.
+        """
+        config_icon_path = os.path.join(keypirinha.user_config_dir(), self.RES_ICON_CONFIG_PATH.format(name=name))
+        cache_dir = self.get_cache_dir()
         try:
-            shutil.copy(config_icon_path, cache_dir)
-            package_path = self.CACHE_ICON_CONFIG_PATH.format(package=full_name,name=name)
+            source = os.stat(config_icon_path)
+        except OSError:
+            return False, name in self._copied_icons
+        try:
+            # copy2 keeps the modification time, an unchanged icon has the same one as its copy
+            copy = os.stat(os.path.join(cache_dir, os.path.basename(config_icon_path)))
+            if (copy.st_mtime_ns, copy.st_size) == (source.st_mtime_ns, source.st_size):
+                return True, name not in self._copied_icons
+        except OSError:
+            pass
+        try:
+            shutil.copy2(config_icon_path, cache_dir)
         except Exception as e:
             self.dbg("Could not copy {file} to cache {cache} ".format(file=config_icon_path,cache=cache_dir) )
+            return False, name in self._copied_icons
+        return True, True
 
+    def _load_resource_icon(self, name, copied):
+        full_name = self.package_full_name()
+        package_path = self.RES_ICON_PATH.format(package=full_name, name=name)
+        config_icon_path = os.path.join(keypirinha.user_config_dir(), self.RES_ICON_CONFIG_PATH.format(name=name))
+        if copied:
+            package_path = self.CACHE_ICON_CONFIG_PATH.format(package=full_name,name=name)
         return self.load_icon([config_icon_path, package_path])
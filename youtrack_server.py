@@ -1,12 +1,32 @@
 import functools
+import os
+import re
+import threading
+import time
+import urllib.error
+import zlib
 from enum import Enum
 from typing import Sequence
 
 import keypirinha as kp
 import keypirinha_util as kpu
 
-from .lib.api import Api
+from .lib import worker
+from .lib.api import Api, Issue
+from .lib.async_transport import AsyncConnectionPool
+from .lib.cache import ResponseCache
+from .lib.frecency import FrecencyStore
+from .lib.health import ServerHealth
+from .lib.issue_index import IssueIndex, IssueIndexSync, is_free_text
 from .lib.legacy_api import Api as LegacyApi
+from .lib.persistent_cache import PersistentCache
+from .lib.prefetch import Prefetcher
+from .lib.query import QueryCompleter, parse_issue_id, parse_project_prefix
+from .lib.refine import SuggestionRefiner
+from .lib.stats import ENDPOINT_SUGGEST, STAGE_ITEMS, Stats
+from .lib.transport import ConnectionPool
+from .lib.trigram import TrigramIndex
+from .lib.worker import PeriodicTask
 
 
 class SuggestionMode(Enum):
@@ -22,15 +42,45 @@ class YouTrackServer():
     NAME_DEFAULT: str = "YouTrack"
     LABEL_DEFAULT: str = "YouTrack"
     LEGACY_API_DEFAULT: bool = False
+    ASYNC_IO_DEFAULT: bool = True
+    CACHE_SIZE_DEFAULT: int = 200
+    SUGGESTIONS_CACHE_TTL_DEFAULT: float = 60.0
+    ISSUES_CACHE_TTL_DEFAULT: float = 30.0
+    SUGGESTIONS_REFINE_TTL_DEFAULT: float = 30.0
+    INDEX_SYNC_INTERVAL_DEFAULT: float = 300.0
+    PERSISTENT_CACHE_SIZE_DEFAULT: int = 500
+    PERSISTENT_CACHE_MAX_AGE_DEFAULT: float = 86400.0
+    RECENT_ISSUES_DEFAULT: int = 100
+    RECENT_ISSUES_HALF_LIFE_DEFAULT: float = 7.0
+    RECENT_ISSUES_PREFIX: str = "recent ▶ "
+    SIMILAR_ISSUES_PREFIX: str = "similar ▶ "
+    TRIGRAM_INDEX_SIZE: int = 5000
+    PROJECTS_TTL: float = 3600.0
+    MAX_PROJECT_COMPLETIONS: int = 10
+    LOCAL_COMPLETION_DEFAULT: bool = True
+    METADATA_SYNC_INTERVAL_DEFAULT: float = 3600.0
+    CATALOG_SYNC_INTERVAL_DEFAULT: float = 3600.0
+    CATALOG_PREWARM: int = 5
+    PREFETCH_ISSUES_DEFAULT: int = 3
+    PREFETCH_BUDGET_DEFAULT: int = 2048
+    # seconds the input has to stay the same before the issue lists of its suggestions are prefetched
+    PREFETCH_DELAY: float = 1.0
+    DESCRIPTION_LENGTH: int = 150
+    DESCRIPTIONS_CACHE_SIZE: int = 2000
+    DESCRIPTIONS_TTL: float = 86400.0
+    ITEMS_MEMO_SIZE: int = 1000
+    ITEMS_MEMO_TTL: float = 3600.0
 
     suggestion_mode: SuggestionMode = SuggestionMode.Filter
 
     def __init__(self, plugin, name: str, max_results: int, max_search_results: int):
         self.reset()
         self.plugin = plugin
+        self.key = name
         self.name = name
         self.max_results = max_results
         self.max_search_results = max_search_results
+        self.config_signature = None
 
         self.filter_icon = ICON_KEY_DEFAULT
         self.issues_icon = ICON_KEY_DEFAULT
@@ -42,8 +92,55 @@ class YouTrackServer():
         self.keyword = self.KEYWORD_DEFAULT
         self.max_results = 100
         self.api = None
+        self.transport = None
+        self.stats = Stats()
+        self.health = ServerHealth()
+        self.cache = ResponseCache(self.CACHE_SIZE_DEFAULT)
+        self.suggestions_cache_ttl = self.SUGGESTIONS_CACHE_TTL_DEFAULT
+        self.issues_cache_ttl = self.ISSUES_CACHE_TTL_DEFAULT
+        self.refiner = SuggestionRefiner(self.SUGGESTIONS_REFINE_TTL_DEFAULT)
+        # description snippets of the issues by (id, updated), issue lists come without them
+        self.descriptions = ResponseCache(self.DESCRIPTIONS_CACHE_SIZE)
+        # items built for earlier keystrokes, the same issues and filter suggestions come back while typing
+        self.items = ResponseCache(self.ITEMS_MEMO_SIZE)
+        # (item, issue, desc_prefix) of the issue items built without a description by id(item), the item is kept
+        # along so that its id is not reused meanwhile
+        self.undescribed = ResponseCache(self.ITEMS_MEMO_SIZE)
+        self.persistent_cache = None
+        self.persistent_cache_max_age = self.PERSISTENT_CACHE_MAX_AGE_DEFAULT
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+        self.recent_issues = None
+        # ids and summaries of the issues seen, for ranking them and for typos
+        self.trigrams = TrigramIndex(self.TRIGRAM_INDEX_SIZE)
+        self.index = None
+        self.index_sync = None
+        self.completer = None
+        self.metadata_sync = None
+        # saved searches and pinned projects listed in the catalog
+        self.catalog = {}
+        self.catalog_sync = None
+        self.prefetcher = None
+        self.prefetch_issues_count = 0
         self.filter_prefix = ""
 
+    def close(self):
+        if self.prefetcher is not None:
+            self.prefetcher.cancel()
+        if self.metadata_sync is not None:
+            self.metadata_sync.stop()
+        if self.catalog_sync is not None:
+            self.catalog_sync.stop()
+        if self.index_sync is not None:
+            self.index_sync.stop()
+        if self.index is not None:
+            self.index.close()
+        if self.persistent_cache is not None:
+            self.persistent_cache.close()
+        self.health.close()
+        if self.transport is not None:
+            self.transport.close()
+
     def dbg(self, text):
         self.plugin.dbg(text)
 
@@ -56,12 +153,63 @@ class YouTrackServer():
         if section.lower().startswith("server/"):
             youtrack_url = settings.get("base_url", section, None)
             api_token = settings.get("api_token", section, None)
-            self.legacy_api = settings.get("legacy_api", section, False)
-            actual_max_results = self.max_results if self.max_results == self.max_search_results else self.max_search_results
+            self.legacy_api = settings.get_bool("legacy_api", section, self.LEGACY_API_DEFAULT)
+            # a page of issues leaves room for the "Load more…" item
+            actual_max_results = max(1, self.max_search_results - 1)
+            max_connections = settings.get_int("max_connections", section, ConnectionPool.DEFAULT_MAX_SIZE, min=1, max=16)
+            connect_timeout = settings.get_float(
+                "connect_timeout", section, ConnectionPool.DEFAULT_CONNECT_TIMEOUT, min=0.5, max=60)
+            read_timeout = settings.get_float("read_timeout", section, ConnectionPool.DEFAULT_READ_TIMEOUT, min=0.5, max=300)
+            self.health = ServerHealth(
+                failure_threshold=settings.get_int(
+                    "failure_threshold", section, ServerHealth.FAILURE_THRESHOLD_DEFAULT, min=1),
+                open_interval=settings.get_float(
+                    "circuit_open_interval", section, ServerHealth.OPEN_INTERVAL_DEFAULT, min=0.5, max=300),
+                rate=settings.get_float("rate_limit", section, ServerHealth.RATE_DEFAULT, min=0),
+                burst=settings.get_int("rate_limit_burst", section, ServerHealth.BURST_DEFAULT, min=1),
+                dbg=self.dbg)
+            pool_options = dict(max_size=max_connections, connect_timeout=connect_timeout, read_timeout=read_timeout,
+                                stats=self.stats, health=self.health)
+            self.transport = AsyncConnectionPool(youtrack_url, dbg=self.dbg, io=self.plugin.io, **pool_options) \
+                if settings.get_bool("async_io", section, self.ASYNC_IO_DEFAULT) \
+                else ConnectionPool(youtrack_url, dbg=self.dbg, **pool_options)
             self.api = \
-                Api(api_token=api_token, youtrack_url=youtrack_url, dbg=self.dbg, max_results=actual_max_results) \
+                Api(api_token=api_token, youtrack_url=youtrack_url, dbg=self.dbg, max_results=actual_max_results,
+                    transport=self.transport) \
                 if not self.legacy_api \
-                else LegacyApi(api_token=api_token, youtrack_url=youtrack_url, dbg=self.dbg, max_results=actual_max_results)
+                else LegacyApi(api_token=api_token, youtrack_url=youtrack_url, dbg=self.dbg,
+                               max_results=actual_max_results, transport=self.transport)
+            self.health.probe = self.api.probe
+            self.cache = ResponseCache(settings.get_int("cache_size", section, self.CACHE_SIZE_DEFAULT, min=0))
+            self.suggestions_cache_ttl = settings.get_float(
+                "suggestions_cache_ttl", section, self.SUGGESTIONS_CACHE_TTL_DEFAULT, min=0)
+            self.issues_cache_ttl = settings.get_float("issues_cache_ttl", section, self.ISSUES_CACHE_TTL_DEFAULT, min=0)
+            self.refiner = SuggestionRefiner(settings.get_float(
+                "suggestions_refine_ttl", section, self.SUGGESTIONS_REFINE_TTL_DEFAULT, min=0))
+            persistent_cache_size = settings.get_int(
+                "persistent_cache_size", section, self.PERSISTENT_CACHE_SIZE_DEFAULT, min=0)
+            self.persistent_cache_max_age = settings.get_float(
+                "persistent_cache_max_age", section, self.PERSISTENT_CACHE_MAX_AGE_DEFAULT, min=0)
+            if persistent_cache_size > 0:
+                self.init_persistent_cache(persistent_cache_size)
+            recent_issues = settings.get_int("recent_issues", section, self.RECENT_ISSUES_DEFAULT, min=0)
+            if recent_issues > 0:
+                half_life_days = settings.get_float(
+                    "recent_issues_half_life", section, self.RECENT_ISSUES_HALF_LIFE_DEFAULT, min=0.01)
+                self.recent_issues = FrecencyStore(self.get_server_file_path("recent_", ".json"), recent_issues,
+                                                   half_life_days * 86400, self.dbg)
+                self.trigrams.add([self.api.ISSUE_TYPE(**entry) for entry in self.recent_issues.top("", recent_issues)])
+            self.prefetch_issues_count = settings.get_int(
+                "prefetch_issues", section, self.PREFETCH_ISSUES_DEFAULT, min=0, max=10)
+            budget_kb = settings.get_int("prefetch_budget", section, self.PREFETCH_BUDGET_DEFAULT, min=0)
+            if budget_kb > 0 and self.issues_cache_ttl > 0:
+                self.prefetcher = Prefetcher(self.plugin.io.submit, budget_kb * 1024, self.dbg)
+            if settings.get_bool("local_completion", section, self.LOCAL_COMPLETION_DEFAULT):
+                self.init_completer(settings.get_float(
+                    "metadata_sync_interval", section, self.METADATA_SYNC_INTERVAL_DEFAULT, min=60))
+            if settings.get_bool("index", section, False):
+                self.init_index(settings.get("index_query", section, ""),
+                                settings.get_float("index_sync_interval", section, self.INDEX_SYNC_INTERVAL_DEFAULT, min=30))
             self.filter_label = settings.get("filter_label", section, self.LABEL_DEFAULT)
             self.issues_label = settings.get("issues_label", section, self.LABEL_DEFAULT)
             self.name = settings.get("name", section, self.NAME_DEFAULT)
@@ -71,6 +219,130 @@ class YouTrackServer():
             dont_append = settings.get_bool("filter_dont_append_whitespace", section, False)
             self.filter_prefix = settings.get("filter", section, "") + ("" if dont_append else " ")
             self.print(filter_prefix=self.filter_prefix)
+            catalog_sync_interval = settings.get_float(
+                "catalog_sync_interval", section, self.CATALOG_SYNC_INTERVAL_DEFAULT, min=0)
+            if catalog_sync_interval > 0:
+                self.init_catalog(max(60.0, catalog_sync_interval))
+
+    def init_index(self, query: str, interval: float):
+        if self.legacy_api:
+            self.plugin.warn('Local issue index of server "{}" requires the non-legacy api, skipped'.format(self.key))
+            return
+        self.index = IssueIndex(self.get_server_file_path("index_", ".sqlite"), query)
+        self.index_sync = IssueIndexSync(self.index, self.api, self.dbg, interval, query)
+        self.index_sync.start()
+
+    def init_completer(self, interval: float):
+        if self.legacy_api:
+            self.dbg('local completion of server "{}" requires the non-legacy api, skipped'.format(self.key))
+            return
+        self.completer = QueryCompleter(self.api.SUGGESTION_TYPE, self.max_results)
+        self.metadata_sync = PeriodicTask("youtrack-metadata-" + self.key, self.sync_metadata, interval, self.dbg)
+        self.metadata_sync.start()
+
+    def sync_metadata(self):
+        """
+        Fetches the projects, custom fields, users and tags the query language refers to. The ones fetched
+        before are used until then.
+        """
+        if not self.completer.is_ready() and self.persistent_cache is not None and self.persistent_cache.loaded.wait(5):
+            persisted = self.persistent_cache.get(('vocabulary',))
+            if persisted is not None:
+                self.completer.update(persisted[0])
+        previous = self.completer.vocabulary or {}
+        projects = self.plugin.io.run(self.fetch_projects(None))
+        self.store(self.api.projects_cache_key(), projects, self.PROJECTS_TTL)
+        vocabulary = {
+            'projects': [[project.short_name, project.name] for project in projects],
+            'fields': self.fetch_metadata(self.api.get_custom_fields, previous.get('fields', {})),
+            'users': self.fetch_metadata(self.api.get_users, previous.get('users', [])),
+            'tags': self.fetch_metadata(self.api.get_tags, previous.get('tags', [])),
+        }
+        self.completer.update(vocabulary)
+        if self.persistent_cache is not None:
+            self.persistent_cache.put(('vocabulary',), vocabulary)
+        self.dbg("synced metadata of {}: {} fields, {} users, {} tags".format(
+            self.key, len(vocabulary['fields']), len(vocabulary['users']), len(vocabulary['tags'])))
+
+    def init_catalog(self, interval: float):
+        if self.legacy_api:
+            self.dbg('saved searches of server "{}" require the non-legacy api, skipped'.format(self.key))
+            return
+        self.catalog_sync = PeriodicTask("youtrack-catalog-" + self.key, self.sync_catalog, interval, self.dbg)
+        self.catalog_sync.start()
+
+    def sync_catalog(self):
+        """
+        Fetches the saved searches and pinned projects listed in the catalog, then the issue lists of the first
+        ones, so that they are shown right away when chosen.
+        """
+        if not self.catalog and self.persistent_cache is not None and self.persistent_cache.loaded.wait(5):
+            persisted = self.persistent_cache.get(('catalog',))
+            if persisted is not None:
+                self.catalog = persisted[0]
+                self.plugin.refresh_catalog()
+        catalog = {
+            'saved_queries': self.fetch_metadata(self.api.get_saved_queries, self.catalog.get('saved_queries', [])),
+            'projects': self.fetch_metadata(self.api.get_pinned_projects, self.catalog.get('projects', [])),
+        }
+        if catalog != self.catalog:
+            self.catalog = catalog
+            if self.persistent_cache is not None:
+                self.persistent_cache.put(('catalog',), catalog)
+            self.plugin.refresh_catalog()
+        self.dbg("synced catalog of {}: {} saved searches, {} projects".format(
+            self.key, len(catalog['saved_queries']), len(catalog['projects'])))
+        if self.issues_cache_ttl > 0:
+            for _, filter in self.get_catalog_filters()[:self.CATALOG_PREWARM]:
+                self.prewarm_issues(filter)
+
+    def prewarm_issues(self, filter: str):
+        # fetched like refresh_in_background does, the debouncer only learns from round trips the user waits for
+        key = self.api.issues_cache_key(filter)
+        persisted = self.get_persisted_entry(key, self.issues_cache_ttl)
+        if self.cache.get(key) is not None or persisted is not None and persisted[1] < self.issues_cache_ttl:
+            return
+        try:
+            with self.health.background():
+                self.store(key, self.api.get_issues_matching_filter(filter), self.issues_cache_ttl)
+        except OSError as exc:
+            self.dbg("prefetching issues of {} failed: {}".format(filter, exc))
+
+    def get_catalog_filters(self):
+        return [(name, query) for name, query in self.catalog.get('saved_queries', [])] + \
+            [(name, "project: " + short_name) for short_name, name in self.catalog.get('projects', [])]
+
+    def create_catalog_items(self):
+        return [self.plugin.create_item(
+            category=self.plugin.ITEMCAT_ISSUES,
+            label=self.issues_label + " ▶ " + name,
+            short_desc=self.name + " | " + filter,
+            target=kpu.kwargs_encode(server=self.key, filter=filter),
+            args_hint=kp.ItemArgsHint.ACCEPTED,
+            hit_hint=kp.ItemHitHint.NOARGS,
+            icon_handle=self.plugin._icons[self.issues_icon],
+            data_bag=kpu.kwargs_encode(url=self.api.create_issues_url(filter), effective_value=filter))
+            for name, filter in self.get_catalog_filters()]
+
+    def fetch_metadata(self, fetch, previous):
+        try:
+            return fetch()
+        except urllib.error.HTTPError as exc:
+            # e.g. if the user may not list them, the completer falls back to the server for their values
+            self.dbg("metadata not available: " + str(exc))
+            return previous if exc.code >= 500 else type(previous)()
+
+    def init_persistent_cache(self, max_entries: int):
+        self.persistent_cache = PersistentCache(self.get_server_file_path("cache_", ".bin"), max_entries, self.dbg)
+        self.persistent_cache.load_async()
+
+    def get_cache_file_path(self, file_name: str) -> str:
+        return os.path.join(self.plugin.get_cache_dir(), re.sub(r'[^\w.-]', '_', file_name))
+
+    def get_server_file_path(self, prefix: str, extension: str) -> str:
+        # files of a server configured under the same name before are not mixed up with the ones of this server
+        url_hash = "{:08x}".format(zlib.crc32(self.api.youtrack_url.encode('utf-8')))
+        return self.get_cache_file_path(prefix + self.key + "_" + url_hash + extension)
 
     def on_suggest(self, user_input: str, items_chain: Sequence):
         self.dbg('on_suggest')
@@ -79,43 +351,88 @@ class YouTrackServer():
             return []
 
         initial_item = items_chain[0]
-        current_items = items_chain[1:len(items_chain)]
         current_suggestion_type: SuggestionMode = self.get_current_suggestion_mode(items_chain)
         suggestions = []
-        actual_user_input = self.filter_prefix if len(items_chain) == 1 else ""
-        previous_effective_value = ""
-        if (len(current_items) > 0):
-            current_item = current_items[-1]
-            previous_effective_value = kpu.kwargs_decode(current_item.data_bag())['effective_value']
-            actual_user_input += previous_effective_value + ' '
-        actual_user_input += user_input
+        actual_user_input, previous_effective_value = self.get_actual_user_input(user_input, items_chain)
         self.print(actual_user_input=actual_user_input, user_input=user_input)
         self.print(is_filter=str(current_suggestion_type))
         if current_suggestion_type == SuggestionMode.Filter:
             self.add_filter_suggestions(actual_user_input, suggestions)
         else:
-            self.add_issues_matching_filter(actual_user_input, suggestions)
+            self.add_issues_matching_filter(actual_user_input, suggestions, self.get_skip(user_input, items_chain))
 
-        suggestions.append(self.plugin.create_item(
-            category=self.plugin.ITEMCAT_SWITCH,
-            label="Switch ⇆",
-            short_desc="Switch between filter suggestions and issue list",
-            target="switch",
-            args_hint=kp.ItemArgsHint.ACCEPTED,
-            hit_hint=kp.ItemHitHint.IGNORE,
-            icon_handle=self.plugin._icons[self.filter_icon],
-            loop_on_suggest=True,
-            data_bag=kpu.kwargs_encode(url=self.api.create_issues_url(previous_effective_value),
-                                       effective_value=previous_effective_value)))
+        suggestions.append(self.memoized_item(('switch', previous_effective_value), self.filter_icon,
+                                              self.create_switch_item, previous_effective_value))
 
-        # avoid flooding YouTrack with too many unnecessary queries in
-        # case user is still typing her search
-        if self.plugin.should_terminate(self.plugin.idle_time):
+        if self.plugin.should_terminate():
             return []
         if initial_item.category() == self.plugin.ITEMCAT_SWITCH:
             return []
         return suggestions
 
+    def get_actual_user_input(self, user_input: str, items_chain: Sequence):
+        current_item = items_chain[-1]
+        # the catalog items of saved searches and projects carry their filter like suggestions do
+        carries_filter = len(items_chain) > 1 or bool(current_item.data_bag())
+        actual_user_input = "" if carries_filter else self.filter_prefix
+        previous_effective_value = ""
+        if carries_filter:
+            previous_effective_value = kpu.kwargs_decode(current_item.data_bag())['effective_value']
+            # the number of an issue id follows the completed project directly
+            actual_user_input += previous_effective_value + ('' if previous_effective_value.endswith('-') else ' ')
+        actual_user_input += user_input
+        return actual_user_input, previous_effective_value
+
+    @staticmethod
+    def get_skip(user_input: str, items_chain: Sequence) -> int:
+        """
+        The amount of issues to skip after "Load more…" was chosen, typing on starts at the first page again.
+        """
+        if len(items_chain) < 2 or user_input.strip():
+            return 0
+        return kpu.kwargs_decode(items_chain[-1].data_bag()).get('skip', 0)
+
+    def get_typed_text(self, actual_user_input: str) -> str:
+        return actual_user_input[len(self.filter_prefix):] \
+            if actual_user_input.startswith(self.filter_prefix) else actual_user_input
+
+    def can_answer_locally(self, user_input: str, items_chain: Sequence) -> bool:
+        """
+        Whether suggestions for the input are available without asking the server, so there is no need to wait
+        for further typing.
+        """
+        if not items_chain:
+            return False
+        if self.health.is_open():
+            # fails right away, waiting for further typing would only delay the error
+            return True
+        actual_user_input, _ = self.get_actual_user_input(user_input, items_chain)
+        if self.get_current_suggestion_mode(items_chain) == SuggestionMode.Filter:
+            return self.is_fresh(self.api.suggestions_cache_key(actual_user_input), self.suggestions_cache_ttl) \
+                or self.refiner.refine(actual_user_input) is not None \
+                or self.complete_locally(actual_user_input) is not None
+        skip = self.get_skip(user_input, items_chain)
+        issue_id = parse_issue_id(self.get_typed_text(actual_user_input)) if skip == 0 else None
+        if issue_id is not None and self.is_fresh(self.api.issue_cache_key(issue_id), self.issues_cache_ttl,
+                                                  non_empty=True):
+            return True
+        if skip == 0 and self.is_known_project(actual_user_input):
+            return True
+        if self.is_answered_by_index(actual_user_input):
+            return True
+        return self.is_fresh(self.api.issues_cache_key(actual_user_input, skip), self.issues_cache_ttl)
+
+    def run_timed(self, fn, *args):
+        started = time.monotonic()
+        result = self.run_cancellable(fn, *args)
+        self.plugin.debouncer.record_round_trip(self.key, time.monotonic() - started)
+        return result
+
+    def run_cancellable(self, fn, *args):
+        # requests waiting on the event loop are sent right from the calling thread, they poll should_terminate
+        return worker.run_cancellable(self.plugin.executor, self.plugin.should_terminate, fn, *args,
+                                      inline=self.transport.polls_cancel_token)
+
     def get_current_suggestion_mode(self, current_items):
         def calc(prev_category, next_category):
             if next_category == self.plugin.ITEMCAT_SWITCH:
@@ -125,8 +442,224 @@ class YouTrackServer():
         reduced = functools.reduce(calc, [item.category() for item in current_items], self.plugin.ITEMCAT_FILTER)
         return SuggestionMode.Filter if reduced == self.plugin.ITEMCAT_FILTER else SuggestionMode.Issues
 
+    def fetch_suggestions(self, actual_user_input: str):
+        key = self.api.suggestions_cache_key(actual_user_input)
+        api_result_suggestions = self.cache.get(key)
+        if api_result_suggestions is not None:
+            return api_result_suggestions
+        api_result_suggestions = self.get_persisted(key, self.api.SUGGESTION_TYPE, self.suggestions_cache_ttl,
+                                                    self.api.get_suggestions_async, actual_user_input)
+        if api_result_suggestions is not None:
+            return api_result_suggestions
+        api_result_suggestions = self.refiner.refine(actual_user_input)
+        if api_result_suggestions is not None:
+            self.dbg("refined suggestions locally for " + actual_user_input)
+            return api_result_suggestions
+        api_result_suggestions = self.complete_locally(actual_user_input)
+        if api_result_suggestions is not None:
+            self.dbg("completed query locally for " + actual_user_input)
+            return api_result_suggestions
+        api_result_suggestions = self.run_timed(self.api.get_suggestions, actual_user_input)
+        self.store(key, api_result_suggestions, self.suggestions_cache_ttl)
+        self.refiner.remember(actual_user_input, api_result_suggestions)
+        return api_result_suggestions
+
+    def complete_locally(self, actual_user_input: str):
+        return self.completer.complete(actual_user_input) if self.completer is not None else None
+
+    def fetch_issues(self, actual_user_input: str, skip: int = 0):
+        issue_id = parse_issue_id(self.get_typed_text(actual_user_input)) if skip == 0 else None
+        if issue_id is not None:
+            issues = self.fetch_issue(issue_id)
+            # might be a word containing a dash as well
+            if issues:
+                return issues
+        index_ready = self.index is not None and self.index.is_ready()
+        if self.is_answered_by_index(actual_user_input):
+            return self.search_index(actual_user_input, skip)
+        key = self.api.issues_cache_key(actual_user_input, skip)
+        issues = self.cache.get(key)
+        if issues is None:
+            issues = self.get_persisted(key, self.api.ISSUE_TYPE, self.issues_cache_ttl,
+                                        self.get_issues_page(skip), actual_user_input)
+        if issues is None:
+            try:
+                issues = self.run_timed(self.api.get_issues_matching_filter, actual_user_input, skip)
+            except urllib.error.HTTPError:
+                raise
+            except OSError as exc:
+                if not index_ready:
+                    raise
+                self.dbg("server not reachable ({}), searching local index instead".format(exc))
+                return self.search_index(
+                    " ".join(word for word in actual_user_input.split() if is_free_text(word)), skip)
+            self.store(key, issues, self.issues_cache_ttl)
+        return issues
+
+    def get_issues_page(self, skip: int):
+        return functools.partial(self.api.get_issues_matching_filter_async, skip=skip)
+
+    def prefetch_next_page(self, actual_user_input: str, skip: int):
+        key = self.api.issues_cache_key(actual_user_input, skip)
+        if not self.is_answered_by_index(actual_user_input) and self.cache.get(key) is None:
+            self.prefetcher.schedule([(key, functools.partial(self.prefetch_issue_list, key, actual_user_input, skip))])
+
+    def is_answered_by_index(self, actual_user_input: str) -> bool:
+        return self.index is not None and is_free_text(actual_user_input) and self.index.is_ready()
+
+    def fetch_issue(self, issue_id: str):
+        key = self.api.issue_cache_key(issue_id)
+        issues = self.cache.get(key)
+        if issues is None:
+            issues = self.get_persisted(key, self.api.ISSUE_TYPE, self.issues_cache_ttl, self.api.find_issue_async,
+                                        issue_id)
+        if issues is None:
+            issues = self.run_timed(self.api.find_issue, issue_id)
+            self.store(key, issues, self.issues_cache_ttl)
+        return issues
+
+    def get_projects(self):
+        """
+        Returns the projects of the server as known locally, they are fetched in the background if not known yet
+        and refreshed every PROJECTS_TTL seconds.
+        """
+        key = self.api.projects_cache_key()
+        projects = self.cache.get(key)
+        if projects is None:
+            projects = self.get_persisted(key, self.api.PROJECT_TYPE, self.PROJECTS_TTL, self.fetch_projects, "projects")
+        if projects is None:
+            self.refresh_in_background(key, self.PROJECTS_TTL, self.fetch_projects, "projects")
+            return []
+        return projects
+
+    async def fetch_projects(self, _):
+        try:
+            return await self.api.get_projects_async()
+        except urllib.error.HTTPError as exc:
+            # not asked again until PROJECTS_TTL passed, e.g. if the user may not list the projects
+            self.dbg("projects not available: " + str(exc))
+            return []
+
+    def is_known_project(self, actual_user_input: str) -> bool:
+        """
+        Whether the input is the short name of a project followed by a dash, so that nothing is found until the
+        number is typed.
+        """
+        prefix = parse_project_prefix(self.get_typed_text(actual_user_input))
+        if prefix is None or not prefix[1]:
+            return False
+        return any(project.short_name.lower() == prefix[0].lower() for project in self.get_projects())
+
+    def get_project_completions(self, actual_user_input: str):
+        prefix = parse_project_prefix(self.get_typed_text(actual_user_input))
+        if prefix is None or prefix[1]:
+            return []
+        typed = prefix[0].lower()
+        projects = sorted((project for project in self.get_projects() if project.short_name.lower().startswith(typed)),
+                          key=lambda project: (len(project.short_name), project.short_name))
+        return [self.plugin.create_item(
+            category=self.plugin.ITEMCAT_ISSUES,
+            label=project.short_name + "-",
+            short_desc=project.name + " | project",
+            target=project.short_name + "-",
+            args_hint=kp.ItemArgsHint.ACCEPTED,
+            hit_hint=kp.ItemHitHint.IGNORE,
+            icon_handle=self.plugin._icons[self.issues_icon],
+            loop_on_suggest=True,
+            data_bag=kpu.kwargs_encode(url=self.api.create_issues_url("project: " + project.short_name),
+                                       effective_value=project.short_name + "-"))
+            for project in projects[:self.MAX_PROJECT_COMPLETIONS]]
+
+    def store(self, key, results: Sequence, ttl: float) -> None:
+        self.cache.put(key, results, ttl)
+        if self.persistent_cache is not None and ttl > 0:
+            self.persistent_cache.put(key, [{name: getattr(result, name) for name in result.__slots__} for result in results])
+
+    def get_persisted_entry(self, key, ttl: float):
+        persisted = self.persistent_cache.get(key) if self.persistent_cache is not None and ttl > 0 else None
+        return persisted if persisted is not None and persisted[1] <= self.persistent_cache_max_age else None
+
+    def is_fresh(self, key, ttl: float, non_empty: bool = False) -> bool:
+        """
+        Whether results for the key are cached or stored on disk and not older than ttl, so that they are served
+        without any request. Stale results are shown as well but refreshed right away. With non_empty, empty
+        results do not count, e.g. an id nothing was found for is searched for as text then.
+        """
+        results = self.cache.get(key)
+        if results is None:
+            persisted = self.get_persisted_entry(key, ttl)
+            if persisted is None or persisted[1] >= ttl:
+                return False
+            results = persisted[0]
+        return bool(results) or not non_empty
+
+    def get_persisted(self, key, result_type, ttl: float, fetch, actual_user_input: str):
+        """
+        Returns the results stored on disk for the key. Stale results are returned as well but refreshed in the
+        background, the next on_suggest for the same input finds the refreshed ones in the cache then.
+        """
+        persisted = self.get_persisted_entry(key, ttl)
+        if persisted is None:
+            return None
+        rows, age = persisted
+        results = [result_type(**row) for row in rows]
+        if age < ttl:
+            self.cache.put(key, results, ttl - age)
+        else:
+            self.dbg("serving stale results for {}, refreshing them".format(actual_user_input))
+            self.refresh_in_background(key, ttl, fetch, actual_user_input)
+        return results
+
+    def refresh_in_background(self, key, ttl: float, fetch, actual_user_input: str):
+        with self._refreshing_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        async def refresh():
+            try:
+                self.store(key, await fetch(actual_user_input), ttl)
+            except Exception as exc:
+                self.dbg("refreshing results for {} failed: {}".format(actual_user_input, exc))
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.discard(key)
+
+        self.plugin.io.submit(refresh())
+
+    def prefetch_issues(self, actual_user_input: str, effective_values: Sequence[str]):
+        """
+        Fetches the issue lists of the input and of the first suggestions in the background once the user stopped
+        typing, the user is likely to switch to one of them next.
+        """
+        jobs = []
+        for value in [actual_user_input] + list(effective_values[:self.prefetch_issues_count]):
+            key = self.api.issues_cache_key(value)
+            if self.cache.get(key) is not None or any(key == job_key for job_key, _ in jobs):
+                continue
+            if self.is_answered_by_index(value):
+                continue
+            jobs.append((key, functools.partial(self.prefetch_issue_list, key, value)))
+        self.prefetcher.schedule(jobs, delay=self.PREFETCH_DELAY)
+
+    async def prefetch_issue_list(self, key, actual_user_input: str, skip: int = 0):
+        if self.cache.get(key) is None:
+            with self.health.background():
+                issues = await self.api.get_issues_matching_filter_async(actual_user_input, skip)
+            self.store(key, issues, self.issues_cache_ttl)
+
+    def search_index(self, text: str, skip: int = 0):
+        return [Issue(id=id, summary=summary if summary is not None else "--no summary--", description=description,
+                      url=self.api.create_issue_url(id))
+                for id, summary, description in self.index.search(text, skip + self.api.max_results + 1)[skip:]]
+
     def add_filter_suggestions(self, actual_user_input, suggestions) -> None:
-        api_result_suggestions = self.api.get_suggestions(actual_user_input)
+        if self.prefetcher is not None:
+            # the input changed, the issue lists prefetched for the previous one are not needed
+            self.prefetcher.cancel()
+        api_result_suggestions = self.fetch_suggestions(actual_user_input)
+        started = self.stats.clock()
+        effective_values = []
         # the first displays the current filter so far
         first = True
         for api_result_suggestion in api_result_suggestions:
@@ -136,46 +669,74 @@ class YouTrackServer():
             user_input_start_ = actual_user_input[:start]
             user_input_end_ = actual_user_input[end:]
             effective_value = user_input_start_ + api_result_suggestion.full_option + user_input_end_
+            effective_values.append(effective_value)
 
-            data_bag_encoded = kpu.kwargs_encode(url=self.api.create_issues_url(effective_value),
-                                                 effective_value=effective_value)
             desc = api_result_suggestion.description + " | " + effective_value if first else api_result_suggestion.description
             first = False
-            suggestions.append(self.plugin.create_item(
-                category=self.plugin.ITEMCAT_FILTER,
-                label=api_result_suggestion.full_option,
-                short_desc=desc,
-                target=kpu.kwargs_encode(server=self.name, label=api_result_suggestion.option),
-                args_hint=kp.ItemArgsHint.ACCEPTED,
-                hit_hint=kp.ItemHitHint.NOARGS,
-                icon_handle=self.plugin._icons[self.filter_icon],
-                loop_on_suggest=True,
-                data_bag=data_bag_encoded))
-        suggestions.insert(0, self.plugin.create_item(
-            category=self.plugin.ITEMCAT_FILTER,
-            label=self.filter_label + "▶" + actual_user_input,
-            short_desc="Open",
-            target=actual_user_input,
-            args_hint=kp.ItemArgsHint.FORBIDDEN,
-            hit_hint=kp.ItemHitHint.KEEPALL,
-            icon_handle=self.plugin._icons[self.filter_icon],
-            loop_on_suggest=False,
-            data_bag=(kpu.kwargs_encode(url=self.api.create_issues_url(actual_user_input),
-                                        effective_value=actual_user_input))))
+            suggestions.append(self.memoized_item(
+                ('filter', api_result_suggestion.full_option, api_result_suggestion.option, effective_value, desc),
+                self.filter_icon, self.create_filter_item, api_result_suggestion, effective_value, desc))
+        suggestions.insert(0, self.memoized_item(('open', self.filter_label, actual_user_input), self.filter_icon,
+                                                 self.create_open_filter_item, actual_user_input))
+        self.stats.record(ENDPOINT_SUGGEST, STAGE_ITEMS, self.stats.clock() - started)
+        if self.prefetcher is not None and self.prefetch_issues_count > 0:
+            self.prefetch_issues(actual_user_input, effective_values)
 
-    def add_issues_matching_filter(self, actual_user_input: str, suggestions: Sequence) -> None:
+    def add_issues_matching_filter(self, actual_user_input: str, suggestions: Sequence, skip: int = 0) -> None:
         self.dbg("add_issues_matching_filter for " + actual_user_input)
-        api_result_suggestions = self.get_issues_matching_filter(actual_user_input)
-        for res in api_result_suggestions[:self.max_search_results]:
+        recent_suggestions = self.get_local_issue_suggestions(actual_user_input) if skip == 0 else []
+        if skip == 0 and self.is_known_project(actual_user_input):
+            suggestions.extend(recent_suggestions)
+            suggestions.insert(0, self.create_issues_filter_item(actual_user_input, "Type the number of the issue"))
+            return
+        issues = self.fetch_issues(actual_user_input, skip)
+        page_size = self.api.max_results
+        recent_suggestions = recent_suggestions[:page_size - 1]
+        # the local rows not on the page take the place of its last issues, which the next page starts with then
+        page_ids = {issue.id for issue in issues[:page_size]}
+        shown = issues[:page_size - len([res for res in recent_suggestions if res.target() not in page_ids])]
+        api_result_suggestions = self.create_issue_items(actual_user_input, shown)
+        recent_ids = {res.target() for res in recent_suggestions}
+        merged = recent_suggestions + [res for res in api_result_suggestions if res.target() not in recent_ids]
+        similar_suggestions = self.get_similar_issue_suggestions(actual_user_input, recent_ids) \
+            if skip == 0 and not api_result_suggestions else []
+        merged += similar_suggestions
+        for res in merged[:page_size]:
             suggestions.append(res)
         desc: str = actual_user_input
 
-        if len(api_result_suggestions) > self.max_search_results:
-            desc = actual_user_input + " (more than " + str(self.max_search_results) + " issues found, only showing the top issues)"
+        if len(issues) > len(shown):
+            next_skip = skip + len(shown)
+            desc = actual_user_input + " (issues " + str(skip + 1) + "–" + str(next_skip) + " shown, more found)"
+            suggestions.append(self.create_load_more_item(actual_user_input, next_skip))
+            if self.prefetcher is not None:
+                # the cache has the next page by the time the user asks for it
+                self.prefetch_next_page(actual_user_input, next_skip)
+        elif skip > 0:
+            desc = actual_user_input + " (issues " + str(skip + 1) + "–" + str(skip + len(api_result_suggestions)) + \
+                " of " + str(skip + len(api_result_suggestions)) + " shown)"
+        elif similar_suggestions:
+            desc = actual_user_input + " (no issues found, similar ones shown)"
         else:
             desc = actual_user_input + " (" + str(len(api_result_suggestions)) + " issues found)"
 
-        suggestions.insert(0, self.plugin.create_item(
+        suggestions.insert(0, self.create_issues_filter_item(actual_user_input, desc))
+
+    def create_load_more_item(self, actual_user_input: str, skip: int):
+        return self.plugin.create_item(
+            category=self.plugin.ITEMCAT_ISSUES,
+            label="Load more…",
+            short_desc="Show the issues after the first " + str(skip) + " of " + actual_user_input,
+            target=kpu.kwargs_encode(filter=actual_user_input, skip=skip),
+            args_hint=kp.ItemArgsHint.ACCEPTED,
+            hit_hint=kp.ItemHitHint.IGNORE,
+            icon_handle=self.plugin._icons[self.issues_icon],
+            loop_on_suggest=True,
+            data_bag=(kpu.kwargs_encode(url=self.api.create_issues_url(actual_user_input),
+                                        effective_value=actual_user_input.rstrip(), skip=skip)))
+
+    def create_issues_filter_item(self, actual_user_input: str, desc: str):
+        return self.plugin.create_item(
             category=self.plugin.ITEMCAT_ISSUES,
             label=actual_user_input,
             short_desc=desc,
@@ -185,22 +746,160 @@ class YouTrackServer():
             icon_handle=self.plugin._icons[self.issues_icon],
             loop_on_suggest=True,
             data_bag=(kpu.kwargs_encode(url=self.api.create_issues_url(actual_user_input),
-                                        effective_value=actual_user_input))))
+                                        effective_value=actual_user_input)))
 
-    def get_issues_matching_filter(self, actual_user_input):
-        issues = self.api.get_issues_matching_filter(actual_user_input)
-        suggestions = []
-        for issue in issues:
-            suggestions.append(self.plugin.create_item(
-                category=self.plugin.ITEMCAT_ISSUES,
-                label=issue.summary + " [" + issue.id + "]",
-                short_desc=
-                issue.id +
-                (" ▶ " + issue.description[:150] if issue.description is not None else ""),
-                target=issue.id,
-                args_hint=kp.ItemArgsHint.FORBIDDEN,
-                hit_hint=kp.ItemHitHint.NOARGS,
-                icon_handle=self.plugin._icons[self.issues_icon],
-                loop_on_suggest=False,
-                data_bag=(kpu.kwargs_encode(url=issue.url))))
-        return suggestions
+    def get_recent_suggestions(self, user_input: str, items_chain: Sequence):
+        """
+        Suggestions of the issues mode made up of project completions and recently opened issues only, available
+        without any request.
+        """
+        if not items_chain or self.get_current_suggestion_mode(items_chain) != SuggestionMode.Issues \
+                or self.get_skip(user_input, items_chain) > 0:
+            return []
+        actual_user_input, _ = self.get_actual_user_input(user_input, items_chain)
+        recent_suggestions = self.get_local_issue_suggestions(actual_user_input)
+        if not recent_suggestions:
+            return []
+        return [self.create_issues_filter_item(actual_user_input, actual_user_input + " (searching…)")] + \
+            recent_suggestions[:self.max_search_results]
+
+    def get_local_issue_suggestions(self, actual_user_input: str):
+        return self.get_project_completions(actual_user_input) + \
+            self.get_recent_issues_matching_filter(actual_user_input)
+
+    def get_recent_issues_matching_filter(self, actual_user_input: str):
+        if self.recent_issues is None:
+            return []
+        text = self.get_typed_text(actual_user_input)
+        # only plain words can be matched locally, the server has to evaluate the query language
+        if not is_free_text(text):
+            return []
+        issues = [self.api.ISSUE_TYPE(**entry) for entry in self.recent_issues.top(text, self.max_search_results)]
+        return [self.create_issue_item(issue, desc_prefix=self.RECENT_ISSUES_PREFIX) for issue in issues]
+
+    def record_opened_issue(self, id: str, summary: str, description: str, url: str):
+        if self.recent_issues is not None:
+            self.recent_issues.record(id, summary, description, url)
+        self.trigrams.add([self.api.ISSUE_TYPE(id=id, summary=summary, description=description, url=url)])
+
+    def create_issue_items(self, actual_user_input, issues: Sequence):
+        with self.stats.timed(ENDPOINT_SUGGEST, STAGE_ITEMS):
+            self.trigrams.add(issues)
+            text = self.get_typed_text(actual_user_input)
+            # only plain words can be compared locally, the server has to evaluate the query language
+            if is_free_text(text):
+                issues = self.trigrams.rank(text, issues)
+            return [self.create_issue_item(issue) for issue in issues]
+
+    def get_similar_issue_suggestions(self, actual_user_input: str, exclude_ids):
+        """
+        Issues seen before that are similar to the input, shown in case the server found none, e.g. due to a typo.
+        """
+        text = self.get_typed_text(actual_user_input)
+        if not is_free_text(text):
+            return []
+        issues = [issue for issue in self.trigrams.search(text, self.max_search_results) if issue.id not in exclude_ids]
+        return [self.create_issue_item(issue, desc_prefix=self.SIMILAR_ISSUES_PREFIX) for issue in issues]
+
+    def memoized_item(self, key, icon: str, create, *args, **kwargs):
+        """
+        Returns the item built before for the key and icon, or builds it with create(*args, **kwargs). The key has
+        to cover everything the item shows.
+        """
+        key = key + (self.plugin._icons[icon],)
+        item = self.items.get(key)
+        if item is None:
+            item = create(*args, **kwargs)
+            self.items.put(key, item, self.ITEMS_MEMO_TTL)
+        return item
+
+    def create_switch_item(self, previous_effective_value: str):
+        return self.plugin.create_item(
+            category=self.plugin.ITEMCAT_SWITCH,
+            label="Switch ⇆",
+            short_desc="Switch between filter suggestions and issue list",
+            target="switch",
+            args_hint=kp.ItemArgsHint.ACCEPTED,
+            hit_hint=kp.ItemHitHint.IGNORE,
+            icon_handle=self.plugin._icons[self.filter_icon],
+            loop_on_suggest=True,
+            data_bag=kpu.kwargs_encode(url=self.api.create_issues_url(previous_effective_value),
+                                       effective_value=previous_effective_value))
+
+    def create_open_filter_item(self, actual_user_input: str):
+        return self.plugin.create_item(
+            category=self.plugin.ITEMCAT_FILTER,
+            label=self.filter_label + "▶" + actual_user_input,
+            short_desc="Open",
+            target=actual_user_input,
+            args_hint=kp.ItemArgsHint.FORBIDDEN,
+            hit_hint=kp.ItemHitHint.KEEPALL,
+            icon_handle=self.plugin._icons[self.filter_icon],
+            loop_on_suggest=False,
+            data_bag=(kpu.kwargs_encode(url=self.api.create_issues_url(actual_user_input),
+                                        effective_value=actual_user_input)))
+
+    def create_filter_item(self, api_result_suggestion, effective_value: str, desc: str):
+        return self.plugin.create_item(
+            category=self.plugin.ITEMCAT_FILTER,
+            label=api_result_suggestion.full_option,
+            short_desc=desc,
+            target=kpu.kwargs_encode(server=self.name, label=api_result_suggestion.option),
+            args_hint=kp.ItemArgsHint.ACCEPTED,
+            hit_hint=kp.ItemHitHint.NOARGS,
+            icon_handle=self.plugin._icons[self.filter_icon],
+            loop_on_suggest=True,
+            data_bag=kpu.kwargs_encode(url=self.api.create_issues_url(effective_value), effective_value=effective_value))
+
+    def create_issue_item(self, issue, desc_prefix: str = ""):
+        description = issue.description if issue.description is not None \
+            else self.descriptions.get((issue.id, issue.updated))
+        description = description[:self.DESCRIPTION_LENGTH] if description is not None else None
+        return self.memoized_item(('issue', issue.id, issue.updated, issue.summary, description, desc_prefix),
+                                  self.issues_icon, self.build_issue_item, issue, description, desc_prefix)
+
+    def build_issue_item(self, issue, description, desc_prefix: str):
+        item = self.plugin.create_item(
+            category=self.plugin.ITEMCAT_ISSUES,
+            label=issue.summary + " [" + issue.id + "]",
+            short_desc=
+            desc_prefix + issue.id +
+            (" ▶ " + description if description is not None else ""),
+            target=issue.id,
+            args_hint=kp.ItemArgsHint.FORBIDDEN,
+            hit_hint=kp.ItemHitHint.NOARGS,
+            icon_handle=self.plugin._icons[self.issues_icon],
+            loop_on_suggest=False,
+            data_bag=(kpu.kwargs_encode(url=issue.url, server=self.key, id=issue.id, summary=issue.summary,
+                                        description=description, updated=issue.updated)))
+        if description is None:
+            self.undescribed.put(id(item), (item, issue, desc_prefix), self.ITEMS_MEMO_TTL)
+        return item
+
+    def hydrate_descriptions(self, suggestions: Sequence):
+        """
+        Fetches the descriptions missing from the issues of this server shown with one request and returns the
+        suggestions with them, None if none were missing.
+        """
+        if not self.api.LAZY_DESCRIPTIONS:
+            return None
+        missing = {}
+        for index, item in enumerate(suggestions):
+            entry = self.undescribed.get(id(item))
+            if entry is not None and entry[0] is item:
+                missing[index] = entry
+        if not missing:
+            return None
+        try:
+            descriptions = self.run_cancellable(self.api.get_descriptions,
+                                                [issue.id for _, issue, _ in missing.values()],
+                                                self.DESCRIPTION_LENGTH)
+        except urllib.error.HTTPError as exc:
+            self.dbg("descriptions not available: " + str(exc))
+            return None
+        hydrated = list(suggestions)
+        for index, (_, issue, desc_prefix) in missing.items():
+            self.descriptions.put((issue.id, issue.updated), descriptions.get(issue.id, ''), self.DESCRIPTIONS_TTL)
+            # built anew with the description just stored
+            hydrated[index] = self.create_issue_item(issue, desc_prefix=desc_prefix)
+        return hydrated